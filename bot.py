@@ -5,10 +5,21 @@ load_dotenv()
 import discord
 from discord.ext import commands
 from discord import app_commands
-import csv, io, json, logging, time
+from aiohttp import ClientError, web
+import asyncio, bisect, contextlib, contextvars, csv, functools, gzip, hashlib, heapq, inspect, io, itertools, json, logging, queue, random, sys, tempfile, threading, time
 import datetime
-from collections import Counter
+import multiprocessing
+from collections import Counter, OrderedDict, deque
+from collections.abc import Callable, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import uuid
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+try:
+    import numpy as np
+except ImportError:  # valfritt: utan NumPy räknas täckning i ren Python och byggaren hoppar över den
+    np = None
 
 # ----------------------------
 # Konfiguration och logging
@@ -16,11 +27,63 @@ import uuid
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Valfritt HTTP-API i botens process (0 = av). API_ONLY=1 kör bara API:t mot de lokala
+# datafilerna, utan Discord – bra för att testa dashboarden lokalt.
+API_PORT = int(os.getenv("API_PORT", "0"))
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_ONLY = os.getenv("API_ONLY", "0") == "1"
+# Live-ström (SSE): ändringar inom fönstret skickas som en batch; klienter med fler
+# väntande (ihopslagna) ändringar än gränsen, eller som inte hinner ta emot en skrivning, kopplas bort
+SSE_COALESCE_SECONDS = float(os.getenv("SSE_COALESCE_SECONDS", "0.25"))
+SSE_MAX_PENDING = int(os.getenv("SSE_MAX_PENDING", "1000"))
+SSE_WRITE_TIMEOUT = float(os.getenv("SSE_WRITE_TIMEOUT", "5"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# Historikexport: max storlek per bifogad fil (Discords gräns utan boost) – större exporter delas i flera filer
+EXPORT_FILE_LIMIT = int(os.getenv("EXPORT_FILE_LIMIT", str(8 * 1024 * 1024)))
+# Påminnelser: default-offsets före start, tidszon för starttider utan zon, och hur sent
+# en påminnelse som missats (t.ex. under omstart) fortfarande skickas
+REMINDER_OFFSETS = os.getenv("REMINDER_OFFSETS", "24h,1h,10m")
+EVENT_TIMEZONE = os.getenv("EVENT_TIMEZONE", "Europe/Stockholm")
+REMINDER_GRACE_SECONDS = int(os.getenv("REMINDER_GRACE_SECONDS", "600"))
+# DM-utskick: samtidiga sändningar, omförsök med backoff (sekunder), hur ofta förloppet
+# uppdateras, och hur länge en användare med stängda DMs hoppas över
+DM_FANOUT_CONCURRENCY = int(os.getenv("DM_FANOUT_CONCURRENCY", "4"))
+DM_FANOUT_RETRIES = int(os.getenv("DM_FANOUT_RETRIES", "3"))
+DM_FANOUT_BACKOFF = float(os.getenv("DM_FANOUT_BACKOFF", "1.0"))
+DM_PROGRESS_SECONDS = float(os.getenv("DM_PROGRESS_SECONDS", "3"))
+DM_CLOSED_RECHECK_DAYS = int(os.getenv("DM_CLOSED_RECHECK_DAYS", "14"))
+# Namncache: hur länge ett hämtat namn räknas som färskt, max antal namn i minnet,
+# ID:n per medlemsförfrågan (Discords gräns) och hur länge saknade namn samlas ihop
+MEMBER_NAME_TTL = float(os.getenv("MEMBER_NAME_TTL", str(6 * 3600)))
+MEMBER_NAME_CACHE_MAX = int(os.getenv("MEMBER_NAME_CACHE_MAX", "50000"))
+MEMBER_QUERY_CHUNK = 100
+MEMBER_NAME_BATCH_DELAY = float(os.getenv("MEMBER_NAME_BATCH_DELAY", "0.5"))
+
 TOKEN = os.getenv("DISCORD_TOKEN")
-if not TOKEN:
+if not TOKEN and not API_ONLY:
     raise ValueError("DISCORD_TOKEN saknas. Sätt den som miljövariabel.")
 
 AUTO_CLEAN_DAYS = int(os.getenv("AUTO_CLEAN_DAYS", "7"))
+# Logga handlers som tar längre tid än så här på sig att kvittera en interaktion
+ACK_WARN_SECONDS = float(os.getenv("ACK_WARN_SECONDS", "2.0"))
+# Loop-lag-monitor: mätintervall, när ett anrop räknas som blockerande, och hur många som visas
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+LOOP_TOP_N = int(os.getenv("LOOP_TOP_N", "10"))
+# Tracing per interaktion: andel som samplas (0 = av), fil och rotation
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "3"))
+# Antal processer för CPU-tungt arbete (squad-bygge, CSV-parsning); 0 = kör inline på loopen
+SQUAD_POOL_WORKERS = int(os.getenv("SQUAD_POOL_WORKERS", "1"))
+# Live squad-tavlor: samla ihop ändringar under så här många sekunder innan omritning
+SQUAD_BOARD_COALESCE_SECONDS = float(os.getenv("SQUAD_BOARD_COALESCE_SECONDS", "5"))
+# No-show-simulering: andel som uteblir utan historik, och antal scenarier per körning
+NO_SHOW_DEFAULT_RATE = float(os.getenv("NO_SHOW_DEFAULT_RATE", "0.15"))
+NO_SHOW_SCENARIOS = int(os.getenv("NO_SHOW_SCENARIOS", "5000"))
+# Sekundär sorteringsnyckel i squad-bygget efter tier: "fresh" (senast anmäld) eller "reliability" (pålitligast)
+RANK_TIEBREAKER = os.getenv("RANK_TIEBREAKER", "fresh")
 
 # GW2-klasser och roller
 CLASSES = [
@@ -41,15 +104,192 @@ WVW_ROLES_DISPLAY = [
 ]
 
 # --- Squad-regler & prompt-cooldown ---
-MAX_SQUADS = 10  # max 10 squads => 50 spelare
+MAX_SQUADS = 10  # default max squads per event (10 => 50 spelare)
+MAX_SQUADS_LIMIT = 30  # övre gräns för per-event max_squads
+MAX_WINGS = 5  # max antal Commanders/wings per event
 PROMPT_COOLDOWN_SECONDS = 30  # per-användare cooldown för roll-prompten
 last_prompt: dict[int, float] = {}  # user_id -> epoch sekunder
+_cpu_pool: ProcessPoolExecutor | None = None
+_analysis_cache: dict[tuple[str, str], tuple[tuple, object]] = {}  # (typ, event_id) -> (nyckel, värde)
+cache_stats: Counter = Counter()  # "<typ>_hit" / "<typ>_miss"
+
+# ----------------------------
+# Tracing (Chrome Trace Event-format)
+# ----------------------------
+class TraceWriter:
+    """
+    Skriver spans från en bakgrundstråd till en roterande fil.
+    Varje rad är ett komplett event följt av komma, vilket gör filen till
+    Chromes "JSON Array Format" (avslutande ] är valfri) – den kan öppnas direkt
+    i Perfetto/chrome://tracing och samtidigt läsas rad för rad.
+    """
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def emit(self, event: dict):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+            self._thread.start()
+        self._queue.put(event)
+
+    def _open(self):
+        f = open(self.path, "a", encoding="utf-8")
+        if f.tell() == 0:
+            f.write("[\n")
+        return f
+
+    def _rotate(self, f):
+        f.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        return self._open()
+
+    def _run(self):
+        f = None
+        while True:
+            event = self._queue.get()
+            try:
+                if f is None:
+                    f = self._open()
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + ",\n")
+                if self._queue.empty():
+                    f.flush()
+                    if f.tell() >= self.max_bytes:
+                        f = self._rotate(f)
+            except Exception as e:
+                logger.error(f"Fel vid skrivning av trace: {e}")
+                f = None
+
+class _Trace:
+    __slots__ = ("trace_id", "tid", "attrs", "root_span")
+
+    def __init__(self, attrs: dict):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.tid = int(self.trace_id[:8], 16)  # eget spår per interaktion i viewern
+        self.attrs = attrs
+        self.root_span: int | None = None
+
+trace_writer = TraceWriter(TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUPS)
+_current_trace: contextvars.ContextVar[_Trace | None] = contextvars.ContextVar("livia_trace", default=None)
+_current_span: contextvars.ContextVar[int | None] = contextvars.ContextVar("livia_span", default=None)
+_span_ids = itertools.count(1)
+_open_traces: dict[int, _Trace] = {}  # interaction_id -> trace, tills kvittensen registrerats
+
+def _emit_span(trace: _Trace, name: str, span_id: int, parent_id: int | None, start: float, duration: float, attrs: dict):
+    trace_writer.emit({
+        "name": name,
+        "cat": "livia",
+        "ph": "X",
+        "ts": int(start * 1_000_000),
+        "dur": max(1, int(duration * 1_000_000)),
+        "pid": os.getpid(),
+        "tid": trace.tid,
+        "args": {**trace.attrs, **attrs, "trace_id": trace.trace_id, "span_id": span_id, "parent_id": parent_id},
+    })
+
+@contextlib.contextmanager
+def trace_span(name: str, **attrs):
+    """Spela in ett span under aktuell trace. Gör ingenting om interaktionen inte samplas."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = next(_span_ids)
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start, t0 = time.time(), time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+        _emit_span(trace, name, span_id, parent_id, start, time.perf_counter() - t0, attrs)
+
+def traced(func):
+    """Dekorator: kör funktionen (sync eller async) i ett span med funktionens namn."""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with trace_span(func.__name__):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with trace_span(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+def annotate_trace(**attrs):
+    """Lägg till attribut (t.ex. event_id) på aktuell trace; ärvs av alla efterföljande spans."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attrs.update({k: v for k, v in attrs.items() if v is not None})
+
+def traced_interaction(func):
+    """
+    Dekorator för komponent-callbacks och slash-kommandon: samplar interaktionen
+    enligt TRACE_SAMPLE_RATE och öppnar en trace med ett rot-span. Efterarbete som
+    startas med run_after_ack ärver tracen, så hela förloppet hamnar i samma träd.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        interaction = next((a for a in args if isinstance(a, discord.Interaction)), None)
+        if interaction is None or TRACE_SAMPLE_RATE <= 0 or random.random() >= TRACE_SAMPLE_RATE:
+            return await func(*args, **kwargs)
+
+        attrs = {"interaction": interaction_label(interaction), "user_id": interaction.user.id}
+        event_id = getattr(args[0], "event_id", None) if args else None
+        event_id = event_id or kwargs.get("event_id")
+        if event_id:
+            attrs["event_id"] = event_id
+        trace = _Trace(attrs)
+        trace.root_span = next(_span_ids)
+        _open_traces[interaction.id] = trace
+
+        token = _current_trace.set(trace)
+        span_token = _current_span.set(trace.root_span)
+        start, t0 = time.time(), time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _current_span.reset(span_token)
+            _current_trace.reset(token)
+            _emit_span(trace, func.__qualname__, trace.root_span, None, start, time.perf_counter() - t0, {})
+    return wrapper
 
 # ----------------------------
-# Squad Templates (kvar för kompatibilitet)
+# Squad Templates
 # ----------------------------
+# Varje slot: {"name", "count", "allowed_roles", "preferred_roles"?}. Slots fylls i ordning;
+# preferred_roles provas före resten av allowed_roles. Den globala Commandern ersätter
+# slot nr "commander_slot" (default 0) i första squaden.
 SQUAD_TEMPLATES_FILE = "squad_templates.json"
+DEFAULT_SQUAD_TEMPLATE = "balanced"
+BUILTIN_SQUAD_TEMPLATES = {
+    "balanced": {
+        "name": "Balanserad (Primary/Secondary/Tertiary + 2 DPS)",
+        "commander_slot": 0,
+        "slots": [
+            {"name": "Primary Support", "count": 1, "allowed_roles": ["Primary Support"]},
+            {"name": "Secondary Support", "count": 1, "allowed_roles": ["Secondary Support"]},
+            {"name": "Tertiary/Flex", "count": 1, "preferred_roles": ["Tertiary Support"],
+             "allowed_roles": ["Tertiary Support", "Strip DPS", "DPS", "Utility"]},
+            {"name": "DPS", "count": 2, "allowed_roles": ["Strip DPS", "DPS"]},
+        ],
+    },
+}
 squad_templates = {
+    **BUILTIN_SQUAD_TEMPLATES,
     "standard": {
         "name": "Standard 2-2-1 Squad",
         "slots": [
@@ -87,11 +327,14 @@ def load_squad_templates():
     if os.path.exists(SQUAD_TEMPLATES_FILE):
         try:
             with open(SQUAD_TEMPLATES_FILE, "r") as f:
-                squad_templates = json.load(f)
+                squad_templates = {**BUILTIN_SQUAD_TEMPLATES, **json.load(f)}
         except:
             pass
+    _compiled_templates.clear()
 
+@traced
 def save_squad_templates():
+    _compiled_templates.clear()
     try:
         with open(SQUAD_TEMPLATES_FILE, "w") as f:
             json.dump(squad_templates, f, indent=2)
@@ -115,6 +358,7 @@ def load_custom_roles():
     else:
         custom_roles = {}
 
+@traced
 def save_custom_roles():
     try:
         with open(CUSTOM_ROLES_FILE, "w", encoding="utf-8") as f:
@@ -201,6 +445,79 @@ ELITE_SPECS_BASE = {
     },
 }
 
+# Kapacitet per spec (0–3): boons, cleanse, strips m.m. Saknas en spec/kapacitet räknas den som 0.
+# Kan skrivas över per spec via meta_overrides[klass][spec]["caps"] (Capabilities-kolumnen i meta-CSV:n).
+CAPABILITIES = [
+    "stability", "aegis", "protection", "resistance", "quickness", "alacrity",
+    "might", "superspeed", "cleanse", "heal", "barrier", "strip",
+]
+CAPABILITY_MAX_LEVEL = 3
+SPEC_CAPABILITIES_BASE = {
+    "Guardian": {
+        "Core": {"aegis": 1, "stability": 1},
+        "Dragonhunter": {"aegis": 1},
+        "Firebrand": {"stability": 3, "aegis": 3, "quickness": 2, "resistance": 1, "heal": 2, "cleanse": 1, "might": 1},
+        "Willbender": {"aegis": 1, "superspeed": 1},
+        "Luminary": {"stability": 2, "aegis": 2, "heal": 2, "protection": 1},
+    },
+    "Warrior": {
+        "Core": {"might": 1},
+        "Berserker": {"might": 1},
+        "Spellbreaker": {"strip": 3, "stability": 1, "might": 1},
+        "Bladesworn": {"might": 1},
+        "Paragon": {"might": 2, "stability": 1, "resistance": 1},
+    },
+    "Revenant": {
+        "Core": {"might": 1},
+        "Herald": {"protection": 2, "might": 2, "quickness": 1, "resistance": 1},
+        "Renegade": {"alacrity": 2, "might": 2},
+        "Vindicator": {"protection": 1},
+        "Conduit": {"protection": 1, "resistance": 1},
+    },
+    "Engineer": {
+        "Core": {"might": 1},
+        "Scrapper": {"superspeed": 3, "cleanse": 2, "heal": 2, "barrier": 2, "stability": 1},
+        "Holosmith": {"might": 1},
+        "Mechanist": {"alacrity": 1, "might": 1},
+        "Amalgam": {"might": 1},
+    },
+    "Ranger": {
+        "Core": {"might": 1},
+        "Druid": {"heal": 3, "cleanse": 2, "might": 1},
+        "Soulbeast": {"might": 2},
+        "Untamed": {"might": 1},
+        "Galeshot": {"might": 1},
+    },
+    "Thief": {
+        "Core": {"strip": 1},
+        "Daredevil": {"strip": 1},
+        "Deadeye": {"strip": 2},
+        "Specter": {"barrier": 3, "heal": 2, "alacrity": 1},
+        "Antiquary": {"strip": 1},
+    },
+    "Elementalist": {
+        "Core": {"might": 1, "heal": 1},
+        "Tempest": {"cleanse": 3, "heal": 3, "protection": 2, "might": 1},
+        "Weaver": {"might": 1},
+        "Catalyst": {"might": 2, "protection": 1, "quickness": 1},
+        "Evoker": {"might": 1},
+    },
+    "Mesmer": {
+        "Core": {"strip": 1},
+        "Chronomancer": {"stability": 2, "quickness": 3, "alacrity": 2, "strip": 1},
+        "Mirage": {"strip": 1},
+        "Virtuoso": {"strip": 1},
+        "Troubadour": {"might": 1, "heal": 1},
+    },
+    "Necromancer": {
+        "Core": {"strip": 1},
+        "Reaper": {"strip": 1},
+        "Scourge": {"strip": 3, "barrier": 2},
+        "Harbinger": {"quickness": 1, "strip": 1},
+        "Ritualist": {"strip": 2},
+    },
+}
+
 META_FILE = "meta_overrides.json"
 meta_overrides = {}
 
@@ -213,6 +530,7 @@ def load_meta_overrides():
         except:
             meta_overrides = {}
 
+@traced
 def save_meta_overrides():
     try:
         with open(META_FILE, "w") as f:
@@ -244,6 +562,86 @@ def best_specs_for_role(role: str, limit: int = 2) -> list[str]:
         out.append(f"{klass} - {spec}")
     return out
 
+# ----------------------------
+# Kapacitetsmatris & squad-täckning
+# ----------------------------
+# Vad en squad bör ha summerat per kapacitet, och hur mycket en brist väger
+SQUAD_COVERAGE_TARGETS = {
+    "stability": 3, "aegis": 1, "protection": 2, "resistance": 1, "quickness": 2, "alacrity": 1,
+    "might": 2, "superspeed": 1, "cleanse": 3, "heal": 3, "barrier": 1, "strip": 2,
+}
+SQUAD_COVERAGE_WEIGHTS = {"stability": 3, "cleanse": 2, "heal": 2, "strip": 2}  # övriga väger 1
+COVERAGE_CANDIDATES = 8  # max kandidater (samma tier) som jämförs per slot i byggaren
+
+def get_spec_capabilities(klass, spec) -> dict[str, int]:
+    base = (SPEC_CAPABILITIES_BASE.get(klass, {}) or {}).get(spec, {})
+    override = ((meta_overrides.get(klass, {}) or {}).get(spec, {}) or {}).get("caps")
+    caps = override if override is not None else base
+    return {c: int(v) for c, v in caps.items() if c in CAPABILITIES}
+
+_capability_cache: tuple | None = None  # (meta_version, {(klass, spec): rad}, matris)
+
+def capability_matrix():
+    """
+    ({(klass, spec): radindex}, matris[n_specs + 1, n_caps]). Sista raden är nollor
+    (okänd spec / padding). NumPy-array om NumPy finns, annars listor. Cachad per meta-version.
+    """
+    global _capability_cache
+    if _capability_cache is None or _capability_cache[0] != meta_version:
+        index, rows = {}, []
+        for klass, specs in ELITE_SPECS_BASE.items():
+            for spec in specs:
+                caps = get_spec_capabilities(klass, spec)
+                index[(klass, spec)] = len(rows)
+                rows.append([caps.get(c, 0) for c in CAPABILITIES])
+        rows.append([0] * len(CAPABILITIES))
+        matrix = np.array(rows, dtype=np.float32) if np is not None else rows
+        _capability_cache = (meta_version, index, matrix)
+    return _capability_cache[1], _capability_cache[2]
+
+def capability_row(data: dict) -> int:
+    index, matrix = capability_matrix()
+    return index.get((data.get("class"), data.get("elite_spec")), len(matrix) - 1)
+
+def coverage_payload() -> dict:
+    """Serialiserbar täckningsdata (för byggaren i CPU-poolen)."""
+    _, matrix = capability_matrix()
+    return {
+        "matrix": matrix,
+        "targets": [SQUAD_COVERAGE_TARGETS.get(c, 1) for c in CAPABILITIES],
+        "weights": [SQUAD_COVERAGE_WEIGHTS.get(c, 1) for c in CAPABILITIES],
+    }
+
+def score_coverage(coverage: dict, squads_rows: list[list[int]]) -> tuple[list[float], list[list[str]]]:
+    """
+    Täckning för många squads i ett svep. squads_rows = kapacitetsrader per squad.
+    Returnerar (poäng 0–100 per squad, saknade kapaciteter per squad).
+    """
+    matrix, targets, weights = coverage["matrix"], coverage["targets"], coverage["weights"]
+    if not squads_rows:
+        return [], []
+    if np is not None:
+        pad = len(matrix) - 1
+        width = max(len(rows) for rows in squads_rows)
+        idx = np.array([rows + [pad] * (width - len(rows)) for rows in squads_rows], dtype=np.intp)
+        totals = matrix[idx].sum(axis=1)                                  # [squads, caps]
+        t = np.asarray(targets, dtype=np.float32)
+        w = np.asarray(weights, dtype=np.float32)
+        scores = (np.minimum(totals, t) / t) @ w / w.sum() * 100
+        missing = totals < t
+        return scores.tolist(), [[CAPABILITIES[c] for c in np.flatnonzero(row)] for row in missing]
+
+    scores, gaps = [], []
+    for rows in squads_rows:
+        totals = [sum(matrix[r][c] for r in rows) for c in range(len(CAPABILITIES))]
+        scores.append(sum(min(v, t) / t * w for v, t, w in zip(totals, targets, weights)) / sum(weights) * 100)
+        gaps.append([CAPABILITIES[c] for c, (v, t) in enumerate(zip(totals, targets)) if v < t])
+    return scores, gaps
+
+def squad_coverage(squads: list[list[tuple[str, int, dict]]]) -> tuple[list[float], list[list[str]]]:
+    """Täckning för hydrerade squads (build_squads_balanced-format)."""
+    return score_coverage(coverage_payload(), [[capability_row(data) for _, _, data in squad] for squad in squads])
+
 # ----------------------------
 # Tidshjälp
 # ----------------------------
@@ -269,23 +667,42 @@ def parse_iso(dt_str: str) -> datetime.datetime:
 DATA_FILE = "rsvp_data.json"
 SUMMARY_CHANNELS_FILE = "summary_channels.json"
 WVW_DATA_FILE = "wvw_rsvp_data.json"
+WVW_CHANGELOG_FILE = os.getenv("WVW_CHANGELOG_FILE", "wvw_rsvp_changes.log")
+WVW_LOG_COMPACT_EVERY = int(os.getenv("WVW_LOG_COMPACT_EVERY", "500"))  # loggrader innan en ny snapshot skrivs
 WVW_SUMMARY_CHANNELS_FILE = "wvw_summary_channels.json"
 WVW_EVENT_NAMES_FILE = "wvw_event_names.json"
+WVW_SQUAD_BOARDS_FILE = "wvw_squad_boards.json"
+WVW_SQUAD_ASSIGNMENTS_FILE = "wvw_squad_assignments.json"
+WVW_EVENT_SETTINGS_FILE = "wvw_event_settings.json"
 
 EVENT_HISTORY_FILE = "event_history.json"
 WVW_EVENT_HISTORY_FILE = "wvw_event_history.json"
+PLAYER_STATS_FILE = "player_stats.json"
+LEADERBOARDS_FILE = "leaderboards.json"
+REMINDERS_FILE = "reminders.json"
+PLAYER_PROFILES_FILE = "player_profiles.json"
+DM_STATUS_FILE = "dm_status.json"
+MEMBER_NAMES_FILE = "member_names.json"
 
 rsvp_data: dict[int, dict] = {}
 event_name: str = "Event"
 event_summary_channels: dict[str, int] = {}  # channel_id -> message_id
 
 # WvW data - event_id baserat
-wvw_rsvp_data: dict[str, dict[int, dict]] = {}  # {event_id: {user_id: {...}}}
+wvw_rsvp_data: dict[str, "Roster"] = {}  # {event_id: Roster {user_id: {...}}} – oföränderliga versioner
 wvw_summary_channels: dict[str, dict] = {}  # {channel_id_eventid: {"message_id": int, "event_id": str}}
 wvw_event_names: dict[str, str] = {}  # {event_id: name}
+wvw_squad_boards: dict[str, dict] = {}  # {channel_id_eventid: {"message_id": int, "event_id": str}} – live squad-tavlor
+wvw_event_settings: dict[str, dict] = {}  # {event_id: {"max_squads": int, "wings": int, "balance": bool}}
+wvw_squad_assignments: dict[str, dict] = {}  # {event_id: {"commander": uid, "squads": [{"kind": str, "slots": [uid|None]}], "moved": int}}
 
 event_history: list[dict] = []
 wvw_event_history: dict[str, list[dict]] = {}  # {event_id: [history_entries]}
+player_stats: dict[int, dict] = {}  # {user_id: {...}} – index över historiken, uppdateras vid arkivering
+event_reminders: dict[str, dict] = {}  # {"event" | "wvw:<event_id>": {"name", "start", "offsets": [s], "sent": [s]}}
+player_profiles: dict[int, dict] = {}  # {user_id: {"class", "elite_spec", "wvw_role", "updated_at"}} – senaste bygget
+dm_channels: dict[int, int] = {}  # {user_id: dm_channel_id}
+dm_closed: dict[int, str] = {}  # {user_id: iso-tid då DM senast nekades (50007)}
 
 def load_rsvp_data():
     global rsvp_data
@@ -302,9 +719,9 @@ def load_rsvp_data():
                             "attending": v.get("attending", False),
                             "class": v.get("class"),
                             "role": v.get("role"),
-                            "display_name": v.get("display_name", f"User_{uid}"),
                             "updated_at": v.get("updated_at", now_utc_iso()),
                         }
+                        member_names.seed(uid, v.get("display_name"))  # äldre filer sparade namnet per post
                         rsvp_data[uid]["updated_at"] = parse_iso(rsvp_data[uid]["updated_at"]).isoformat()
                 except (ValueError, TypeError):
                     continue
@@ -314,6 +731,7 @@ def load_rsvp_data():
     else:
         rsvp_data = {}
 
+@traced
 def save_rsvp_data():
     for v in rsvp_data.values():
         if not v.get("updated_at"):
@@ -325,7 +743,7 @@ def save_rsvp_data():
         logger.error(f"Fel vid sparande av RSVP-data: {e}")
 
 def load_summary_channels():
-    global event_summary_channels, wvw_summary_channels, wvw_event_names
+    global event_summary_channels, wvw_summary_channels, wvw_event_names, wvw_squad_boards
     # Ladda event kanaler
     if os.path.exists(SUMMARY_CHANNELS_FILE):
         try:
@@ -354,6 +772,17 @@ def load_summary_channels():
         except:
             wvw_event_names = {}
 
+    # Ladda squad-tavlor
+    if os.path.exists(WVW_SQUAD_BOARDS_FILE):
+        try:
+            with open(WVW_SQUAD_BOARDS_FILE, "r") as f:
+                wvw_squad_boards = json.load(f)
+        except:
+            wvw_squad_boards = {}
+    else:
+        wvw_squad_boards = {}
+
+@traced
 def save_summary_channels():
     try:
         with open(SUMMARY_CHANNELS_FILE, "w") as f:
@@ -362,40 +791,62 @@ def save_summary_channels():
             json.dump(wvw_summary_channels, f)
         with open(WVW_EVENT_NAMES_FILE, "w") as f:
             json.dump(wvw_event_names, f)
+        with open(WVW_SQUAD_BOARDS_FILE, "w") as f:
+            json.dump(wvw_squad_boards, f)
     except Exception as e:
         logger.error(f"Fel vid sparande av kanaldata: {e}")
 
 # WvW data
 def load_wvw_rsvp_data():
-    global wvw_rsvp_data, wvw_event_history
+    global wvw_rsvp_data, wvw_event_history, wvw_squad_assignments, wvw_event_settings
     if os.path.exists(WVW_DATA_FILE):
         try:
             with open(WVW_DATA_FILE, "r") as f:
                 loaded = json.load(f)
             wvw_rsvp_data = {}
             for event_id, event_data in loaded.items():
-                wvw_rsvp_data[event_id] = {}
+                records = {}
                 for k, v in event_data.items():
                     try:
                         uid = int(k)
                         if isinstance(v, dict):
-                            wvw_rsvp_data[event_id][uid] = {
+                            records[uid] = {
                                 "attending": v.get("attending", False),
                                 "class": v.get("class"),
                                 "elite_spec": v.get("elite_spec"),
                                 "wvw_role": v.get("wvw_role"),
-                                "display_name": v.get("display_name", f"User_{uid}"),
                                 "updated_at": v.get("updated_at", now_utc_iso()),
                             }
-                            wvw_rsvp_data[event_id][uid]["updated_at"] = parse_iso(wvw_rsvp_data[event_id][uid]["updated_at"]).isoformat()
+                            member_names.seed(uid, v.get("display_name"))
+                            records[uid]["updated_at"] = parse_iso(records[uid]["updated_at"]).isoformat()
                     except (ValueError, TypeError):
                         continue
+                wvw_rsvp_data[event_id] = Roster.from_dict(records)
         except Exception as e:
             logger.error(f"Fel vid laddning av WvW RSVP-data: {e}")
             wvw_rsvp_data = {}
     else:
         wvw_rsvp_data = {}
-        
+
+    # Ladda stabila squad-indelningar (bara för aktiva events)
+    wvw_squad_assignments = {}
+    if os.path.exists(WVW_SQUAD_ASSIGNMENTS_FILE):
+        try:
+            with open(WVW_SQUAD_ASSIGNMENTS_FILE, "r") as f:
+                loaded = json.load(f)
+            wvw_squad_assignments = {eid: a for eid, a in loaded.items() if eid in wvw_rsvp_data}
+        except Exception as e:
+            logger.error(f"Fel vid laddning av squad-indelningar: {e}")
+
+    wvw_event_settings = {}
+    if os.path.exists(WVW_EVENT_SETTINGS_FILE):
+        try:
+            with open(WVW_EVENT_SETTINGS_FILE, "r") as f:
+                wvw_event_settings = json.load(f)
+        except Exception as e:
+            logger.error(f"Fel vid laddning av event-inställningar: {e}")
+    rebuild_wvw_event_index()
+
     # Ladda WvW event historik
     if os.path.exists(WVW_EVENT_HISTORY_FILE):
         try:
@@ -407,17 +858,186 @@ def load_wvw_rsvp_data():
     else:
         wvw_event_history = {}
 
-def save_wvw_rsvp_data():
-    # Spara tidsstämplar
-    for event_data in wvw_rsvp_data.values():
-        for v in event_data.values():
-            if not v.get("updated_at"):
-                v["updated_at"] = now_utc_iso()
+def _write_text_atomic(path: str, text: str):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+@traced
+def save_wvw_rsvp_data(force: bool = False):
+    """
+    Varje mutation ligger redan i ändringsloggen, så en full snapshot skrivs bara
+    när loggen vuxit till WVW_LOG_COMPACT_EVERY rader (eller med force=True).
+    Rostrarna fångas som referenser till sina nuvarande versioner och serialiseras
+    i loggtråden; de små mutabla tabellerna serialiseras här.
+    """
+    if not force and change_log.since_compaction < WVW_LOG_COMPACT_EVERY:
+        return
+    rosters = dict(wvw_rsvp_data)
     try:
-        with open(WVW_DATA_FILE, "w") as f:
-            json.dump(wvw_rsvp_data, f)
+        files = [
+            (WVW_DATA_FILE, lambda: json.dumps({eid: roster.to_dict() for eid, roster in rosters.items()})),
+            (WVW_SQUAD_ASSIGNMENTS_FILE, json.dumps(wvw_squad_assignments)),
+            (WVW_EVENT_SETTINGS_FILE, json.dumps(wvw_event_settings)),
+            (WVW_EVENT_NAMES_FILE, json.dumps(wvw_event_names)),
+            (PLAYER_PROFILES_FILE, json.dumps(player_profiles)),
+        ]
     except Exception as e:
         logger.error(f"Fel vid sparande av WvW RSVP-data: {e}")
+        return
+    change_log.snapshot(files)
+
+# ----------------------------
+# Ändringslogg för WvW-RSVP
+# ----------------------------
+class RsvpChangeLog:
+    """
+    Append-only-logg med en JSON-rad per WvW-mutation. En bakgrundstråd skriver
+    allt som köats sedan förra varvet och gör en enda fsync per batch. Snapshots
+    från save_wvw_rsvp_data() skrivs av samma tråd i köordning, och loggen börjar
+    om först när snapshoten ligger på disk; vid start laddas snapshoten och
+    loggens svans spelas upp genom samma mutationsfunktioner.
+    Uppspelningen är idempotent (alla operationer skriver över), så rader som
+    redan finns i snapshoten skadar inte. Med read_only (API_ONLY) läses loggen
+    bara vid start – filen ägs av botens process.
+    """
+    _STOP = object()
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self.replaying = False
+        self.since_compaction = 0
+        self.fsyncs = 0
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rsvp-changelog", daemon=True)
+            self._thread.start()
+
+    def append(self, entry: dict):
+        if self.replaying or self.read_only:
+            return
+        self._ensure_thread()
+        self.since_compaction += 1
+        self._queue.put(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+
+    def snapshot(self, files: list[tuple[str, str | Callable[[], str]]]):
+        """
+        Skriv [(sökväg, text eller funktion som ger text)] atomiskt och börja sedan om
+        loggen – snapshoten innehåller allt som köats hittills.
+        """
+        if self.read_only:
+            return
+        self._ensure_thread()
+        self.since_compaction = 0
+        self._queue.put(files)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def _run(self):
+        f = open(self.path, "a", encoding="utf-8")
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                dirty = False
+                for item in batch:
+                    if isinstance(item, list):
+                        if dirty:
+                            f.flush()
+                        if self._write_snapshot(item):
+                            f.close()
+                            f = open(self.path, "w", encoding="utf-8")
+                            dirty = False
+                    elif item is self._STOP:
+                        if dirty:
+                            f.flush()
+                            os.fsync(f.fileno())
+                        return
+                    else:
+                        f.write(item + "\n")
+                        dirty = True
+                if dirty:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self.fsyncs += 1
+        except Exception as e:
+            logger.error(f"Fel i ändringsloggen för WvW-RSVP: {e}")
+        finally:
+            f.close()
+
+    @staticmethod
+    def _write_snapshot(files) -> bool:
+        try:
+            for path, payload in files:
+                _write_text_atomic(path, payload() if callable(payload) else payload)
+            return True
+        except Exception as e:
+            logger.error(f"Fel vid sparande av WvW RSVP-data: {e}")  # loggen behålls tills nästa snapshot
+            return False
+
+    def replay(self) -> int:
+        """Spela upp loggen ovanpå den laddade snapshoten. Returnerar antal rader."""
+        if not os.path.exists(self.path):
+            return 0
+        applied = 0
+        self.replaying = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logger.warning("Hoppar över trasig rad i ändringsloggen (avbruten skrivning).")
+                        continue
+                    _apply_change_entry(entry)
+                    applied += 1
+        finally:
+            self.replaying = False
+        return applied
+
+change_log = RsvpChangeLog(WVW_CHANGELOG_FILE, read_only=API_ONLY)
+
+def _apply_change_entry(entry: dict):
+    op, event_id = entry["op"], entry["e"]
+    if op == "set":
+        record = dict(entry["r"])
+        member_names.seed(int(entry["u"]), record.pop("display_name", None))  # loggar från före namncachen
+        set_wvw_rsvp(event_id, int(entry["u"]), record)
+    elif op == "del":
+        delete_wvw_rsvp(event_id, int(entry["u"]), change=entry.get("c", "cancel"))
+    elif op == "reset":
+        reset_wvw_event(event_id)
+    elif op == "create":
+        create_wvw_event(event_id, entry["n"])
+    elif op == "remove":
+        remove_wvw_event(event_id, change=entry.get("c", "removed"))
+    elif op == "settings":
+        set_wvw_event_settings(event_id, **entry["s"])
+    elif op == "assign":
+        wvw_squad_assignments[event_id] = entry["a"]
+        _assignment_state_cache.pop(event_id, None)
+
+def replay_wvw_change_log():
+    """Körs sist i load_all_data (mutationerna behöver meta, templates och profiler)."""
+    applied = change_log.replay()
+    if applied:
+        logger.info(f"Spelade upp {applied} ändringar från {WVW_CHANGELOG_FILE}.")
+        save_wvw_rsvp_data(force=True)  # no-op i API_ONLY (loggen är read_only)
 
 # ----- Historikloaders -----
 def load_event_history():
@@ -445,6 +1065,7 @@ def load_wvw_event_history():
         wvw_event_history = {}
 
 # ----- Historik-archivers -----
+@traced
 def archive_current_event(closed_by: int | None = None):
     """Spara en snapshot av nuvarande legacy-event till historikfil."""
     global event_history
@@ -462,7 +1083,7 @@ def archive_current_event(closed_by: int | None = None):
         snapshot["entries"].append(
             {
                 "user_id": uid,
-                "display_name": d.get("display_name"),
+                "display_name": member_names.get(uid),
                 "attending": d.get("attending", False),
                 "class": d.get("class"),
                 "role": d.get("role"),
@@ -476,7 +1097,9 @@ def archive_current_event(closed_by: int | None = None):
             json.dump(event_history, f, ensure_ascii=False, indent=2)
     except Exception as e:
         logger.error(f"Fel vid sparande av event-historik: {e}")
+    record_snapshot_stats(snapshot, wvw=False)
 
+@traced
 def archive_current_wvw_event(event_id: str, closed_by: int | None = None):
     """Spara en snapshot av ett specifikt WvW-event till historikfil."""
     global wvw_event_history
@@ -497,7 +1120,7 @@ def archive_current_wvw_event(event_id: str, closed_by: int | None = None):
         snapshot["entries"].append(
             {
                 "user_id": uid,
-                "display_name": d.get("display_name"),
+                "display_name": member_names.get(uid),
                 "attending": d.get("attending", False),
                 "class": d.get("class"),
                 "elite_spec": d.get("elite_spec"),
@@ -515,6 +1138,680 @@ def archive_current_wvw_event(event_id: str, closed_by: int | None = None):
             json.dump(wvw_event_history, f, ensure_ascii=False, indent=2)
     except Exception as e:
         logger.error(f"Fel vid sparande av WvW-event-historik: {e}")
+    record_snapshot_stats(snapshot, wvw=True)
+
+# ----------------------------
+# Spelarindex (uppdateras inkrementellt vid varje arkivering)
+# ----------------------------
+RELIABILITY_PRIOR_WEIGHT = 2  # hur många arkiverade events default-takten väger som
+
+def _new_player_stats() -> dict:
+    return {
+        "signups": 0, "attended": 0,            # alla arkiverade events med en post för spelaren
+        "wvw_signups": 0, "wvw_attended": 0,    # bara WvW-events
+        "streak": 0, "best_streak": 0,          # attending i rad (bland events där spelaren svarat)
+        "last_class": None, "last_spec": None, "last_role": None,
+        "last_event": None, "last_event_at": None, "display_name": None,
+    }
+
+def _record_snapshot_entries(snapshot: dict, wvw: bool):
+    for entry in snapshot.get("entries", []):
+        stats = player_stats.setdefault(int(entry["user_id"]), _new_player_stats())
+        attended = bool(entry.get("attending"))
+        stats["signups"] += 1
+        stats["attended"] += attended
+        if wvw:
+            stats["wvw_signups"] += 1
+            stats["wvw_attended"] += attended
+        if attended:
+            stats["streak"] += 1
+            stats["best_streak"] = max(stats["best_streak"], stats["streak"])
+            stats["last_event"] = snapshot.get("name")
+            stats["last_event_at"] = snapshot.get("closed_at")
+        else:
+            stats["streak"] = 0
+        if entry.get("class"):
+            stats["last_class"] = entry["class"]
+            stats["last_spec"] = entry.get("elite_spec")
+        role = entry.get("wvw_role") or entry.get("role")
+        if role:
+            stats["last_role"] = role
+        if entry.get("display_name"):
+            stats["display_name"] = entry["display_name"]
+
+def record_snapshot_stats(snapshot: dict, wvw: bool):
+    """Lägg in en nyss arkiverad snapshot i spelarindexet och topplistorna och spara dem."""
+    _record_snapshot_entries(snapshot, wvw)
+    save_player_stats()
+    _record_leaderboard_entries(snapshot, wvw)
+    save_leaderboards()
+    if RANK_TIEBREAKER == "reliability":
+        mark_meta_changed()  # rankningen beror på indexet
+
+def rebuild_player_stats():
+    """Bygg indexet från hela historiken (bara när indexfilen saknas)."""
+    player_stats.clear()
+    snapshots = [(s, False) for s in event_history]
+    snapshots += [(s, True) for history in wvw_event_history.values() for s in history]
+    snapshots.sort(key=lambda t: t[0].get("closed_at") or "")
+    for snapshot, wvw in snapshots:
+        _record_snapshot_entries(snapshot, wvw)
+
+def load_player_stats():
+    global player_stats
+    if os.path.exists(PLAYER_STATS_FILE):
+        try:
+            with open(PLAYER_STATS_FILE, "r", encoding="utf-8") as f:
+                player_stats = {int(uid): {**_new_player_stats(), **v} for uid, v in json.load(f).items()}
+            return
+        except Exception as e:
+            logger.error(f"Fel vid laddning av spelarindex: {e}")
+    rebuild_player_stats()
+    if player_stats:
+        save_player_stats()
+
+@traced
+def save_player_stats():
+    try:
+        with open(PLAYER_STATS_FILE, "w", encoding="utf-8") as f:
+            json.dump(player_stats, f, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Fel vid sparande av spelarindex: {e}")
+
+# ----------------------------
+# Spelarprofiler (senaste klass/spec/roll, överlever events och historik)
+# ----------------------------
+def remember_build(uid: int, record: dict):
+    """Kom ihåg spelarens bygge om posten är en komplett WvW-anmälan."""
+    if record.get("attending") and record.get("class") and record.get("elite_spec") and record.get("wvw_role"):
+        player_profiles[uid] = {
+            "class": record["class"],
+            "elite_spec": record["elite_spec"],
+            "wvw_role": record["wvw_role"],
+            "updated_at": record.get("updated_at") or now_utc_iso(),
+        }
+
+def load_player_profiles():
+    """Ladda profilerna; saknas filen seedas de från spelarindexet och aktiva anmälningar."""
+    global player_profiles
+    if os.path.exists(PLAYER_PROFILES_FILE):
+        try:
+            with open(PLAYER_PROFILES_FILE, "r", encoding="utf-8") as f:
+                player_profiles = {int(uid): v for uid, v in json.load(f).items()}
+            return
+        except Exception as e:
+            logger.error(f"Fel vid laddning av spelarprofiler: {e}")
+    player_profiles = {}
+    for uid, stats in player_stats.items():
+        remember_build(uid, {
+            "attending": True,
+            "class": stats.get("last_class"),
+            "elite_spec": stats.get("last_spec"),
+            "wvw_role": stats.get("last_role"),
+            "updated_at": stats.get("last_event_at"),
+        })
+    live = [(uid, d) for event_data in wvw_rsvp_data.values() for uid, d in event_data.items()]
+    live.sort(key=lambda t: t[1].get("updated_at") or "")
+    for uid, d in live:
+        remember_build(uid, d)
+
+def last_build(uid: int) -> dict | None:
+    """Spelarens senaste bygge om det fortfarande är giltigt mot nuvarande klasser/meta."""
+    profile = player_profiles.get(uid)
+    if not profile:
+        return None
+    klass, spec, role = profile.get("class"), profile.get("elite_spec"), profile.get("wvw_role")
+    if spec not in (ELITE_SPECS_BASE.get(klass) or {}):
+        return None
+    if role not in get_spec_meta(klass, spec)["roles"]:
+        return None
+    return profile
+
+# ----------------------------
+# Topplistor (rollups som uppdateras vid arkivering)
+# ----------------------------
+LEADERBOARD_TOP_K = 10
+LEADERBOARD_WINDOW_DAYS = 30  # dagshinkar sparas så här länge (räcker för 7d/30d)
+LEADERBOARD_BOARDS = {
+    "attendance": "Närvaro",
+    "specs": "Populäraste specs",
+    "commanders": "Commander-pass",
+}
+# {"all_time": {board: {key: n}}, "top": {board: [[key, n]]}, "days": {"YYYY-MM-DD": {board: {key: n}}}}
+leaderboards: dict = {"all_time": {}, "top": {}, "days": {}}
+leaderboard_version = 0
+_window_cache: dict[tuple[str, int], tuple[str, int, list]] = {}  # (board, dagar) -> (idag, version, topplista)
+
+def _topk_bump(top: list[list], key: str, count: int, k: int = LEADERBOARD_TOP_K):
+    """Uppdatera en begränsad topplista när key:s (bara växande) totalsumma blivit count."""
+    for item in top:
+        if item[0] == key:
+            item[1] = count
+            break
+    else:
+        if len(top) < k:
+            top.append([key, count])
+        elif (-count, key) < (-top[-1][1], top[-1][0]):
+            top[-1] = [key, count]
+        else:
+            return
+    top.sort(key=lambda item: (-item[1], item[0]))
+
+def _leaderboard_keys(entry: dict, wvw: bool) -> dict[str, str]:
+    """Vilka rader i vilka topplistor en arkiverad post räknas på (bara attending-poster)."""
+    keys = {"attendance": str(entry["user_id"])}
+    if wvw:
+        if entry.get("class") and entry.get("elite_spec"):
+            keys["specs"] = f"{entry['class']} - {entry['elite_spec']}"
+        if entry.get("wvw_role") == "Commander":
+            keys["commanders"] = str(entry["user_id"])
+    return keys
+
+def _record_leaderboard_entries(snapshot: dict, wvw: bool):
+    global leaderboard_version
+    day = (snapshot.get("closed_at") or now_utc_iso())[:10]
+    bucket = leaderboards["days"].setdefault(day, {})
+    for entry in snapshot.get("entries", []):
+        if not entry.get("attending"):
+            continue
+        for board, key in _leaderboard_keys(entry, wvw).items():
+            totals = leaderboards["all_time"].setdefault(board, {})
+            totals[key] = totals.get(key, 0) + 1
+            _topk_bump(leaderboards["top"].setdefault(board, []), key, totals[key])
+            day_counts = bucket.setdefault(board, {})
+            day_counts[key] = day_counts.get(key, 0) + 1
+
+    # Släng dagshinkar som fallit ur längsta fönstret
+    cutoff = (now_utc() - datetime.timedelta(days=LEADERBOARD_WINDOW_DAYS)).date().isoformat()
+    for old_day in [d for d in leaderboards["days"] if d < cutoff]:
+        del leaderboards["days"][old_day]
+    leaderboard_version += 1
+
+def leaderboard_top(board: str, days: int | None = None) -> list[list]:
+    """Topplista [[key, n]] för all-time (days=None) eller de senaste `days` dagarna."""
+    if days is None:
+        return leaderboards["top"].get(board, [])
+    today = now_utc().date()
+    cache_key = (board, days)
+    cached = _window_cache.get(cache_key)
+    if cached and cached[0] == today.isoformat() and cached[1] == leaderboard_version:
+        return cached[2]
+    cutoff = (today - datetime.timedelta(days=days - 1)).isoformat()
+    counts: Counter = Counter()
+    for day, bucket in leaderboards["days"].items():
+        if day >= cutoff:
+            counts.update(bucket.get(board, {}))
+    top = [[key, n] for key, n in heapq.nsmallest(LEADERBOARD_TOP_K, counts.items(), key=lambda t: (-t[1], t[0]))]
+    _window_cache[cache_key] = (today.isoformat(), leaderboard_version, top)
+    return top
+
+def rebuild_leaderboards():
+    """Bygg rollups från hela historiken (bara när topplistefilen saknas)."""
+    global leaderboards
+    leaderboards = {"all_time": {}, "top": {}, "days": {}}
+    snapshots = [(s, False) for s in event_history]
+    snapshots += [(s, True) for history in wvw_event_history.values() for s in history]
+    snapshots.sort(key=lambda t: t[0].get("closed_at") or "")
+    for snapshot, wvw in snapshots:
+        _record_leaderboard_entries(snapshot, wvw)
+
+def load_leaderboards():
+    global leaderboards
+    if os.path.exists(LEADERBOARDS_FILE):
+        try:
+            with open(LEADERBOARDS_FILE, "r", encoding="utf-8") as f:
+                leaderboards = {"all_time": {}, "top": {}, "days": {}, **json.load(f)}
+            return
+        except Exception as e:
+            logger.error(f"Fel vid laddning av topplistor: {e}")
+    rebuild_leaderboards()
+    if leaderboards["all_time"]:
+        save_leaderboards()
+
+@traced
+def save_leaderboards():
+    try:
+        with open(LEADERBOARDS_FILE, "w", encoding="utf-8") as f:
+            json.dump(leaderboards, f, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Fel vid sparande av topplistor: {e}")
+
+def player_reliability(uid: int) -> float:
+    """Andel WvW-events spelaren faktiskt stod kvar som attending, dragen mot default-takten när historiken är tunn."""
+    stats = player_stats.get(uid)
+    attended, signups = (stats["wvw_attended"], stats["wvw_signups"]) if stats else (0, 0)
+    prior = 1.0 - NO_SHOW_DEFAULT_RATE
+    return (attended + prior * RELIABILITY_PRIOR_WEIGHT) / (signups + RELIABILITY_PRIOR_WEIGHT)
+
+# ----------------------------
+# Roster-versioner (oföränderliga, med strukturdelning)
+# ----------------------------
+ROSTER_FANOUT = 32
+
+class Roster(Mapping):
+    """
+    Oföränderlig version av ett events roster: user_id -> RSVP-post, med samma
+    läs-API och iterationsordning (anmälningsordning) som en dict. set/delete
+    returnerar en ny version som delar allt utom det som ändrats: posterna ligger
+    i ROSTER_FANOUT hash-hinkar och ordningen i bitar om ROSTER_FANOUT user_ids,
+    så en skrivning kopierar en hink, en bit och två korta tupler – inte hela
+    rostern. Läsare (snapshot-tråden, API, renderare) kan därför hålla en
+    referens till en version utan att kopiera den.
+    """
+    __slots__ = ("_buckets", "_chunks", "_len")
+    _NO_BUCKETS = tuple({} for _ in range(ROSTER_FANOUT))  # delas av alla tomma rostrar, muteras aldrig
+
+    def __init__(self, buckets: tuple | None = None, chunks: tuple = (), length: int = 0):
+        self._buckets = buckets or Roster._NO_BUCKETS  # hink: {uid: (post, bitens index)}
+        self._chunks = chunks  # tuple av tupler med user_ids i anmälningsordning
+        self._len = length
+
+    @classmethod
+    def from_dict(cls, records: dict) -> "Roster":
+        buckets = [{} for _ in range(ROSTER_FANOUT)]
+        uids = list(records)
+        chunks = tuple(tuple(uids[i:i + ROSTER_FANOUT]) for i in range(0, len(uids), ROSTER_FANOUT))
+        for ci, chunk in enumerate(chunks):
+            for uid in chunk:
+                buckets[hash(uid) % ROSTER_FANOUT][uid] = (records[uid], ci)
+        return cls(tuple(buckets), chunks, len(uids))
+
+    def __getitem__(self, uid):
+        return self._buckets[hash(uid) % ROSTER_FANOUT][uid][0]
+
+    def __contains__(self, uid):
+        return uid in self._buckets[hash(uid) % ROSTER_FANOUT]
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return f"Roster({self.to_dict()!r})"
+
+    def to_dict(self) -> dict:
+        return {uid: self[uid] for uid in self}
+
+    def set(self, uid, record: dict) -> "Roster":
+        bi = hash(uid) % ROSTER_FANOUT
+        bucket = self._buckets[bi]
+        chunks, length = self._chunks, self._len
+        entry = bucket.get(uid)
+        if entry is not None:
+            ci = entry[1]  # befintlig spelare behåller sin plats, som i en dict
+        elif chunks and len(chunks[-1]) < ROSTER_FANOUT:
+            ci = len(chunks) - 1
+            chunks = chunks[:ci] + (chunks[ci] + (uid,),)
+            length += 1
+        else:
+            ci = len(chunks)
+            chunks = chunks + ((uid,),)
+            length += 1
+        buckets = self._buckets[:bi] + ({**bucket, uid: (record, ci)},) + self._buckets[bi + 1:]
+        return Roster(buckets, chunks, length)
+
+    def delete(self, uid) -> "Roster":
+        bi = hash(uid) % ROSTER_FANOUT
+        bucket = self._buckets[bi]
+        entry = bucket.get(uid)
+        if entry is None:
+            return self
+        if len(self._chunks) > 2 * (self._len // ROSTER_FANOUT + 1):
+            # Avanmälningar lämnar glesa/tomma bitar; packa om när de är hälften. Minst
+            # ~len nya anmälningar behövs mellan två ompackningar, så kostnaden slås ut.
+            return Roster.from_dict({u: self[u] for u in self if u != uid})
+        ci = entry[1]
+        chunks = self._chunks[:ci] + (tuple(u for u in self._chunks[ci] if u != uid),) + self._chunks[ci + 1:]
+        new_bucket = dict(bucket)
+        del new_bucket[uid]
+        buckets = self._buckets[:bi] + (new_bucket,) + self._buckets[bi + 1:]
+        return Roster(buckets, chunks, self._len - 1)
+
+# ----------------------------
+# Medlemsnamn (cache)
+# ----------------------------
+class MemberNameCache:
+    """
+    user_id -> visningsnamn, med TTL och LRU-tak (MEMBER_NAME_CACHE_MAX). Läsningar
+    är synkrona så renderarna kan använda dem direkt; saknade eller för gamla namn
+    köas och hämtas i bulk av en bakgrundstask (guildens medlemscache först, sedan
+    query_members i bitar om 100 ID:n). Gateway-events håller namnen aktuella mellan
+    hämtningarna. Användare som inte hittas i någon guild frågas inte om förrän TTL gått.
+    Namnen sparas i MEMBER_NAMES_FILE efter hämtningar som ändrat något, så att en
+    omstart och API_ONLY-processen (som inte har någon Discord-anslutning) har dem.
+    """
+    def __init__(self):
+        self._names: OrderedDict[int, tuple[str, float]] = OrderedDict()  # uid -> (namn, hämtad monotonic)
+        self._absent: dict[int, float] = {}
+        self._wanted: set[int] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._client: commands.Bot | None = None
+        self.hits = self.misses = self.fetched = self.queries = 0
+        self.version = 0  # räknas upp när ett visat namn ändras (för renderade cachar)
+        self._saved_version = 0
+
+    def __contains__(self, uid: int) -> bool:
+        return uid in self._names
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _fresh(self, fetched: float) -> bool:
+        return time.monotonic() - fetched < MEMBER_NAME_TTL
+
+    def get(self, uid: int) -> str | None:
+        """Cachat namn (även om det är gammalt) eller None; saknade/gamla köas för hämtning."""
+        entry = self._names.get(uid)
+        if entry is None:
+            self.misses += 1
+            self._want(uid)
+            return None
+        self.hits += 1
+        self._names.move_to_end(uid)
+        if not self._fresh(entry[1]):
+            self._want(uid)
+        return entry[0]
+
+    def put(self, uid: int, name: str, fetched: float | None = None):
+        entry = self._names.get(uid)
+        if entry is None or entry[0] != name:
+            self.version += 1
+        self._names[uid] = (name, time.monotonic() if fetched is None else fetched)
+        self._names.move_to_end(uid)
+        self._absent.pop(uid, None)
+        while len(self._names) > MEMBER_NAME_CACHE_MAX:
+            self._names.popitem(last=False)
+
+    def seed(self, uid: int, name: str | None):
+        """Namn från gammal data: visas tills det hämtats på nytt (räknas som gammalt direkt)."""
+        if name and uid not in self._names:
+            self.put(uid, name, fetched=float("-inf"))
+
+    def note(self, member: discord.abc.User):
+        """Namnet är färskt när vi ändå har användarobjektet (interaktion, gateway-event)."""
+        self.put(member.id, member.display_name)
+
+    def note_if_cached(self, member: discord.abc.User):
+        if member.id in self._names:
+            self.note(member)
+
+    def _want(self, uid: int):
+        if self._task is None:
+            return
+        absent_at = self._absent.get(uid)
+        if absent_at is not None and self._fresh(absent_at):
+            return
+        self._wanted.add(uid)
+        self._wakeup.set()
+
+    def start(self, client: commands.Bot):
+        if self._task is not None:
+            return
+        self._client = client
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="member-names")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.save_if_changed()
+
+    def names(self) -> dict[int, str]:
+        return {uid: name for uid, (name, _) in self._names.items()}
+
+    def save_if_changed(self):
+        if self.version != self._saved_version:
+            self._saved_version = self.version
+            save_member_names()
+
+    async def hydrate(self, uids):
+        """Hämta saknade/gamla namn innan en rendering (no-op om allt är färskt)."""
+        if self._client is None:
+            return
+        now = time.monotonic()
+        stale = {
+            uid for uid in uids
+            if (entry := self._names.get(uid)) is None or now - entry[1] >= MEMBER_NAME_TTL
+        }
+        stale = {uid for uid in stale if uid not in self._absent or not self._fresh(self._absent[uid])}
+        if stale:
+            self._wanted -= stale
+            await self._fetch(stale)
+
+    async def _fetch(self, uids: set[int]):
+        remaining = set(uids)
+        with trace_span("member_names_fetch", users=len(remaining)):
+            for guild in self._client.guilds:
+                if not remaining:
+                    break
+                for uid in list(remaining):
+                    member = guild.get_member(uid)
+                    if member is not None:
+                        self.note(member)
+                        remaining.discard(uid)
+                ids = sorted(remaining)
+                for i in range(0, len(ids), MEMBER_QUERY_CHUNK):
+                    chunk = ids[i:i + MEMBER_QUERY_CHUNK]
+                    self.queries += 1
+                    try:
+                        members = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=False)
+                    except (asyncio.TimeoutError, discord.ClientException) as e:
+                        logger.warning(f"Kunde inte hämta medlemmar i {guild.id}: {e}")
+                        continue
+                    for member in members:
+                        self.note(member)
+                        remaining.discard(member.id)
+        self.fetched += len(uids) - len(remaining)
+        now = time.monotonic()
+        for uid in remaining:
+            # Inte med i någon guild: behåll ev. gammalt namn, fråga inte igen förrän TTL gått
+            self._absent[uid] = now
+        if len(self._absent) > MEMBER_NAME_CACHE_MAX:
+            self._absent = {uid: t for uid, t in self._absent.items() if self._fresh(t)}
+        self.save_if_changed()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(MEMBER_NAME_BATCH_DELAY)  # samla ihop fler ID:n till samma hämtning
+            self._wakeup.clear()
+            batch, self._wanted = self._wanted, set()
+            if batch:
+                try:
+                    await self._fetch(batch)
+                except Exception:
+                    logger.exception("Fel vid hämtning av medlemsnamn")
+
+member_names = MemberNameCache()
+
+def load_member_names():
+    """Sparade namn seedas som gamla: de visas direkt men hämtas om vid första läsning."""
+    if os.path.exists(MEMBER_NAMES_FILE):
+        try:
+            with open(MEMBER_NAMES_FILE, "r", encoding="utf-8") as f:
+                for uid, name in json.load(f).items():
+                    member_names.seed(int(uid), name)
+        except Exception as e:
+            logger.error(f"Fel vid laddning av medlemsnamn: {e}")
+    member_names._saved_version = member_names.version
+
+@traced
+def save_member_names():
+    if API_ONLY:
+        return  # filen ägs av botens process
+    try:
+        with open(MEMBER_NAMES_FILE, "w", encoding="utf-8") as f:
+            json.dump(member_names.names(), f, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Fel vid sparande av medlemsnamn: {e}")
+
+def member_name(uid: int, fallback: str | None = None) -> str:
+    """Visningsnamn från namncachen; okända visas som mention (eller fallback)."""
+    return member_names.get(uid) or fallback or f"<@{uid}>"
+
+# ----------------------------
+# WvW-mutationer & versioner
+# ----------------------------
+# Varje WvW-event har en version som räknas upp vid varje ändring av rostern,
+# och meta_version räknas upp när meta/roller ändras. Alla skrivningar till
+# wvw_rsvp_data ska gå via funktionerna nedan så att cachar kan lita på dem.
+# Varje skrivning ersätter eventets Roster med en ny version; en läsare som
+# behöver en konsistent bild tar wvw_roster(event_id) och håller i den.
+wvw_event_versions: dict[str, int] = {}
+wvw_data_version: int = 0  # räknas upp vid varje ändring av något event (t.ex. för eventlistan i API:t)
+meta_version: int = 0
+
+def wvw_event_version(event_id: str) -> int:
+    return wvw_event_versions.get(event_id, 0)
+
+def wvw_roster(event_id: str) -> Roster:
+    """Eventets nuvarande roster-version (ändras aldrig; nästa skrivning ger en ny)."""
+    return wvw_rsvp_data.get(event_id) or Roster()
+
+def touch_wvw_event(event_id: str) -> int:
+    global wvw_data_version
+    wvw_data_version += 1
+    wvw_event_versions[event_id] = wvw_event_versions.get(event_id, 0) + 1
+    return wvw_event_versions[event_id]
+
+def mark_meta_changed():
+    global meta_version
+    meta_version += 1
+
+# Sorterat index över aktiva events för autocomplete: [(namn i gemener, event_id)]
+# plus antal som tackat ja per event. Underhålls av mutationerna nedan så att
+# autocomplete aldrig behöver gå igenom rostrarna.
+wvw_event_index: list[tuple[str, str]] = []
+wvw_attending_counts: dict[str, int] = {}
+
+def _index_key(event_id: str) -> tuple[str, str]:
+    return (wvw_event_names.get(event_id, f"WvW Event {event_id[:8]}").lower(), event_id)
+
+def _index_add_event(event_id: str):
+    if event_id not in wvw_attending_counts:
+        bisect.insort(wvw_event_index, _index_key(event_id))
+    wvw_attending_counts[event_id] = sum(1 for d in wvw_rsvp_data.get(event_id, {}).values() if d.get("attending"))
+
+def _index_remove_event(event_id: str):
+    if wvw_attending_counts.pop(event_id, None) is None:
+        return
+    key = _index_key(event_id)
+    i = bisect.bisect_left(wvw_event_index, key)
+    if i < len(wvw_event_index) and wvw_event_index[i] == key:
+        del wvw_event_index[i]
+    else:
+        wvw_event_index[:] = [k for k in wvw_event_index if k[1] != event_id]
+
+def rebuild_wvw_event_index():
+    wvw_event_index.clear()
+    wvw_attending_counts.clear()
+    for event_id in wvw_rsvp_data:
+        _index_add_event(event_id)
+
+def create_wvw_event(event_id: str, name: str):
+    change_log.append({"op": "create", "e": event_id, "n": name})
+    _index_remove_event(event_id)
+    wvw_event_names[event_id] = name
+    wvw_rsvp_data[event_id] = Roster()
+    _index_add_event(event_id)
+    touch_wvw_event(event_id)
+
+def set_wvw_rsvp(event_id: str, uid: int, record: dict) -> dict | None:
+    """Skriv en spelares RSVP (ny dict varje gång). Returnerar föregående post."""
+    if not record.get("updated_at"):
+        record = {**record, "updated_at": now_utc_iso()}
+    change_log.append({"op": "set", "e": event_id, "u": uid, "r": record})
+    roster = wvw_roster(event_id)
+    previous = roster.get(uid)
+    wvw_rsvp_data[event_id] = roster.set(uid, record)
+    if event_id not in wvw_attending_counts:
+        _index_add_event(event_id)
+    else:
+        wvw_attending_counts[event_id] += bool(record.get("attending")) - bool(previous and previous.get("attending"))
+    remember_build(uid, record)
+    _reassign_player(event_id, uid)
+    touch_wvw_event(event_id)
+    change_stream.publish(event_id, _rsvp_change_kind(previous, record), uid, record)
+    return previous
+
+def _rsvp_change_kind(previous: dict | None, record: dict) -> str:
+    if not record.get("attending"):
+        return "cancel"
+    if not (previous and previous.get("attending")):
+        return "signup"
+    return "role_change"
+
+def delete_wvw_rsvp(event_id: str, uid: int, change: str = "cancel") -> dict | None:
+    roster = wvw_rsvp_data.get(event_id)
+    previous = roster.get(uid) if roster is not None else None
+    if previous is not None:
+        wvw_rsvp_data[event_id] = roster.delete(uid)
+        change_log.append({"op": "del", "e": event_id, "u": uid, "c": change})
+        if previous.get("attending") and event_id in wvw_attending_counts:
+            wvw_attending_counts[event_id] -= 1
+        _reassign_player(event_id, uid)
+        touch_wvw_event(event_id)
+        change_stream.publish(event_id, change, uid)
+    return previous
+
+def reset_wvw_event(event_id: str):
+    if event_id in wvw_rsvp_data:
+        change_log.append({"op": "reset", "e": event_id})
+        wvw_rsvp_data[event_id] = Roster()
+        if not change_log.replaying:
+            cancel_event_reminders(f"wvw:{event_id}")
+        wvw_attending_counts[event_id] = 0
+        _drop_assignment(event_id)
+        touch_wvw_event(event_id)
+        change_stream.publish(event_id, "reset")
+
+def event_max_squads(event_id: str) -> int:
+    return int(wvw_event_settings.get(event_id, {}).get("max_squads", MAX_SQUADS))
+
+def event_wings(event_id: str) -> int:
+    """Antal Commanders som får leda en egen wing (default 1 = en global Commander)."""
+    return int(wvw_event_settings.get(event_id, {}).get("wings", 1))
+
+def event_balance(event_id: str) -> bool:
+    """Tier-balansera squadsen istället för bästa-spelarna-först."""
+    return bool(wvw_event_settings.get(event_id, {}).get("balance", False))
+
+def set_wvw_event_settings(event_id: str, max_squads: int | None = None, wings: int | None = None, balance: bool | None = None):
+    change_log.append({"op": "settings", "e": event_id, "s": {"max_squads": max_squads, "wings": wings, "balance": balance}})
+    settings = wvw_event_settings.setdefault(event_id, {})
+    rebalance = balance is not None and balance != event_balance(event_id)
+    if max_squads is not None:
+        settings["max_squads"] = max_squads
+    if wings is not None:
+        settings["wings"] = wings
+    if balance is not None:
+        settings["balance"] = balance
+    if max_squads is not None or wings is not None or rebalance:
+        # Indelningen byggs om från grunden med de nya gränserna (tier-balansen sätts vid bygget)
+        _drop_assignment(event_id)
+    touch_wvw_event(event_id)
+
+def remove_wvw_event(event_id: str, change: str = "removed"):
+    change_log.append({"op": "remove", "e": event_id, "c": change})
+    if not change_log.replaying:
+        cancel_event_reminders(f"wvw:{event_id}")
+    _index_remove_event(event_id)
+    wvw_rsvp_data.pop(event_id, None)
+    wvw_event_names.pop(event_id, None)
+    wvw_event_settings.pop(event_id, None)
+    _drop_assignment(event_id)
+    touch_wvw_event(event_id)
+    change_stream.publish(event_id, change)
+    change_stream.close_event(event_id)
+    # Eventet kommer inte tillbaka: släpp dess cachade byggen/svar (och rostrarna de håller i)
+    for cache_key in [k for k in _analysis_cache if k[1] == event_id]:
+        del _analysis_cache[cache_key]
+    wvw_event_versions.pop(event_id, None)
 
 # ----------------------------
 # Auto-clean
@@ -544,12 +1841,10 @@ def clean_old_data(days: int = AUTO_CLEAN_DAYS) -> int:
             if ts < cutoff:
                 to_del_wvw.append((event_id, uid))
     for event_id, uid in to_del_wvw:
-        del wvw_rsvp_data[event_id][uid]
+        delete_wvw_rsvp(event_id, uid, change="clean")
         # Ta bort tomma event
         if not wvw_rsvp_data[event_id]:
-            del wvw_rsvp_data[event_id]
-            if event_id in wvw_event_names:
-                del wvw_event_names[event_id]
+            remove_wvw_event(event_id, change="clean")
             # Ta bort alla kanal-referenser för detta event
             keys_to_remove = []
             for channel_key, info in wvw_summary_channels.items():
@@ -557,6 +1852,8 @@ def clean_old_data(days: int = AUTO_CLEAN_DAYS) -> int:
                     keys_to_remove.append(channel_key)
             for key in keys_to_remove:
                 del wvw_summary_channels[key]
+            for key in [k for k, info in wvw_squad_boards.items() if info.get("event_id") == event_id]:
+                del wvw_squad_boards[key]
     if to_del_wvw:
         save_wvw_rsvp_data()
         save_summary_channels()
@@ -587,36 +1884,28 @@ def _tier_order_for(uid: int, data: dict) -> int:
     return TIER_ORDER.get(meta.get("tier", "C"), 4)
 
 def _rank_key(uid: int, data: dict) -> tuple:
-    # lägre är bättre: tier → färskast → uid
-    return (
-        _tier_order_for(uid, data),
-        0 - parse_iso(data.get("updated_at", now_utc_iso())).timestamp(),
-        uid,
-    )
-
-def _pick_best(candidates: list[tuple[int, dict]], allow_roles: list[str]) -> tuple[int, dict] | None:
-    filtered = [(uid, d) for (uid, d) in candidates if d.get("wvw_role") in allow_roles]
-    if not filtered:
-        return None
-    filtered.sort(key=lambda t: _rank_key(t[0], t[1]))
-    return filtered[0]
+    # lägre är bättre: tier → (pålitligast, om RANK_TIEBREAKER=reliability) → färskast → uid
+    fresh = 0 - parse_iso(data.get("updated_at", now_utc_iso())).timestamp()
+    if RANK_TIEBREAKER == "reliability":
+        return (_tier_order_for(uid, data), -round(player_reliability(uid), 3), fresh, uid)
+    return (_tier_order_for(uid, data), fresh, uid)
 
-def preview_next_missing_role(attending_pairs_wo_self: list[tuple[int, dict]]) -> str | None:
+def preview_next_missing_role(attending_pairs_wo_self: list[tuple[int, dict]], max_squads: int = MAX_SQUADS, wings: int = 1) -> str | None:
     """
     Returnerar "Primary Support" / "Secondary Support" / "Tertiary Support" om det är
     den kritiska bristen för att kunna få ihop NÄSTA squad. Annars None.
     Regler:
-      - 1 global Commander ersätter Primary i första squaden.
-      - Squads 2..10 kräver Primary + Secondary.
+      - Varje wing-Commander (max `wings`) ersätter Primary i sin första squad.
+      - Övriga squads kräver Primary + Secondary.
       - Tertiary är önskad (fallback till Strip/DPS/Utility).
     """
     counts = _role_counts_from_attending(attending_pairs_wo_self)
-    commander_exists = counts["Commander"] > 0
+    commanders = min(counts["Commander"], wings)
 
     support_cap = min(
         counts["Secondary Support"],
-        counts["Primary Support"] + (1 if commander_exists else 0),
-        MAX_SQUADS,
+        counts["Primary Support"] + commanders,
+        max_squads,
     )
 
     dps_like = counts["DPS"] + counts["Strip DPS"]
@@ -625,219 +1914,985 @@ def preview_next_missing_role(attending_pairs_wo_self: list[tuple[int, dict]]) -
     built_guess = min(support_cap, possible_by_dps)
 
     next_squad = built_guess + 1
-    if next_squad > MAX_SQUADS:
+    if next_squad > max_squads:
         return None
 
-    if next_squad == 1 and commander_exists:
-        if counts["Secondary Support"] < 1:
-            return "Secondary Support"
-    else:
-        needed_primary = max(0, next_squad - 1)
-        needed_secondary = next_squad
-        if counts["Primary Support"] < needed_primary:
-            return "Primary Support"
-        if counts["Secondary Support"] < needed_secondary:
-            return "Secondary Support"
+    needed_primary = max(0, next_squad - max(1, commanders))
+    needed_secondary = next_squad
+    if counts["Primary Support"] < needed_primary:
+        return "Primary Support"
+    if counts["Secondary Support"] < needed_secondary:
+        return "Secondary Support"
 
     if counts["Tertiary Support"] < next_squad:
         return "Tertiary Support"
 
     return None
 
-def build_squads_balanced(event_id: str):
-    """
-    Returnerar:
-      commander: tuple[int, dict] | None
-      squads: list[list[tuple[str, int, dict]]]
-      overflow: list[tuple[int, dict]]
-      reason: dict   # {"type": "cap"/"imbalance"/"none", "message": "...", "counts": {...}}
-    """
-    event_data = wvw_rsvp_data.get(event_id, {})
-    attending = [(uid, d) for uid, d in event_data.items() if d.get("attending") and d.get("wvw_role")]
-    attending.sort(key=lambda t: _rank_key(t[0], t[1]))
-
-    # 1) Global Commander
-    commanders = [(uid, d) for uid, d in attending if d.get("wvw_role") == "Commander"]
-    commander = None
-    used = set()
-    if commanders:
-        commanders.sort(key=lambda t: _rank_key(t[0], t[1]))
-        commander = commanders[0]
-        used.add(commander[0])
-
-    def remaining():
-        return [(uid, d) for (uid, d) in attending if uid not in used]
-
-    squads: list[list[tuple[str, int, dict]]] = []
-
-    # 2) Squad 1 (Commander-squad) – Commander ersätter Primary
-    if commander:
-        cand = remaining()
-        sec = _pick_best(cand, ["Secondary Support"])
-        if sec:
-            used.add(sec[0])
-            cand = remaining()
-            tert = _pick_best(cand, ["Tertiary Support"]) or _pick_best(cand, ["Strip DPS", "DPS", "Utility"])
-            if tert:
-                used.add(tert[0])
-                cand = remaining()
-            dps1 = _pick_best(cand, ["Strip DPS", "DPS"])
-            if dps1:
-                used.add(dps1[0])
-                cand = remaining()
-            dps2 = _pick_best(cand, ["Strip DPS", "DPS"])
-            if dps2:
-                used.add(dps2[0])
-
-            squad = []
-            squad.append(("Commander", commander[0], commander[1]))
-            if sec:
-                squad.append(("Secondary Support", sec[0], sec[1]))
-            if tert:
-                squad.append(
-                    (
-                        "Tertiary Support"
-                        if tert[1].get("wvw_role") == "Tertiary Support"
-                        else tert[1].get("wvw_role"),
-                        tert[0],
-                        tert[1],
-                    )
-                )
-            if dps1:
-                squad.append((dps1[1].get("wvw_role"), dps1[0], dps1[1]))
-            if dps2:
-                squad.append((dps2[1].get("wvw_role"), dps2[0], dps2[1]))
+# name -> (meta_version, kompilerad template); rensas när templates laddas/sparas
+_compiled_templates: dict[str, tuple[int, dict]] = {}
 
-            if len(squad) == 5:
-                squads.append(squad)
-            else:
-                for label, uid, _ in squad[1:]:
-                    used.discard(uid)
+def _role_buckets(roles) -> tuple[str, ...]:
+    return tuple(dict.fromkeys(role_to_bucket(r) for r in roles))
 
-    # 3) Squad 2..10: Primary + Secondary + Tertiary/fallback + 2×DPS
-    while len(squads) < MAX_SQUADS:
-        cand = remaining()
-        if len(cand) < 5:
-            break
+def compile_squad_template(template: dict) -> dict:
+    """
+    Kompilera en template till en platt slot-lista med roll-bucket-matchare:
+      {"name", "size", "commander_slot", "kinds": {"standard": [groups], "commander": [groups]}}
+    där groups är bucket-tupler i prioritetsordning. Custom roller i templaten mappas
+    via role_to_bucket.
+    """
+    slots = []
+    for slot in template.get("slots", []):
+        preferred = _role_buckets(slot.get("preferred_roles", []))
+        rest = tuple(b for b in _role_buckets(slot.get("allowed_roles", [])) if b not in preferred)
+        groups = tuple(g for g in (preferred, rest) if g)
+        if not groups:
+            raise ValueError(f"Slot '{slot.get('name', '?')}' saknar allowed_roles")
+        slots.extend([groups] * int(slot.get("count", 1)))
+    if not slots:
+        raise ValueError("Templaten har inga slots")
+
+    commander_slot = int(template.get("commander_slot", 0))
+    if not 0 <= commander_slot < len(slots):
+        raise ValueError(f"commander_slot {commander_slot} utanför templaten")
+    commander_slots = list(slots)
+    commander_slots[commander_slot] = (("Commander",),)
+    return {
+        "name": template.get("name", ""),
+        "size": len(slots),
+        "commander_slot": commander_slot,
+        "kinds": {"standard": slots, "commander": commander_slots},
+    }
 
-        prim = _pick_best(cand, ["Primary Support"])
-        if not prim:
-            break
-        used.add(prim[0])
-        cand = remaining()
+def get_compiled_template(name: str | None = None) -> dict | None:
+    """Kompilerad template (cachad per meta-version, eftersom custom roller påverkar buckets)."""
+    name = name or DEFAULT_SQUAD_TEMPLATE
+    cached = _compiled_templates.get(name)
+    if cached is not None and cached[0] == meta_version:
+        return cached[1]
+    template = squad_templates.get(name) or BUILTIN_SQUAD_TEMPLATES.get(name)
+    if template is None:
+        return None
+    try:
+        compiled = compile_squad_template(template)
+    except (ValueError, TypeError) as e:
+        logger.error(f"Ogiltig squad-template '{name}': {e}")
+        builtin = BUILTIN_SQUAD_TEMPLATES.get(name)
+        if builtin is None or builtin is template:
+            return None
+        # En trasig override av en inbyggd template (t.ex. default) får inte stoppa anmälningar
+        logger.warning(f"Använder inbyggda '{name}' istället.")
+        compiled = compile_squad_template(builtin)
+    _compiled_templates[name] = (meta_version, compiled)
+    return compiled
+
+def _squad_input(event_id: str, template_name: str | None = None) -> dict:
+    """
+    Serialiserbar indata till squad-byggaren: bara det som behövs, med meta redan
+    upplöst, så att bygget kan köras i en annan process utan bottens globala state.
+    roster: [{"uid", "role", "bucket", "rank"}] där rank = _rank_key (lägre är bättre).
+    """
+    event_data = wvw_rsvp_data.get(event_id, {})
+    roster = [
+        {"uid": uid, "role": d.get("wvw_role"), "bucket": role_to_bucket(d.get("wvw_role")),
+         "rank": list(_rank_key(uid, d)), "caps": capability_row(d)}
+        for uid, d in event_data.items()
+        if d.get("attending") and d.get("wvw_role")
+    ]
+    return {
+        "max_squads": event_max_squads(event_id),
+        "wings": event_wings(event_id),
+        "template": get_compiled_template(template_name),
+        "coverage": coverage_payload() if np is not None else None,
+        "roster": roster,
+    }
 
-        sec = _pick_best(cand, ["Secondary Support"])
-        if not sec:
-            used.discard(prim[0])
-            break
-        used.add(sec[0])
-        cand = remaining()
-
-        tert = _pick_best(cand, ["Tertiary Support"]) or _pick_best(cand, ["Strip DPS", "DPS", "Utility"])
-        if tert:
-            used.add(tert[0])
-            cand = remaining()
-
-        dps1 = _pick_best(cand, ["Strip DPS", "DPS"])
-        if dps1:
-            used.add(dps1[0])
-            cand = remaining()
-        dps2 = _pick_best(cand, ["Strip DPS", "DPS"])
-        if dps2:
-            used.add(dps2[0])
-
-        squad = []
-        squad.append(("Primary Support", prim[0], prim[1]))
-        squad.append(("Secondary Support", sec[0], sec[1]))
-        if tert:
-            squad.append(
-                (
-                    "Tertiary Support"
-                    if tert[1].get("wvw_role") == "Tertiary Support"
-                    else tert[1].get("wvw_role"),
-                    tert[0],
-                    tert[1],
-                )
-            )
-        if dps1:
-            squad.append((dps1[1].get("wvw_role"), dps1[0], dps1[1]))
-        if dps2:
-            squad.append((dps2[1].get("wvw_role"), dps2[0], dps2[1]))
+def _build_squads_core(payload: dict) -> dict:
+    """
+    Ren squad-byggare över _squad_input-format. Returnerar bara user-id:n:
+      {"commander": uid | None, "squads": [[[label, uid], ...]], "overflow": [uid], "reason": {...}}
+    Squadens form kommer från payloadens kompilerade template. Med flera wings leder
+    varje Commander sin egen wing; squads listas wing för wing, och en squad med
+    "Commander"-label startar en ny wing. Med täckningsdata avgörs val mellan
+    spelare av samma tier av vem som ger squaden bäst täckning (score_coverage).
+    """
+    max_squads = payload.get("max_squads", MAX_SQUADS)
+    wings = payload.get("wings", 1)
+    coverage = payload.get("coverage")
+    template = payload["template"]
+    size = template["size"]
+    attending = sorted(payload["roster"], key=lambda r: r["rank"])
+
+    # Pool per bucket: heap av index i attending (lägre index = bättre rank)
+    pools: dict[str, list[int]] = {}
+    for i, r in enumerate(attending):
+        pools.setdefault(r["bucket"], []).append(i)  # redan sorterad => giltig heap
+    remaining = len(attending)
+
+    def pick(groups, squad_rows: list[int] | None = None) -> int | None:
+        nonlocal remaining
+        for group in groups:
+            best = None
+            for bucket in group:
+                pool = pools.get(bucket)
+                if pool and (best is None or pool[0] < best[0]):
+                    best = pool
+            if best is not None:
+                remaining -= 1
+                if coverage is None or squad_rows is None:
+                    return heapq.heappop(best)
+                return pick_by_coverage(group, attending[best[0]]["rank"][0], squad_rows)
+        return None
 
-        if len(squad) == 5:
-            squads.append(squad)
+    def pick_by_coverage(group, tier: int, squad_rows: list[int]) -> int:
+        # Kandidater med samma tier som den bästa; alla tänkta squads poängsätts i ett svep
+        candidates = sorted(
+            i for bucket in group for i in heapq.nsmallest(COVERAGE_CANDIDATES, pools.get(bucket, ()))
+            if attending[i]["rank"][0] == tier
+        )[:COVERAGE_CANDIDATES]
+        if len(candidates) > 1:
+            scores, _ = score_coverage(coverage, [squad_rows + [attending[i]["caps"]] for i in candidates])
+            chosen = candidates[max(range(len(candidates)), key=lambda k: (scores[k], -k))]
         else:
-            for label, uid, _ in squad:
-                used.discard(uid)
-            break
+            chosen = candidates[0]
+        pool = pools[attending[chosen]["bucket"]]
+        pool.remove(chosen)
+        heapq.heapify(pool)
+        return chosen
+
+    def put_back(taken: list[int]) -> None:
+        nonlocal remaining
+        for i in taken:
+            heapq.heappush(pools[attending[i]["bucket"]], i)
+        remaining += len(taken)
+
+    def fill(kind: str, commander: int | None = None) -> list[tuple[str, int]] | None:
+        """commander = index i attending för wingens Commander (bara kind="commander")."""
+        squad, taken = [], []
+        rows = [attending[commander]["caps"]] if commander is not None else []
+        for si, groups in enumerate(template["kinds"][kind]):
+            if kind == "commander" and si == template["commander_slot"]:
+                squad.append(("Commander", attending[commander]["uid"]))
+                continue
+            i = pick(groups, rows + [attending[t]["caps"] for t in taken])
+            if i is None:
+                put_back(taken)
+                return None
+            taken.append(i)
+            squad.append((attending[i]["role"], attending[i]["uid"]))
+        return squad
+
+    # 1) Wing-Commanders (bäst rankade först)
+    picked = []
+    while len(picked) < wings and pools.get("Commander"):
+        picked.append(pick((("Commander",),)))
+
+    # 2) En Commander-squad per wing – Commander ersätter templatens commander_slot
+    wing_squads: list[list[list[tuple[str, int]]]] = []
+    failed = []
+    for i in picked:
+        squad = fill("commander", i) if len(wing_squads) < max_squads else None
+        if squad:
+            wing_squads.append([squad])
+        else:
+            failed.append(i)
 
-        if len(squads) >= MAX_SQUADS:
+    # Visad Commander: första wing-ledaren, annars bästa Commander utan squad (som då inte hamnar i overflow)
+    if wing_squads:
+        commander = wing_squads[0][0][template["commander_slot"]][1]
+    else:
+        commander = attending[failed[0]]["uid"] if failed else None
+    put_back([i for i in failed if attending[i]["uid"] != commander])
+
+    # 3) Resten av squadsen enligt templaten, till wingen med minst squads
+    loose: list[list[tuple[str, int]]] = []
+    built = len(wing_squads)
+    while built < max_squads and remaining >= size:
+        squad = fill("standard")
+        if not squad:
             break
+        if wing_squads:
+            min(wing_squads, key=len).append(squad)
+        else:
+            loose.append(squad)
+        built += 1
+    squads = loose + [squad for wing in wing_squads for squad in wing]
 
-    overflow = [(uid, d) for (uid, d) in attending if uid not in used and (not commander or uid != commander[0])]
+    overflow = [attending[i]["uid"] for i in sorted(i for pool in pools.values() for i in pool)]
 
     # 4) Orsak till overflow
-    counts = _role_counts_from_attending([(uid, d) for (uid, d) in attending if (not commander or uid != commander[0])])
+    pairs = [(r["uid"], {"wvw_role": r["bucket"]}) for r in attending]
+    leaders = {uid for squad in squads for label, uid in squad if label == "Commander"}
+    if commander is not None:
+        leaders.add(commander)
+    reason = _overflow_reason(pairs, leaders, len(squads), bool(overflow), max_squads, wings)
+    return {"commander": commander, "squads": squads, "overflow": overflow, "reason": reason}
+
+def _overflow_reason(pairs: list[tuple[int, dict]], commanders: set[int], squad_count: int, has_overflow: bool,
+                     max_squads: int, wings: int = 1) -> dict:
+    """{"type": "cap"/"imbalance"/"none", "message": "...", "counts": {...}} för en given indelning."""
+    counts = _role_counts_from_attending([p for p in pairs if p[0] not in commanders])
     reason = {"type": "none", "message": "", "counts": counts}
-    if len(squads) >= MAX_SQUADS and overflow:
+    if squad_count >= max_squads and has_overflow:
         reason["type"] = "cap"
-        reason["message"] = f"Begränsning: Max {MAX_SQUADS} squads (50 spelare)."
+        reason["message"] = f"Begränsning: Max {max_squads} squads ({max_squads * 5} spelare)."
     else:
-        missing = preview_next_missing_role([(uid, d) for (uid, d) in attending])
+        missing = preview_next_missing_role(pairs, max_squads, wings)
         if missing:
             reason["type"] = "imbalance"
             reason["message"] = f"Obalans: Saknar **{missing}** för att bygga nästa squad."
+    return reason
 
-    return commander, squads, overflow, reason
+def _hydrate_squads(event_id: str, result: dict):
+    """Översätt _build_squads_core-resultat (user-id:n) till (uid, data)-tupler."""
+    event_data = wvw_rsvp_data.get(event_id, {})
+    commander = result["commander"]
+    return (
+        (commander, event_data.get(commander, {})) if commander is not None else None,
+        [[(label, uid, event_data.get(uid, {})) for label, uid in squad] for squad in result["squads"]],
+        [(uid, event_data.get(uid, {})) for uid in result["overflow"]],
+        result["reason"],
+    )
+
+@traced
+def build_squads_balanced(event_id: str, template_name: str | None = None):
+    """
+    Returnerar:
+      commander: tuple[int, dict] | None
+      squads: list[list[tuple[str, int, dict]]]
+      overflow: list[tuple[int, dict]]
+      reason: dict   # {"type": "cap"/"imbalance"/"none", "message": "...", "counts": {...}}
+    """
+    return _hydrate_squads(event_id, _build_squads_core(_squad_input(event_id, template_name)))
 
 # ----------------------------
-# Views och Components
+# CPU-pool: tungt arbete utanför event-loopen
 # ----------------------------
-class RSVPView(discord.ui.View):
-    def __init__(self):
-        super().__init__(timeout=None)
+def start_cpu_pool():
+    """Starta processpoolen (SQUAD_POOL_WORKERS=0 => allt körs inline)."""
+    global _cpu_pool
+    if SQUAD_POOL_WORKERS > 0 and _cpu_pool is None:
+        # spawn: forka inte en process som har event-loop och trådar igång
+        _cpu_pool = ProcessPoolExecutor(max_workers=SQUAD_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"⚙️ CPU-pool startad med {SQUAD_POOL_WORKERS} processer.")
+
+def stop_cpu_pool():
+    global _cpu_pool
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
+
+async def run_cpu(func, *args):
+    """Kör en ren funktion i processpoolen, eller inline om poolen är avstängd/trasig."""
+    global _cpu_pool
+    if _cpu_pool is None:
+        return func(*args)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_cpu_pool, func, *args)
+    except BrokenProcessPool:
+        logger.error(f"CPU-poolen kraschade under {func.__name__} – kör inline och startar om poolen.")
+        stop_cpu_pool()
+        start_cpu_pool()
+        return func(*args)
 
-    @discord.ui.button(label="Ja, jag kommer", style=discord.ButtonStyle.success, custom_id="rsvp_yes_button")
-    async def yes_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        uid = interaction.user.id
-        if uid in rsvp_data and rsvp_data[uid]["attending"]:
+# ----------------------------
+# Analys-cache per (event_id, version, meta_version)
+# ----------------------------
+def _analysis_key(event_id: str) -> tuple[int, int]:
+    return (wvw_event_version(event_id), meta_version)
+
+def _render_key(event_id: str) -> tuple[int, int, int]:
+    """Som _analysis_key, plus namncachens version – för cachat som visar spelarnamn."""
+    return (*_analysis_key(event_id), member_names.version)
+
+def _cache_get(kind: str, event_id: str, key: tuple | None = None):
+    entry = _analysis_cache.get((kind, event_id))
+    if entry is not None and entry[0] == (key or _analysis_key(event_id)):
+        cache_stats[f"{kind}_hit"] += 1
+        return entry[1]
+    cache_stats[f"{kind}_miss"] += 1
+    return None
 
-            rsvp_data[uid]["updated_at"] = now_utc_iso()
-            save_rsvp_data()
+def _cache_put(kind: str, event_id: str, key: tuple, value):
+    # Bara senaste versionen per event behålls – äldre kan aldrig träffas igen
+    _analysis_cache[(kind, event_id)] = (key, value)
 
-            curr = rsvp_data.get(uid, {})
-            if curr.get("class"):
-                await interaction.response.send_message(
-                    f"✅ Du är anmäld som **{curr['class']} ({curr.get('role','?')})**.\n"
-                    f"Vill du ändra? Välj ny roll:",
-                    view=RoleSelectView(curr["class"]),
-                    ephemeral=True,
-                )
-            else:
-                await interaction.response.send_message(
-                    "✅ Du har redan RSVP:at. Vill du ändra? Välj ny klass/roll:",
-                    view=ClassSelectView(),
-                    ephemeral=True,
-                )
+async def build_squads_offloaded(event_id: str, template_name: str | None = None):
+    """
+    Som build_squads_balanced men bygget körs i CPU-poolen. Resultatet cachas
+    (per template) tills eventets version eller meta-versionen ändras.
+    """
+    template_name = template_name or DEFAULT_SQUAD_TEMPLATE
+    kind = "squads" if template_name == DEFAULT_SQUAD_TEMPLATE else f"squads:{template_name}"
+    cached = _cache_get(kind, event_id)
+    if cached is not None:
+        return cached
+
+    key = _analysis_key(event_id)
+    payload = _squad_input(event_id, template_name)
+    with trace_span("build_squads_balanced", offloaded=_cpu_pool is not None, template=template_name):
+        result = await run_cpu(_build_squads_core, payload)
+    squads = _hydrate_squads(event_id, result)
+    _cache_put(kind, event_id, key, squads)
+    return squads
 
-            await update_all_event_summaries(interaction.client)
-            return
+# ----------------------------
+# Stabil squad-indelning (inkrementell, minimal omflyttning)
+# ----------------------------
+# Platserna följer den kompilerade default-templaten: per squad-typ en lista av
+# bucket-grupper i prioritetsordning (se compile_squad_template).
+def _squad_slots(kind: str) -> list:
+    return get_compiled_template()["kinds"][kind]
+
+def _commander_slot() -> int:
+    return get_compiled_template()["commander_slot"]
+
+# event_id -> (placering per uid, overflow-pooler per bucket); byggs lat och hålls i synk inkrementellt.
+# Commanders som inte leder en wing ligger i poolen "Commander".
+_assignment_state_cache: dict[str, tuple[dict[int, tuple[int, int]], dict[str, set[int]]]] = {}
+
+def _slot_accepts(kind: str, slot: int, role: str) -> bool:
+    bucket = role_to_bucket(role)
+    return any(bucket in group for group in _squad_slots(kind)[slot])
+
+def _assignment_state(event_id: str):
+    state = _assignment_state_cache.get(event_id)
+    if state is None:
+        assignment = wvw_squad_assignments[event_id]
+        pos: dict[int, tuple[int, int]] = {}
+        for si, squad in enumerate(assignment["squads"]):
+            for li, uid in enumerate(squad["slots"]):
+                if uid is not None:
+                    pos[uid] = (si, li)
+        pools: dict[str, set[int]] = {}
+        for uid, d in wvw_rsvp_data.get(event_id, {}).items():
+            if d.get("attending") and d.get("wvw_role") and uid not in pos:
+                pools.setdefault(role_to_bucket(d["wvw_role"]), set()).add(uid)
+        state = (pos, pools)
+        _assignment_state_cache[event_id] = state
+    return state
+
+def _take_from_pools(event_id: str, pools: dict[str, set[int]], groups) -> int | None:
+    """Plocka bästa overflow-spelaren för en plats (första rollgruppen som har någon)."""
+    event_data = wvw_rsvp_data.get(event_id, {})
+    for group in groups:
+        candidates = [uid for bucket in group for uid in pools.get(bucket, ())]
+        if candidates:
+            best = min(candidates, key=lambda u: _rank_key(u, event_data[u]))
+            pools[role_to_bucket(event_data[best]["wvw_role"])].discard(best)
+            return best
+    return None
 
-        await interaction.response.send_message("Välj din klass:", view=ClassSelectView(), ephemeral=True)
+def _fill_slot(event_id: str, si: int, li: int) -> int:
+    assignment = wvw_squad_assignments[event_id]
+    pos, pools = _assignment_state(event_id)
+    squad = assignment["squads"][si]
+    uid = _take_from_pools(event_id, pools, _squad_slots(squad["kind"])[li])
+    if uid is None:
+        return 0
+    squad["slots"][li] = uid
+    pos[uid] = (si, li)
+    return 1
+
+def _take_squad(event_id: str, kind: str) -> list[int] | None:
+    """Plocka en hel squad ur overflow, eller ingen alls."""
+    _, pools = _assignment_state(event_id)
+    event_data = wvw_rsvp_data.get(event_id, {})
+    slots: list[int] = []
+    for groups in _squad_slots(kind):
+        uid = _take_from_pools(event_id, pools, groups)
+        if uid is None:
+            # Lägg tillbaka – det räcker inte till en hel squad än
+            for taken in slots:
+                pools.setdefault(role_to_bucket(event_data[taken]["wvw_role"]), set()).add(taken)
+            return None
+        slots.append(uid)
+    return slots
+
+def _insert_squad(event_id: str, squad: dict):
+    """
+    Lägg till en ny squad. En Commander-squad startar en ny wing sist; övriga läggs
+    sist i den wing som har minst squads (squads listas wing för wing).
+    """
+    squads = wvw_squad_assignments[event_id]["squads"]
+    starts = [i for i, sq in enumerate(squads) if sq["kind"] == "commander"]
+    if squad["kind"] == "commander" or not starts:
+        squads.append(squad)
+    else:
+        bounds = starts + [len(squads)]
+        _, end = min((bounds[w + 1] - bounds[w], bounds[w + 1]) for w in range(len(starts)))
+        squads.insert(end, squad)
+    _assignment_state_cache.pop(event_id, None)  # index har flyttats
+
+def _open_new_squads(event_id: str) -> int:
+    """Öppna nya squads (först nya wings) från overflow så länge en komplett squad går att fylla."""
+    assignment = wvw_squad_assignments[event_id]
+    moved = 0
+    while len(assignment["squads"]) < event_max_squads(event_id):
+        _, pools = _assignment_state(event_id)
+        wing_count = sum(1 for sq in assignment["squads"] if sq["kind"] == "commander")
+        kinds = ["standard"]
+        if wing_count < event_wings(event_id) and pools.get("Commander"):
+            kinds.insert(0, "commander")
+        for kind in kinds:
+            slots = _take_squad(event_id, kind)
+            if slots:
+                break
+        else:
+            return moved
+        _insert_squad(event_id, {"kind": kind, "slots": slots})
+        moved += len(slots)
+    return moved
+
+def _drop_empty_squads(event_id: str):
+    assignment = wvw_squad_assignments[event_id]
+    kept = [sq for sq in assignment["squads"] if any(uid is not None for uid in sq["slots"])]
+    if len(kept) != len(assignment["squads"]):
+        assignment["squads"] = kept
+        _assignment_state_cache.pop(event_id, None)
+
+def _reassign_player(event_id: str, uid: int) -> int:
+    """
+    Uppdatera den sparade indelningen efter att en spelares RSVP ändrats.
+    Spelaren behåller sin plats om den fortfarande passar; en tom plats fylls från
+    overflow (en wing-Commander ersätts av bästa Commander utan wing); nykomlingar
+    sätts i första lediga plats som passar; en ny squad öppnas bara när overflow
+    räcker till en hel. Returnerar antal spelare som flyttades.
+    """
+    assignment = wvw_squad_assignments.get(event_id)
+    if assignment is None:
+        return 0  # seedas från ett fullt bygge vid nästa läsning
+    pos, pools = _assignment_state(event_id)
+    d = wvw_rsvp_data.get(event_id, {}).get(uid)
+    role = role_to_bucket(d["wvw_role"]) if d and d.get("attending") and d.get("wvw_role") else None
+    moved = 0
+
+    for members in pools.values():
+        members.discard(uid)
+
+    where = pos.get(uid)
+    if where is not None:
+        si, li = where
+        squad = assignment["squads"][si]
+        if role and _slot_accepts(squad["kind"], li, role):
+            assignment["moved"] = 0
+            return 0
+        squad["slots"][li] = None
+        del pos[uid]
+        moved += 1 + _fill_slot(event_id, si, li)
+
+    if role and uid not in pos:
+        placed = False
+        for si, squad in enumerate(assignment["squads"]):
+            for li, occupant in enumerate(squad["slots"]):
+                if occupant is None and _slot_accepts(squad["kind"], li, role):
+                    squad["slots"][li] = uid
+                    pos[uid] = (si, li)
+                    placed = True
+                    moved += 1
+                    break
+            if placed:
+                break
+        if not placed:
+            pools.setdefault(role, set()).add(uid)
+
+    moved += _open_new_squads(event_id)
+    _drop_empty_squads(event_id)
+    assignment["moved"] = moved
+    return moved
+
+def _drop_assignment(event_id: str):
+    wvw_squad_assignments.pop(event_id, None)
+    _assignment_state_cache.pop(event_id, None)
+
+def _seed_assignment(event_id: str, squads, balance: dict | None = None):
+    """
+    Starta en sparad indelning från ett fullt bygge (build_squads_balanced-format).
+    balance = statistiken från balance_squad_tiers om bygget tier-balanserades.
+    """
+    wvw_squad_assignments[event_id] = {
+        "squads": [
+            {"kind": "commander" if any(label == "Commander" for label, _, _ in squad) else "standard",
+             "slots": [uid for _, uid, _ in squad]}
+            for squad in squads
+        ],
+        "moved": 0,
+    }
+    if balance is not None:
+        wvw_squad_assignments[event_id]["balance"] = balance
+    change_log.append({"op": "assign", "e": event_id, "a": wvw_squad_assignments[event_id]})
+    _assignment_state_cache.pop(event_id, None)
+
+def _hydrate_assignment(event_id: str):
+    """Sparad indelning i build_squads_balanced-format; ofullständiga squads tas med."""
+    assignment = wvw_squad_assignments[event_id]
+    event_data = wvw_rsvp_data.get(event_id, {})
+    pos, pools = _assignment_state(event_id)
+    cslot = _commander_slot()
+
+    squads = []
+    leaders: set[int] = set()
+    for squad in assignment["squads"]:
+        members = []
+        for li, uid in enumerate(squad["slots"]):
+            if uid is None:
+                continue
+            d = event_data.get(uid, {})
+            if squad["kind"] == "commander" and li == cslot:
+                leaders.add(uid)
+                members.append(("Commander", uid, d))
+            else:
+                members.append((d.get("wvw_role"), uid, d))
+        squads.append(members)
+
+    # Visad Commander: första wing-ledaren, annars bästa Commander utan wing
+    cmd = next((uid for squad in squads for label, uid, _ in squad if label == "Commander"), None)
+    if cmd is None and pools.get("Commander"):
+        cmd = min(pools["Commander"], key=lambda u: _rank_key(u, event_data[u]))
+    if cmd is not None:
+        leaders.add(cmd)
+
+    overflow = sorted(
+        ((uid, event_data[uid]) for members in pools.values() for uid in members if uid != cmd),
+        key=lambda t: _rank_key(t[0], t[1]),
+    )
+    pairs = [
+        (uid, {"wvw_role": role_to_bucket(d["wvw_role"])})
+        for uid, d in event_data.items() if d.get("attending") and d.get("wvw_role")
+    ]
+    full = sum(1 for squad in squads if len(squad) == len(_squad_slots("standard")))
+    reason = _overflow_reason(pairs, leaders, full, bool(overflow), event_max_squads(event_id), event_wings(event_id))
+    if "balance" in assignment:
+        # Balanserades vid bygget; spridningen nu kan ha ändrats av senare anmälningar
+        reason = {**reason, "balance": {"before": assignment["balance"]["before"], "after": _tier_spread(squads)}}
+    return ((cmd, event_data.get(cmd, {})) if cmd is not None else None), squads, overflow, reason
+
+async def current_squads(event_id: str, rebuild: bool = False, balance: bool | None = None):
+    """
+    Eventets stabila squad-indelning (samma format som build_squads_balanced).
+    Seedas från ett fullt bygge första gången, eller när rebuild=True; bygget
+    tier-balanseras då om eventet (eller anroparen) vill det, och resultatet sparas
+    så att senare anmälningar inte flyttar om redan placerade spelare.
+    """
+    if rebuild or event_id not in wvw_squad_assignments:
+        while True:
+            version = wvw_event_version(event_id)
+            _, squads, _, _ = await build_squads_offloaded(event_id)
+            if wvw_event_version(event_id) == version:
+                break  # annars ändrades rostern under bygget – bygg om
+        stats = None
+        if balance if balance is not None else event_balance(event_id):
+            with trace_span("balance_squad_tiers", squads=len(squads)):
+                squads, stats = balance_squad_tiers(squads)
+        _seed_assignment(event_id, squads, stats)
+        if rebuild:
+            touch_wvw_event(event_id)
+    return _hydrate_assignment(event_id)
+
+# ----------------------------
+# Tier-balans mellan squads
+# ----------------------------
+TIER_BALANCE_MAX_ROUNDS = 200
+
+def _tier_spread(squads: list[list[tuple[str, int, dict]]]) -> int:
+    """Skillnad i summerad tier-styrka mellan starkaste och svagaste fulla squad."""
+    full_size = max((len(sq) for sq in squads), default=0)
+    totals = [sum(_tier_strength(uid, data) for _, uid, data in sq) for sq in squads if len(sq) == full_size]
+    return max(totals) - min(totals) if len(totals) > 1 else 0
+
+def _tier_strength(uid: int, data: dict) -> int:
+    # S+ = 4 … C = 0
+    return 4 - _tier_order_for(uid, data)
+
+def balance_squad_tiers(squads: list[list[tuple[str, int, dict]]]) -> tuple[list[list[tuple[str, int, dict]]], dict]:
+    """
+    Fördela spelarna så att squadsens summerade tier-styrka blir så jämn som möjligt.
+    Bara spelare på samma slot-position byter squad (rollerna förblir giltiga), och
+    Commanders ligger kvar. Snake-draft per position följt av lokal sökning med byten.
+    Returnerar (squads, {"before": spread, "after": spread}), spread = max - min.
+    Ofullständiga squads (med luckor) lämnas orörda.
+    """
+    full_size = max((len(sq) for sq in squads), default=0)
+    idx = [i for i, sq in enumerate(squads) if len(sq) == full_size]
+    if len(idx) < 2:
+        return squads, {"before": 0, "after": 0}
+
+    grid = [list(squads[i]) for i in idx]
+    strength = [[_tier_strength(uid, data) for _, uid, data in sq] for sq in grid]
+    movable = [[label != "Commander" for label, _, _ in sq] for sq in grid]
+    before = max(map(sum, strength)) - min(map(sum, strength))
+
+    # 1) Snake-draft: per position (störst spridning först) får svagaste squaden bästa spelaren
+    totals = [sum(s for s, m in zip(row, mv) if not m) for row, mv in zip(strength, movable)]
+    positions = sorted(
+        range(full_size),
+        key=lambda li: -(max(row[li] for row in strength) - min(row[li] for row in strength)),
+    )
+    for li in positions:
+        owners = [q for q in range(len(grid)) if movable[q][li]]
+        players = sorted(((strength[q][li], grid[q][li]) for q in owners), key=lambda t: -t[0])
+        for (s, member), q in zip(players, sorted(owners, key=lambda q: totals[q])):
+            grid[q][li], strength[q][li] = member, s
+            totals[q] += s
+
+    # 2) Lokal sökning: bästa bytet (samma position) som minskar kvadratsumman, tills inget hjälper
+    totals = [sum(row) for row in strength]
+    for _ in range(TIER_BALANCE_MAX_ROUNDS):
+        best = None
+        for a in range(len(grid)):
+            for b in range(len(grid)):
+                diff = totals[a] - totals[b]
+                if diff <= 1:
+                    continue
+                for li in range(full_size):
+                    if not (movable[a][li] and movable[b][li]):
+                        continue
+                    d = strength[a][li] - strength[b][li]
+                    if 0 < d < diff:
+                        gain = d * (diff - d)
+                        if best is None or gain > best[0]:
+                            best = (gain, a, b, li, d)
+        if best is None:
+            break
+        _, a, b, li, d = best
+        grid[a][li], grid[b][li] = grid[b][li], grid[a][li]
+        strength[a][li], strength[b][li] = strength[b][li], strength[a][li]
+        totals[a] -= d
+        totals[b] += d
+
+    result = list(squads)
+    for q, i in enumerate(idx):
+        result[i] = grid[q]
+    return result, {"before": before, "after": max(totals) - min(totals)}
+
+async def display_squads(event_id: str, rebuild: bool = False, template_name: str | None = None, balance: bool | None = None):
+    """
+    Squads som de visas: den stabila indelningen (default-template, balanserad när
+    den byggs) eller ett fullt bygge, tier-balanserat om eventet (eller anroparen)
+    vill det. Balansen hamnar i reason["balance"].
+    """
+    template_name = template_name or DEFAULT_SQUAD_TEMPLATE
+    if template_name == DEFAULT_SQUAD_TEMPLATE:
+        # Anroparens balance gäller bara en ombyggnad; annars eventets inställning
+        return await current_squads(event_id, rebuild=rebuild, balance=balance if rebuild else None)
+    commander, squads, overflow, reason = await build_squads_offloaded(event_id, template_name)
+    if balance if balance is not None else event_balance(event_id):
+        with trace_span("balance_squad_tiers", squads=len(squads)):
+            squads, stats = balance_squad_tiers(squads)
+        reason = {**reason, "balance": stats}
+    return commander, squads, overflow, reason
+
+async def peek_squads(event_id: str):
+    """
+    Som display_squads för default-templaten, men utan att ändra något: en befintlig
+    indelning visas som den är, annars visas ett (cachat) fullt bygge utan att det
+    seedas. För läsare som inte får skriva state, t.ex. HTTP-API:t.
+    """
+    if event_id in wvw_squad_assignments:
+        return _hydrate_assignment(event_id)
+    commander, squads, overflow, reason = await build_squads_offloaded(event_id)
+    if event_balance(event_id):
+        squads, stats = balance_squad_tiers(squads)
+        reason = {**reason, "balance": stats}
+    return commander, squads, overflow, reason
+
+# ----------------------------
+# No-show-simulering (Monte Carlo)
+# ----------------------------
+NO_SHOW_FALLBACK_SCENARIOS = 500  # utan NumPy körs färre scenarier i ren Python
+_SIM_BUCKETS = ["Commander", "Primary Support", "Secondary Support", "Tertiary Support", "DPS", "Strip DPS", "Utility"]
+_SIM_BREAKERS = ["Secondary Support", "Primary Support", "DPS", "Tertiary Support"]
+
+def _squad_capacity_terms(counts, wings: int, minimum):
+    """
+    Övre gränser för antal fulla squads (balanced-templaten) givet antal per bucket:
+    Secondary, Primary + wing-Commanders, DPS-par, och flex-platser (Tertiary/Utility/DPS).
+    """
+    c = dict(zip(_SIM_BUCKETS, counts))
+    dps = c["DPS"] + c["Strip DPS"]
+    return [
+        c["Secondary Support"],
+        c["Primary Support"] + minimum(c["Commander"], wings),
+        dps // 2,
+        (c["Tertiary Support"] + c["Utility"] + dps) // 3,
+    ]
+
+def _simulate_no_shows_core(payload: dict) -> dict:
+    """
+    Ren Monte Carlo-simulering (körs i CPU-poolen). payload:
+      {"probs": [p], "buckets": [bucket], "max_squads", "wings", "scenarios", "seed"}
+    Drar no-shows för alla scenarier på en gång och räknar fulla squads per scenario.
+    """
+    probs, buckets = payload["probs"], payload["buckets"]
+    max_squads, wings = payload["max_squads"], payload["wings"]
+    col = [_SIM_BUCKETS.index(b) if b in _SIM_BUCKETS else _SIM_BUCKETS.index("Utility") for b in buckets]
+
+    full_counts = [0] * len(_SIM_BUCKETS)
+    for j in col:
+        full_counts[j] += 1
+    planned = min([max_squads] + _squad_capacity_terms(full_counts, wings, min))
+
+    if np is not None:
+        scenarios = payload["scenarios"]
+        rng = np.random.default_rng(payload["seed"])
+        onehot = np.zeros((len(probs), len(_SIM_BUCKETS)), dtype=np.int32)
+        onehot[np.arange(len(probs)), col] = 1
+        shows = rng.random((scenarios, len(probs))) < np.asarray(probs)        # [scenarier, spelare]
+        counts = (shows.astype(np.int32) @ onehot).T                             # [buckets, scenarier]
+        terms = np.stack(_squad_capacity_terms(list(counts), wings, np.minimum))  # [4, scenarier]
+        squads = np.minimum(terms.min(axis=0), max_squads)
+        broken = squads < planned
+        breaker = terms.argmin(axis=0)[broken]
+        expected = float(squads.mean())
+        p_hold = float((~broken).mean())
+        p10 = int(np.quantile(squads, 0.10, method="lower")) if scenarios else planned
+        breakers = {_SIM_BREAKERS[k]: float((breaker == k).sum()) / scenarios for k in range(len(_SIM_BREAKERS))}
+    else:
+        scenarios = min(payload["scenarios"], NO_SHOW_FALLBACK_SCENARIOS)
+        rng = random.Random(payload["seed"])
+        results, breaker_counts = [], Counter()
+        for _ in range(scenarios):
+            counts = [0] * len(_SIM_BUCKETS)
+            for p, j in zip(probs, col):
+                if rng.random() < p:
+                    counts[j] += 1
+            terms = _squad_capacity_terms(counts, wings, min)
+            n = min([max_squads] + terms)
+            results.append(n)
+            if n < planned:
+                breaker_counts[_SIM_BREAKERS[terms.index(min(terms))]] += 1
+        results.sort()
+        expected = sum(results) / scenarios if scenarios else planned
+        p_hold = sum(1 for n in results if n >= planned) / scenarios if scenarios else 1.0
+        p10 = results[int(0.10 * (scenarios - 1))] if scenarios else planned
+        breakers = {b: breaker_counts[b] / scenarios for b in _SIM_BREAKERS} if scenarios else {}
+
+    return {
+        "scenarios": scenarios, "planned": planned, "expected": expected,
+        "p_hold": p_hold, "p10": p10, "breakers": breakers,
+    }
+
+async def simulate_no_shows(event_id: str) -> dict:
+    """No-show-simulering för ett event; samma roster ger samma resultat (seed = event-version)."""
+    event_data = wvw_rsvp_data.get(event_id, {})
+    roster = [(uid, d) for uid, d in event_data.items() if d.get("attending") and d.get("wvw_role")]
+    payload = {
+        "probs": [player_reliability(uid) for uid, _ in roster],
+        "buckets": [role_to_bucket(d["wvw_role"]) for _, d in roster],
+        "max_squads": event_max_squads(event_id),
+        "wings": event_wings(event_id),
+        "scenarios": NO_SHOW_SCENARIOS,
+        "seed": wvw_event_version(event_id),
+    }
+    with trace_span("simulate_no_shows", players=len(roster), offloaded=_cpu_pool is not None):
+        result = await run_cpu(_simulate_no_shows_core, payload)
+    result["players"] = len(roster)
+    result["with_history"] = sum(1 for uid, _ in roster if player_stats.get(uid, {}).get("wvw_signups"))
+    return result
+
+# ----------------------------
+# Interaktions-pipeline: kvittera först, jobba sen
+# ----------------------------
+ACK_DEADLINE_SECONDS = 3.0  # Discords gräns för första svaret
+ACK_POLL_SECONDS = 0.05
+ack_latencies: deque[float] = deque(maxlen=500)  # senaste tider till kvittens (sekunder)
+_followup_tasks: set[asyncio.Task] = set()
+
+def interaction_label(interaction: discord.Interaction) -> str:
+    """Kort namn för loggning: /kommando eller komponentens custom_id."""
+    if interaction.command is not None:
+        return f"/{interaction.command.qualified_name}"
+    data = interaction.data or {}
+    return data.get("custom_id") or str(interaction.type)
+
+async def _run_followup(label: str, steps: tuple) -> None:
+    for step in steps:
+        try:
+            result = step()
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            logger.exception(f"Fel i efterarbete för {label}")
+
+def run_after_ack(label: str, *steps) -> asyncio.Task:
+    """
+    Kör persistens och uppdateringar efter att interaktionen redan är kvitterad.
+    Stegen körs i ordning i en egen task; sync-funktioner anropas direkt och
+    async-funktioner awaitas. Ett fel i ett steg loggas och stoppar inte nästa.
+    """
+    task = asyncio.create_task(_run_followup(label, steps), name=f"followup:{label}")
+    _followup_tasks.add(task)
+    task.add_done_callback(_followup_tasks.discard)
+    return task
+
+def _trace_ack(interaction: discord.Interaction, received: float, elapsed: float, acked: bool):
+    trace = _open_traces.pop(interaction.id, None)
+    if trace is not None:
+        _emit_span(trace, "ack", next(_span_ids), trace.root_span, received, elapsed, {"acked": acked})
+
+async def _ack_watchdog(interaction: discord.Interaction) -> None:
+    """Mät tiden tills en handler kvitterat interaktionen och logga långsamma."""
+    label = interaction_label(interaction)
+    received, started = time.time(), time.monotonic()
+    while not interaction.response.is_done():
+        if time.monotonic() - started >= ACK_DEADLINE_SECONDS:
+            logger.error(f"⏱️ {label} kvitterade inte inom {ACK_DEADLINE_SECONDS:.0f}s – interaktionen har gått ut.")
+            _trace_ack(interaction, received, time.monotonic() - started, acked=False)
+            return
+        await asyncio.sleep(ACK_POLL_SECONDS)
+
+    elapsed = time.monotonic() - started
+    _trace_ack(interaction, received, elapsed, acked=True)
+    ack_latencies.append(elapsed)
+    if elapsed >= ACK_WARN_SECONDS:
+        logger.warning(f"⏱️ {label} tog {elapsed*1000:.0f} ms på sig att kvittera (gräns {ACK_WARN_SECONDS*1000:.0f} ms).")
+
+# ----------------------------
+# Loop-lag & blockerande anrop
+# ----------------------------
+class LoopMonitor:
+    """
+    Mäter event-loopens lag kontinuerligt och pekar ut vad som blockerade den.
+    En asyncio-task tickar med fast intervall; en vakttråd samplar loop-trådens
+    stack när en tick uteblir, så att blockeringen kan knytas till handler/kommando.
+    """
+    def __init__(self, interval: float, threshold: float, top_n: int, history: int = 500):
+        self.interval = interval
+        self.threshold = threshold  # sekunder
+        self.top_n = top_n
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0  # EWMA
+        self.blocks: deque[tuple[float, float, str]] = deque(maxlen=history)  # (epoch, sekunder, label)
+        self._beat = time.monotonic()
+        self._stall_label: str | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._tick(), name="loop-monitor")
+        threading.Thread(target=self._watch, name="loop-monitor-watch", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _tick(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - before - self.interval)
+            self._beat = now
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.avg_lag = 0.9 * self.avg_lag + 0.1 * lag
+
+            label, self._stall_label = self._stall_label, None
+            if lag >= self.threshold:
+                label = label or "okänd (kortare än samplingen)"
+                self.blocks.append((time.time(), lag, label))
+                logger.warning(f"🐢 Event-loopen blockerades {lag*1000:.0f} ms – {label}")
+
+    def _watch(self):
+        period = max(self.threshold / 2, 0.01)
+        while not self._stop.wait(period):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue >= self.threshold / 2 and self._stall_label is None:
+                self._stall_label = self._sample_label()
+
+    def _sample_label(self) -> str | None:
+        """Plocka ut handler och blockerande funktion ur loop-trådens stack."""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        innermost = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+        ours = []
+        while frame is not None:
+            if frame.f_code.co_filename == __file__:
+                ours.append(frame.f_code.co_name)
+            frame = frame.f_back
+        if not ours:
+            return innermost
+
+        handler, blocker = ours[-1], ours[0]
+        task = asyncio.current_task(self._loop)
+        task_name = task.get_name() if task is not None else ""
+        if task_name.startswith("followup:"):
+            handler = task_name
+        return handler if handler == blocker else f"{handler} › {blocker}"
+
+    def top_offenders(self, n: int | None = None) -> list[tuple[str, int, float, float]]:
+        """Rullande topplista: (label, antal, total sekunder, max sekunder), sorterad på total tid."""
+        agg: dict[str, list] = {}
+        for _, secs, label in self.blocks:
+            entry = agg.setdefault(label, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += secs
+            entry[2] = max(entry[2], secs)
+        rows = [(label, c, total, mx) for label, (c, total, mx) in agg.items()]
+        return heapq.nlargest(n or self.top_n, rows, key=lambda r: r[2])
+
+loop_monitor = LoopMonitor(LOOP_LAG_INTERVAL, LOOP_BLOCK_THRESHOLD_MS / 1000, LOOP_TOP_N)
+
+# ----------------------------
+# Views och Components
+# ----------------------------
+class RSVPView(discord.ui.View):
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="Ja, jag kommer", style=discord.ButtonStyle.success, custom_id="rsvp_yes_button")
+    @traced_interaction
+    async def yes_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        uid = interaction.user.id
+        if uid in rsvp_data and rsvp_data[uid]["attending"]:
+
+            rsvp_data[uid]["updated_at"] = now_utc_iso()
+
+            curr = rsvp_data.get(uid, {})
+            if curr.get("class"):
+                await interaction.response.send_message(
+                    f"✅ Du är anmäld som **{curr['class']} ({curr.get('role','?')})**.\n"
+                    f"Vill du ändra? Välj ny roll:",
+                    view=RoleSelectView(curr["class"]),
+                    ephemeral=True,
+                )
+            else:
+                await interaction.response.send_message(
+                    "✅ Du har redan RSVP:at. Vill du ändra? Välj ny klass/roll:",
+                    view=ClassSelectView(),
+                    ephemeral=True,
+                )
+
+            run_after_ack("rsvp_yes_button", save_rsvp_data, lambda: update_all_event_summaries(interaction.client))
+            return
+
+        await interaction.response.send_message("Välj din klass:", view=ClassSelectView(), ephemeral=True)
 
     @discord.ui.button(label="Nej, jag kommer inte", style=discord.ButtonStyle.danger, custom_id="rsvp_no_button")
+    @traced_interaction
     async def no_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         uid = interaction.user.id
+        member_names.note(interaction.user)
         rsvp_data[uid] = {
             "attending": False,
             "class": None,
             "role": None,
-            "display_name": interaction.user.display_name,
             "updated_at": now_utc_iso(),
         }
-        save_rsvp_data()
         await interaction.response.send_message("❌ Okej! Markerat att du **inte kommer**.", ephemeral=True)
-        await update_all_event_summaries(interaction.client)
+        run_after_ack("rsvp_no_button", save_rsvp_data, lambda: update_all_event_summaries(interaction.client))
 
 
 class WvWRSVPView(discord.ui.View):
@@ -846,15 +2901,13 @@ class WvWRSVPView(discord.ui.View):
         self.event_id = event_id
 
     @discord.ui.button(label="Ja, jag kommer", style=discord.ButtonStyle.success, custom_id="wvw_rsvp_yes_button")
+    @traced_interaction
     async def yes_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         uid = interaction.user.id
         event_data = wvw_rsvp_data.get(self.event_id, {})
         if uid in event_data and event_data[uid]["attending"]:
-
-            event_data[uid]["updated_at"] = now_utc_iso()
-            save_wvw_rsvp_data()
-
-            curr = event_data.get(uid, {})
+            # Bara en fråga om byte – posten skrivs först när ny klass/spec/roll bekräftas
+            curr = event_data[uid]
             klass = curr.get("class") or "Okänd klass"
             spec = curr.get("elite_spec") or "okänd spec"
             role = curr.get("wvw_role") or "okänd roll"
@@ -865,26 +2918,34 @@ class WvWRSVPView(discord.ui.View):
                 view=WvWClassSelectView(self.event_id),
                 ephemeral=True,
             )
-            await update_wvw_summary(interaction.client, self.event_id)
+            return
+
+        build = last_build(uid)
+        if build:
+            await interaction.response.send_message(
+                f"Samma som förra gången (**{build['class']} - {build['elite_spec']}**, {build['wvw_role']})? "
+                "Eller välj klass → spec → roll:",
+                view=WvWQuickSignupView(self.event_id, build),
+                ephemeral=True,
+            )
             return
 
         await interaction.response.send_message("Välj din klass:", view=WvWClassSelectView(self.event_id), ephemeral=True)
 
     @discord.ui.button(label="Nej, jag kommer inte", style=discord.ButtonStyle.danger, custom_id="wvw_rsvp_no_button")
+    @traced_interaction
     async def no_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         uid = interaction.user.id
-        event_data = wvw_rsvp_data.setdefault(self.event_id, {})
-        event_data[uid] = {
+        member_names.note(interaction.user)
+        set_wvw_rsvp(self.event_id, uid, {
             "attending": False,
             "class": None,
             "elite_spec": None,
             "wvw_role": None,
-            "display_name": interaction.user.display_name,
             "updated_at": now_utc_iso(),
-        }
-        save_wvw_rsvp_data()
+        })
         await interaction.response.send_message("❌ Okej! Markerat att du **inte kommer**.", ephemeral=True)
-        await update_wvw_summary(interaction.client, self.event_id)
+        run_after_ack("wvw_rsvp_no_button", save_wvw_rsvp_data, lambda: update_wvw_summary(interaction.client, self.event_id))
 
 # Legacy Views
 class ClassSelectView(discord.ui.View):
@@ -896,6 +2957,7 @@ class ClassSelectView(discord.ui.View):
         options=[discord.SelectOption(label=cls, value=cls) for cls in CLASSES],
         custom_id="gw2_class_select",
     )
+    @traced_interaction
     async def class_select(self, interaction: discord.Interaction, select: discord.ui.Select):
         await interaction.response.send_message("Välj din roll:", view=RoleSelectView(select.values[0]), ephemeral=True)
 
@@ -910,21 +2972,21 @@ class RoleSelectView(discord.ui.View):
         options=[discord.SelectOption(label=r, value=r) for r in ROLES],
         custom_id="gw2_role_select",
     )
+    @traced_interaction
     async def role_select(self, interaction: discord.Interaction, select: discord.ui.Select):
         uid = interaction.user.id
         selected_role = select.values[0]
+        member_names.note(interaction.user)
         rsvp_data[uid] = {
             "attending": True,
             "class": self.selected_class,
             "role": selected_role,
-            "display_name": interaction.user.display_name,
             "updated_at": now_utc_iso(),
         }
-        save_rsvp_data()
         await interaction.response.send_message(
             f"✅ Du kommer som **{self.selected_class} ({selected_role})** – tack för svaret!", ephemeral=True
         )
-        await update_all_event_summaries(interaction.client)
+        run_after_ack("gw2_role_select", save_rsvp_data, lambda: update_all_event_summaries(interaction.client))
 
 # WvW Views
 class WvWClassSelectView(discord.ui.View):
@@ -937,6 +2999,7 @@ class WvWClassSelectView(discord.ui.View):
         options=[discord.SelectOption(label=cls, value=cls) for cls in CLASSES],
         custom_id="wvw_class_select",
     )
+    @traced_interaction
     async def class_select(self, interaction: discord.Interaction, select: discord.ui.Select):
         await interaction.response.defer(ephemeral=True)
         await interaction.followup.send(
@@ -945,6 +3008,39 @@ class WvWClassSelectView(discord.ui.View):
             ephemeral=True,
         )
 
+class SameBuildButton(discord.ui.Button):
+    """Ett klick: anmäl med senaste klass/spec/roll."""
+    def __init__(self, event_id: str, build: dict):
+        super().__init__(label="Samma som förra gången", style=discord.ButtonStyle.success, row=1)
+        self.event_id = event_id
+        self.build = build
+
+    @traced_interaction
+    async def callback(self, interaction: discord.Interaction):
+        annotate_trace(event_id=self.event_id)
+        uid = interaction.user.id
+        klass, spec, role = self.build["class"], self.build["elite_spec"], self.build["wvw_role"]
+        member_names.note(interaction.user)
+        set_wvw_rsvp(self.event_id, uid, {
+            "attending": True,
+            "class": klass,
+            "elite_spec": spec,
+            "wvw_role": role,
+            "updated_at": now_utc_iso(),
+        })
+        meta = get_spec_meta(klass, spec)
+        await interaction.response.edit_message(
+            content=f"✅ Du kommer som **{klass} - {spec}** (Tier {meta['tier']}) med roll **{role}** – tack!",
+            view=None,
+        )
+        run_after_ack("wvw_same_build", save_wvw_rsvp_data, lambda: update_wvw_summary(interaction.client, self.event_id))
+
+class WvWQuickSignupView(WvWClassSelectView):
+    """Klassväljaren plus en knapp för att återanvända senaste bygget."""
+    def __init__(self, event_id: str, build: dict):
+        super().__init__(event_id)
+        self.add_item(SameBuildButton(event_id, build))
+
 class WvWEliteSpecSelectView(discord.ui.View):
     def __init__(self, event_id: str, selected_class: str):
         super().__init__(timeout=300)
@@ -962,7 +3058,9 @@ class WvWEliteSpecSelectView(discord.ui.View):
             custom_id="wvw_elite_spec_select",
         )
 
+        @traced_interaction
         async def _on_select(interaction: discord.Interaction):
+            annotate_trace(event_id=self.event_id)
             await interaction.response.defer(ephemeral=True)
             selected_spec = self.select.values[0]
             meta = get_spec_meta(self.selected_class, selected_spec)
@@ -996,20 +3094,19 @@ class RoleChoiceButton(discord.ui.Button):
         self.event_id = event_id
         self.klass, self.spec, self.role = klass, spec, role
 
+    @traced_interaction
     async def callback(self, interaction: discord.Interaction):
         uid = interaction.user.id
-        event_data = wvw_rsvp_data.setdefault(self.event_id, {})
-        event_data[uid] = {
+        member_names.note(interaction.user)
+        set_wvw_rsvp(self.event_id, uid, {
             "attending": True,
             "class": self.klass,
             "elite_spec": self.spec,
             "wvw_role": self.role,
-            "display_name": interaction.user.display_name,
             "updated_at": now_utc_iso(),
-        }
-        save_wvw_rsvp_data()
+        })
         await interaction.response.edit_message(content=f"✅ Tack! Bytte roll till **{self.role}**.", view=None)
-        await update_wvw_summary(interaction.client, self.event_id)
+        run_after_ack("role_choice", save_wvw_rsvp_data, lambda: update_wvw_summary(interaction.client, self.event_id))
 
 class ProceedButton(discord.ui.Button):
     def __init__(self, event_id: str, klass, spec, role, label):
@@ -1017,20 +3114,19 @@ class ProceedButton(discord.ui.Button):
         self.event_id = event_id
         self.klass, self.spec, self.role = klass, spec, role
 
+    @traced_interaction
     async def callback(self, interaction: discord.Interaction):
         uid = interaction.user.id
-        event_data = wvw_rsvp_data.setdefault(self.event_id, {})
-        event_data[uid] = {
+        member_names.note(interaction.user)
+        set_wvw_rsvp(self.event_id, uid, {
             "attending": True,
             "class": self.klass,
             "elite_spec": self.spec,
             "wvw_role": self.role,
-            "display_name": interaction.user.display_name,
             "updated_at": now_utc_iso(),
-        }
-        save_wvw_rsvp_data()
+        })
         await interaction.response.edit_message(content=f"👍 Okej! Behåller **{self.role}**.", view=None)
-        await update_wvw_summary(interaction.client, self.event_id)
+        run_after_ack("role_proceed", save_wvw_rsvp_data, lambda: update_wvw_summary(interaction.client, self.event_id))
 
 class WvWRoleSelectView(discord.ui.View):
     """Rollväljare som bara visar roller tillåtna för vald klass/spec."""
@@ -1050,10 +3146,12 @@ class WvWRoleSelectView(discord.ui.View):
             custom_id="wvw_role_select",
         )
 
+        @traced_interaction
         async def _on_select(interaction: discord.Interaction):
+            annotate_trace(event_id=self.event_id)
             uid = interaction.user.id
             chosen_role = self.select.values[0]
-            event_data = wvw_rsvp_data.setdefault(self.event_id, {})
+            event_data = wvw_rsvp_data.get(self.event_id, {})
 
             if chosen_role not in self.allowed_roles:
                 await interaction.response.send_message(
@@ -1090,15 +3188,14 @@ class WvWRoleSelectView(discord.ui.View):
                 )
                 return
 
-            event_data[uid] = {
+            member_names.note(interaction.user)
+            set_wvw_rsvp(self.event_id, uid, {
                 "attending": True,
                 "class": self.selected_class,
                 "elite_spec": self.selected_spec,
                 "wvw_role": chosen_role,
-                "display_name": interaction.user.display_name,
                 "updated_at": now_utc_iso(),
-            }
-            save_wvw_rsvp_data()
+            })
 
             meta_now = get_spec_meta(self.selected_class, self.selected_spec)
             await interaction.response.send_message(
@@ -1106,7 +3203,7 @@ class WvWRoleSelectView(discord.ui.View):
                 f"(Tier {meta_now['tier']}) med roll **{chosen_role}** – tack!",
                 ephemeral=True,
             )
-            await update_wvw_summary(interaction.client, self.event_id)
+            run_after_ack("wvw_role_select", save_wvw_rsvp_data, lambda: update_wvw_summary(interaction.client, self.event_id))
 
         self.select.callback = _on_select
         self.add_item(self.select)
@@ -1114,16 +3211,21 @@ class WvWRoleSelectView(discord.ui.View):
 # ----------------------------
 # Sammanställning
 # ----------------------------
+@traced
 async def update_all_event_summaries(client: commands.Bot):
     """Uppdatera alla event-sammanfattningar i alla kanaler"""
     global event_summary_channels
     
     channels_to_update = list(event_summary_channels.items())
+    if channels_to_update:
+        await member_names.hydrate(rsvp_data.keys())
     
     for channel_id, message_id in channels_to_update:
         try:
-            channel = client.get_channel(int(channel_id)) or await client.fetch_channel(int(channel_id))
-            message = await channel.fetch_message(message_id)
+            with trace_span("fetch_channel", channel_id=channel_id):
+                channel = client.get_channel(int(channel_id)) or await client.fetch_channel(int(channel_id))
+            with trace_span("fetch_message", channel_id=channel_id, message_id=message_id):
+                message = await channel.fetch_message(message_id)
         except discord.NotFound:
             if channel_id in event_summary_channels:
                 del event_summary_channels[channel_id]
@@ -1135,7 +3237,7 @@ async def update_all_event_summaries(client: commands.Bot):
 
         attending, not_attending = [], []
         for uid, data in rsvp_data.items():
-            name = data.get("display_name", f"<@{uid}>")
+            name = member_name(uid)
             if data["attending"]:
                 attending.append(f"- {name} — {data['class']} ({data['role']})")
             else:
@@ -1146,10 +3248,12 @@ async def update_all_event_summaries(client: commands.Bot):
         embed.add_field(name="❌ Nej:", value="\n".join(not_attending) if not_attending else "-", inline=False)
 
         try:
-            await message.edit(embed=embed)
+            with trace_span("edit", channel_id=channel_id, message_id=message_id):
+                await message.edit(embed=embed)
         except Exception as e:
             logger.error(f"Fel vid uppdatering av sammanfattningsmeddelande för kanal {channel_id}: {e}")
 
+@traced
 async def update_wvw_summary(client: commands.Bot, event_id: str):
     """Uppdatera WvW-sammanfattning för ett specifikt event"""
     event_data = wvw_rsvp_data.get(event_id, {})
@@ -1159,13 +3263,17 @@ async def update_wvw_summary(client: commands.Bot, event_id: str):
     for channel_key, info in wvw_summary_channels.items():
         if info.get("event_id") == event_id:
             channels_to_update.append((channel_key, info["message_id"]))
+    if channels_to_update:
+        await member_names.hydrate(event_data.keys())
     
     for channel_key, message_id in channels_to_update:
         try:
             # Extrahera channel_id från channel_key
             channel_id = channel_key.split('_')[0]
-            channel = client.get_channel(int(channel_id)) or await client.fetch_channel(int(channel_id))
-            message = await channel.fetch_message(message_id)
+            with trace_span("fetch_channel", channel_id=channel_id):
+                channel = client.get_channel(int(channel_id)) or await client.fetch_channel(int(channel_id))
+            with trace_span("fetch_message", channel_id=channel_id, message_id=message_id):
+                message = await channel.fetch_message(message_id)
         except discord.NotFound:
             if channel_key in wvw_summary_channels:
                 del wvw_summary_channels[channel_key]
@@ -1177,7 +3285,7 @@ async def update_wvw_summary(client: commands.Bot, event_id: str):
 
         attending, not_attending = [], []
         for uid, data in event_data.items():
-            name = data.get("display_name", f"<@{uid}>")
+            name = member_name(uid)
             if data["attending"]:
 
                 klass = data.get("class", "Okänd klass")
@@ -1193,10 +3301,475 @@ async def update_wvw_summary(client: commands.Bot, event_id: str):
         embed.add_field(name="❌ Nej:", value="\n".join(not_attending) if not_attending else "-", inline=False)
 
         try:
-            await message.edit(embed=embed)
+            with trace_span("edit", channel_id=channel_key, message_id=message_id):
+                await message.edit(embed=embed)
         except Exception as e:
             logger.error(f"Fel vid uppdatering av WvW sammanfattningsmeddelande för kanal {channel_key}: {e}")
 
+    schedule_squad_board_refresh(client, event_id)
+
+# ----------------------------
+# Live squad-tavla
+# ----------------------------
+_board_refresh_tasks: dict[str, asyncio.Task] = {}  # event_id -> väntande omritning
+_board_layouts: dict[str, str] = {}  # channel_key -> hash av senast ritade layout
+
+def _squad_layout_hash(commander, squads, overflow, reason) -> str:
+    layout = (
+        commander[0] if commander else None,
+        [[(label, uid) for label, uid, _ in squad] for squad in squads],
+        [uid for uid, _ in overflow],
+        reason.get("message", ""),
+    )
+    return hashlib.sha1(json.dumps(layout).encode()).hexdigest()
+
+def schedule_squad_board_refresh(client: commands.Bot, event_id: str):
+    """Rita om eventets squad-tavlor efter SQUAD_BOARD_COALESCE_SECONDS; fler ändringar under tiden slås ihop."""
+    if event_id in _board_refresh_tasks:
+        return
+    if not any(info.get("event_id") == event_id for info in wvw_squad_boards.values()):
+        return
+
+    async def _delayed():
+        try:
+            await asyncio.sleep(SQUAD_BOARD_COALESCE_SECONDS)
+        finally:
+            _board_refresh_tasks.pop(event_id, None)
+        await refresh_squad_boards(client, event_id)
+
+    _board_refresh_tasks[event_id] = run_after_ack(f"squad_board:{event_id[:8]}", _delayed)
+
+async def delete_squad_boards(client: commands.Bot, channel_id: str | None = None) -> int:
+    """Ta bort squad-tavlor (i en kanal, eller alla) och avregistrera dem. Returnerar antal."""
+    keys = [k for k in wvw_squad_boards if channel_id is None or k.split('_')[0] == channel_id]
+    for channel_key in keys:
+        info = wvw_squad_boards.pop(channel_key)
+        _board_layouts.pop(channel_key, None)
+        try:
+            cid = channel_key.split('_')[0]
+            channel = client.get_channel(int(cid)) or await client.fetch_channel(int(cid))
+            await channel.get_partial_message(info["message_id"]).delete()
+        except Exception as e:
+            logger.warning(f"Misslyckades ta bort squad-tavla i kanal {channel_key}: {e}")
+    return len(keys)
+
+@traced
+async def refresh_squad_boards(client: commands.Bot, event_id: str):
+    """Rita om squad-tavlorna för ett event, men bara de vars layout faktiskt ändrats."""
+    boards = [(key, info["message_id"]) for key, info in wvw_squad_boards.items() if info.get("event_id") == event_id]
+    if not boards or event_id not in wvw_rsvp_data:
+        return
+
+    layout = _squad_layout_hash(*await display_squads(event_id))
+    stale = [(key, message_id) for key, message_id in boards if _board_layouts.get(key) != layout]
+    if not stale:
+        return
+    embed = await squad_analysis_embed(event_id)
+
+    for channel_key, message_id in stale:
+        try:
+            channel_id = channel_key.split('_')[0]
+            with trace_span("fetch_channel", channel_id=channel_id):
+                channel = client.get_channel(int(channel_id)) or await client.fetch_channel(int(channel_id))
+            message = channel.get_partial_message(message_id)
+            with trace_span("edit", channel_id=channel_key, message_id=message_id):
+                await message.edit(content=None, embed=embed)
+            _board_layouts[channel_key] = layout
+        except discord.NotFound:
+            wvw_squad_boards.pop(channel_key, None)
+            _board_layouts.pop(channel_key, None)
+            save_summary_channels()
+        except Exception as e:
+            logger.error(f"Fel vid uppdatering av squad-tavla för kanal {channel_key}: {e}")
+
+# ----------------------------
+# Påminnelser (en schemaläggarloop över en prioritetskö)
+# ----------------------------
+_OFFSET_UNITS = {"d": 86400, "h": 3600, "m": 60, "min": 60}
+
+def parse_reminder_offsets(text: str) -> list[int]:
+    """"24h,1h,10m" -> [86400, 3600, 600] (sekunder före start, störst först)."""
+    offsets = set()
+    for part in text.replace(" ", "").lower().split(","):
+        if not part:
+            continue
+        number = part.rstrip("dhmin")
+        unit = part[len(number):]
+        if not number.isdigit() or unit not in _OFFSET_UNITS or int(number) <= 0:
+            raise ValueError(f"Ogiltig påminnelse '{part}' (använd t.ex. 24h, 1h, 10m).")
+        offsets.add(int(number) * _OFFSET_UNITS[unit])
+    return sorted(offsets, reverse=True)
+
+def _event_tz() -> datetime.tzinfo:
+    try:
+        return ZoneInfo(EVENT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return datetime.timezone.utc
+
+def parse_start_time(text: str) -> datetime.datetime:
+    """"YYYY-MM-DD HH:MM" i EVENT_TIMEZONE (eller ISO med zon) -> UTC."""
+    dt = datetime.datetime.fromisoformat(text.strip().replace(" ", "T", 1))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=_event_tz())
+    return dt.astimezone(datetime.timezone.utc)
+
+def format_offset(seconds: int) -> str:
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    parts = [f"{days} d" if days else "", f"{hours} h" if hours else "", f"{rest // 60} min" if rest >= 60 else ""]
+    return " ".join(p for p in parts if p)
+
+def load_reminders():
+    global event_reminders
+    event_reminders = {}
+    if os.path.exists(REMINDERS_FILE):
+        try:
+            with open(REMINDERS_FILE, "r", encoding="utf-8") as f:
+                event_reminders = json.load(f)
+        except Exception as e:
+            logger.error(f"Fel vid laddning av påminnelser: {e}")
+    reminder_scheduler.rebuild()
+
+@traced
+def save_reminders():
+    try:
+        with open(REMINDERS_FILE, "w", encoding="utf-8") as f:
+            json.dump(event_reminders, f, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Fel vid sparande av påminnelser: {e}")
+
+def schedule_event_reminders(key: str, name: str, start: datetime.datetime, offsets: list[int]):
+    """Sätt (eller ersätt) ett events starttid och påminnelser."""
+    event_reminders[key] = {"name": name, "start": start.isoformat(), "offsets": offsets, "sent": []}
+    reminder_scheduler.push_schedule(key)
+    reminder_scheduler.request_save()
+
+def cancel_event_reminders(key: str):
+    # Köposterna ligger kvar och hoppas över när de kommer upp (lat borttagning)
+    if event_reminders.pop(key, None) is not None:
+        reminder_scheduler.request_save()
+
+def _reminder_channel_ids(key: str) -> list[int]:
+    if key == "event":
+        return [int(cid) for cid in event_summary_channels]
+    event_id = key.removeprefix("wvw:")
+    return [int(k.split("_")[0]) for k, info in wvw_summary_channels.items() if info.get("event_id") == event_id]
+
+def _reminder_attending(key: str) -> int:
+    if key == "event":
+        return sum(1 for d in rsvp_data.values() if d.get("attending"))
+    return wvw_attending_counts.get(key.removeprefix("wvw:"), 0)
+
+async def send_event_reminder(client: commands.Bot, key: str, schedule: dict, offset: int):
+    start_ts = int(parse_iso(schedule["start"]).timestamp())
+    text = (f"⏰ **{schedule['name']}** börjar om {format_offset(offset)} (<t:{start_ts}:t>, <t:{start_ts}:R>) – "
+            f"{_reminder_attending(key)} anmälda.")
+    for channel_id in _reminder_channel_ids(key):
+        try:
+            channel = client.get_channel(channel_id) or await client.fetch_channel(channel_id)
+            await channel.send(text)
+        except Exception as e:
+            logger.warning(f"Kunde inte skicka påminnelse i kanal {channel_id}: {e}")
+
+class ReminderScheduler:
+    """
+    En enda task som sover tills nästa påminnelse i en min-heap [(due, seq, key, offset, start)].
+    Kön byggs från event_reminders (som sparas i REMINDERS_FILE) vid start; skickade
+    offsets markeras i "sent" så inget skickas två gånger efter en omstart. Nya
+    påminnelser före köns första väcker loopen, så den alltid sover exakt till nästa.
+    Ändringar sparas av loopen, en gång per varv oavsett hur många som gjorts.
+    """
+    def __init__(self):
+        self._heap: list[tuple[float, int, str, int, str]] = []
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._client: commands.Bot | None = None
+        self._dirty = False
+        self.fired = 0
+        self.max_lag = 0.0
+
+    def rebuild(self):
+        now = time.time()
+        self._heap = []
+        for key in event_reminders:
+            self._heap.extend(self._entries(key, now))
+        heapq.heapify(self._heap)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _entries(self, key: str, now: float):
+        schedule = event_reminders[key]
+        start = parse_iso(schedule["start"]).timestamp()
+        for offset in schedule["offsets"]:
+            due = start - offset
+            if offset not in schedule["sent"] and due > now - REMINDER_GRACE_SECONDS:
+                yield (due, next(self._seq), key, offset, schedule["start"])
+
+    def push_schedule(self, key: str):
+        head = self._heap[0][0] if self._heap else None
+        for entry in self._entries(key, time.time()):
+            heapq.heappush(self._heap, entry)
+        if self._wakeup is not None and self._heap and (head is None or self._heap[0][0] < head):
+            self._wakeup.set()
+
+    def request_save(self):
+        if self._task is None:
+            save_reminders()  # ingen loop igång (t.ex. vid laddning) – spara direkt
+            return
+        self._dirty = True
+        self._wakeup.set()
+
+    def start(self, client: commands.Bot):
+        if self._task is not None:
+            return
+        self._client = client
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="reminder-scheduler")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._dirty:
+            self._dirty = False
+            save_reminders()
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def _pop_due(self, now: float) -> list[tuple[str, dict, int]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, _, key, offset, start = heapq.heappop(self._heap)
+            schedule = event_reminders.get(key)
+            if schedule is None or schedule["start"] != start or offset not in schedule["offsets"] or offset in schedule["sent"]:
+                continue  # avbokad, eller ersatt av ett schema med annan starttid
+            if now - when > REMINDER_GRACE_SECONDS:
+                schedule["sent"].append(offset)  # för gammal för att vara meningsfull
+                continue
+            schedule["sent"].append(offset)
+            self.max_lag = max(self.max_lag, now - when)
+            due.append((key, schedule, offset))
+        return due
+
+    async def _run(self):
+        while True:
+            due = self._pop_due(time.time())
+            if due or self._dirty:
+                self._dirty = False
+                save_reminders()
+            if due:
+                for key, schedule, offset in due:
+                    self.fired += 1
+                    # Egen task per påminnelse så långsamma Discord-anrop inte försenar nästa
+                    run_after_ack(f"reminder:{key}", lambda k=key, s=schedule, o=offset: send_event_reminder(self._client, k, s, o))
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+reminder_scheduler = ReminderScheduler()
+
+def _parse_schedule_args(start_time: str | None, reminders: str | None) -> tuple[datetime.datetime | None, list[int]]:
+    """Validera start_time/reminders från ett kommando. Kastar ValueError med ett visningsbart fel."""
+    if not start_time:
+        if reminders:
+            raise ValueError("Påminnelser kräver en starttid.")
+        return None, []
+    try:
+        start = parse_start_time(start_time)
+    except ValueError:
+        raise ValueError("Starttid anges som `YYYY-MM-DD HH:MM`.")
+    if start <= now_utc():
+        raise ValueError("Starttiden har redan passerat.")
+    return start, parse_reminder_offsets(reminders or REMINDER_OFFSETS)
+
+def _schedule_summary(start: datetime.datetime | None, offsets: list[int]) -> str:
+    if start is None:
+        return ""
+    ts = int(start.timestamp())
+    return f"\n⏰ Start <t:{ts}:f> · påminnelser {', '.join(format_offset(o) for o in offsets) or '–'} före."
+
+# ----------------------------
+# DM-utskick till anmälda (begränsad parallellism, backoff, minne för stängda DMs)
+# ----------------------------
+def load_dm_status():
+    global dm_channels, dm_closed
+    dm_channels, dm_closed = {}, {}
+    if os.path.exists(DM_STATUS_FILE):
+        try:
+            with open(DM_STATUS_FILE, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+            dm_channels = {int(uid): cid for uid, cid in loaded.get("channels", {}).items()}
+            dm_closed = {int(uid): ts for uid, ts in loaded.get("closed", {}).items()}
+        except Exception as e:
+            logger.error(f"Fel vid laddning av DM-status: {e}")
+
+@traced
+def save_dm_status():
+    try:
+        with open(DM_STATUS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"channels": dm_channels, "closed": dm_closed}, f)
+    except Exception as e:
+        logger.error(f"Fel vid sparande av DM-status: {e}")
+
+def dm_recently_closed(uid: int) -> bool:
+    closed_at = dm_closed.get(uid)
+    if closed_at is None:
+        return False
+    return (now_utc() - parse_iso(closed_at)).total_seconds() < DM_CLOSED_RECHECK_DAYS * 86400
+
+def squad_placements(commander, squads, overflow) -> dict[int, str]:
+    """uid -> "Wing 1 · Squad 2 · Healer" (samma numrering som squad-embeden)."""
+    placements: dict[int, str] = {}
+    wing = 0
+    multi_wing = sum(1 for squad in squads if any(label == "Commander" for label, _, _ in squad)) > 1
+    for i, squad in enumerate(squads, 1):
+        if any(label == "Commander" for label, _, _ in squad):
+            wing += 1
+        prefix = f"Wing {wing} · " if multi_wing and wing else ""
+        for label, uid, _ in squad:
+            placements[uid] = f"{prefix}Squad {i} · {label}"
+    for uid, data in overflow:
+        placements[uid] = f"Reserv · {data.get('wvw_role', '?')}"
+    if commander and commander[0] not in placements:
+        placements[commander[0]] = "Commander"  # leder utan egen squad (ingen full squad än)
+    return placements
+
+class DMFanout:
+    """
+    Skickar ett DM per mottagare med DM_FANOUT_CONCURRENCY workers.
+    DM-kanaler cachas (dm_channels) så create_dm bara anropas första gången. discord.py
+    följer rate-limit-headers per route; en 429 som ändå slår igenom pausar alla workers
+    i retry_after, och 5xx/nätverksfel försöks igen med exponentiell backoff. Användare
+    med stängda DMs (50007) hoppas över och minns i DM_CLOSED_RECHECK_DAYS.
+    """
+    def __init__(self, client: commands.Bot, messages: dict[int, str], on_progress=None):
+        self.client = client
+        self.messages = messages
+        self.on_progress = on_progress
+        self.total = len(messages)
+        self.sent = self.closed = self.skipped = self.failed = self.retries = 0
+        self.started = 0.0
+        self.elapsed = 0.0
+        self._resume_at = 0.0
+        self._last_progress = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.closed + self.skipped + self.failed
+
+    def rate(self) -> float:
+        elapsed = self.elapsed or (time.monotonic() - self.started)
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.done}/{self.total} klara – ✅ {self.sent} skickade, 🔒 {self.closed} stängda DMs, "
+                f"⏭️ {self.skipped} hoppade över, ❌ {self.failed} misslyckade · {self.rate():.1f} DM/s")
+
+    async def run(self):
+        self.started = time.monotonic()
+        pending: asyncio.Queue = asyncio.Queue()
+        for uid in self.messages:
+            pending.put_nowait(uid)
+        with trace_span("dm_fanout", recipients=self.total):
+            workers = [asyncio.create_task(self._worker(pending)) for _ in range(min(DM_FANOUT_CONCURRENCY, self.total))]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                self.elapsed = time.monotonic() - self.started
+                save_dm_status()
+        await self._report(final=True)
+
+    async def _worker(self, pending: asyncio.Queue):
+        while not pending.empty():
+            uid = pending.get_nowait()
+            await self._deliver(uid)
+            await self._report()
+
+    async def _report(self, final: bool = False):
+        now = time.monotonic()
+        if self.on_progress is None or (not final and now - self._last_progress < DM_PROGRESS_SECONDS):
+            return
+        self._last_progress = now
+        try:
+            await self.on_progress(self, final)
+        except Exception as e:
+            logger.warning(f"Kunde inte rapportera DM-förlopp: {e}")
+
+    async def _channel(self, uid: int) -> discord.abc.Messageable:
+        cid = dm_channels.get(uid)
+        if cid is not None:
+            return self.client.get_partial_messageable(cid, type=discord.ChannelType.private)
+        channel = await self.client.create_dm(discord.Object(id=uid))
+        dm_channels[uid] = channel.id
+        return channel
+
+    async def _deliver(self, uid: int):
+        if dm_recently_closed(uid):
+            self.skipped += 1
+            return
+        for attempt in range(DM_FANOUT_RETRIES + 1):
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                channel = await self._channel(uid)
+                await channel.send(self.messages[uid])
+                dm_closed.pop(uid, None)
+                self.sent += 1
+                return
+            except discord.Forbidden as e:
+                if e.code == 50007:  # användaren tar inte emot DMs från botten
+                    dm_closed[uid] = now_utc().isoformat()
+                    self.closed += 1
+                else:
+                    logger.warning(f"DM till {uid} nekades: {e}")
+                    self.failed += 1
+                return
+            except discord.NotFound:
+                # Cachad kanal finns inte längre – skapa om den nästa varv
+                if dm_channels.pop(uid, None) is None:
+                    self.failed += 1
+                    return
+            except (discord.RateLimited, discord.HTTPException, ClientError, asyncio.TimeoutError) as e:
+                if attempt == DM_FANOUT_RETRIES or (isinstance(e, discord.HTTPException) and e.status < 500 and e.status != 429):
+                    logger.warning(f"DM till {uid} misslyckades: {e}")
+                    self.failed += 1
+                    return
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is None and isinstance(e, discord.HTTPException) and e.status == 429:
+                    retry_after = float(e.response.headers.get("Retry-After", 1))
+                if retry_after is not None:
+                    # Gemensam paus: alla workers delar samma gräns
+                    self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+                else:
+                    await asyncio.sleep(DM_FANOUT_BACKOFF * 2 ** attempt * (0.5 + random.random()))
+            self.retries += 1
+        self.failed += 1
+
+_dm_fanouts: dict[str, DMFanout] = {}
+
+async def wvw_dm_messages(event_id: str, text: str, include_squad: bool) -> dict[int, str]:
+    """Ett meddelande per anmäld spelare, med planerad squad om så önskas."""
+    roster = wvw_roster(event_id)
+    placements = squad_placements(*(await display_squads(event_id))[:3]) if include_squad else {}
+    event_name_local = wvw_event_names.get(event_id, f"WvW Event {event_id[:8]}")
+    messages = {}
+    for uid, d in roster.items():
+        if not d.get("attending"):
+            continue
+        lines = [f"📣 **{event_name_local}**: {text}"]
+        if include_squad:
+            lines.append(f"🛡️ Din plats: **{placements.get(uid, 'ej placerad')}**")
+        messages[uid] = "\n".join(lines)
+    return messages
+
 # ----------------------------
 # Bot Setup med auto guild sync
 # ----------------------------
@@ -1206,17 +3779,34 @@ intents.members = True
 
 GUILD_ID = os.getenv("DISCORD_GUILD_ID")
 
+def load_all_data():
+    load_member_names()  # före RSVP-filerna: nyare än namnen som äldre filer sparade per post
+    load_rsvp_data()
+    load_wvw_rsvp_data()
+    load_summary_channels()
+    load_custom_roles()
+    load_meta_overrides()
+    load_squad_templates()
+    load_event_history()
+    load_player_stats()
+    load_player_profiles()
+    load_leaderboards()
+    load_reminders()
+    load_dm_status()
+    # load_wvw_event_history() behövs inte separat, då det redan görs i load_wvw_rsvp_data()
+    replay_wvw_change_log()
+
 class Bot(commands.Bot):
     async def setup_hook(self):
         # Ladda all persistent data innan vi registrerar views
-        load_rsvp_data()
-        load_wvw_rsvp_data()
-        load_summary_channels()
-        load_custom_roles()
-        load_meta_overrides()
-        load_squad_templates()
-        load_event_history()
-        # load_wvw_event_history() behövs inte separat, då det redan görs i load_wvw_rsvp_data()
+        load_all_data()
+
+        loop_monitor.start()
+        start_cpu_pool()
+        reminder_scheduler.start(self)
+        member_names.start(self)
+        if API_PORT:
+            await start_api_server(API_PORT)
 
         # Persistent views
         self.add_view(RSVPView())
@@ -1240,12 +3830,49 @@ class Bot(commands.Bot):
         except Exception as e:
             logger.error(f"Synkfel: {e}")
 
+    async def close(self):
+        reminder_scheduler.stop()
+        member_names.stop()
+        await stop_api_server()
+        save_wvw_rsvp_data(force=True)
+        change_log.close()
+        loop_monitor.stop()
+        stop_cpu_pool()
+        await super().close()
+
 bot = Bot(command_prefix=commands.when_mentioned_or("!"), intents=intents)
 
 @bot.event
 async def on_ready():
     logger.info(f"{bot.user} är igång som Commander Livia!")
 
+# Namncachen hålls aktuell av gateway-events; bara namn som redan visas uppdateras
+@bot.listen("on_member_update")
+async def track_member_rename(before: discord.Member, after: discord.Member):
+    if before.display_name != after.display_name:
+        member_names.note_if_cached(after)
+
+@bot.listen("on_user_update")
+async def track_user_rename(before: discord.User, after: discord.User):
+    if before.display_name != after.display_name and after.id in member_names:
+        # Ett smeknamn i guilden går före det globala namnet
+        member = next((m for g in bot.guilds if (m := g.get_member(after.id)) is not None), None)
+        member_names.note(member or after)
+
+@bot.listen("on_member_join")
+async def track_member_join(member: discord.Member):
+    member_names.note_if_cached(member)
+
+@bot.listen("on_interaction")
+async def watch_interaction_ack(interaction: discord.Interaction):
+    # Autocomplete och ping kvitteras av biblioteket självt
+    if interaction.type in (
+        discord.InteractionType.component,
+        discord.InteractionType.application_command,
+        discord.InteractionType.modal_submit,
+    ):
+        await _ack_watchdog(interaction)
+
 # ----------------------------
 # Debugkommandon
 # ----------------------------
@@ -1296,6 +3923,8 @@ async def clear_commands(ctx):
 @app_commands.describe(
     action="start/add_channel/remove_channel/reset/export",
     name="Valfritt namn på eventet (endast vid start)",
+    start_time="Starttid YYYY-MM-DD HH:MM (endast vid start, valfri)",
+    reminders=f"Påminnelser före start, t.ex. 24h,1h,10m (default {REMINDER_OFFSETS})",
 )
 @app_commands.choices(
     action=[
@@ -1306,7 +3935,9 @@ async def clear_commands(ctx):
         app_commands.Choice(name="export", value="export"),
     ]
 )
-async def event_command(interaction: discord.Interaction, action: str, name: str | None = None):
+@traced_interaction
+async def event_command(interaction: discord.Interaction, action: str, name: str | None = None,
+                        start_time: str | None = None, reminders: str | None = None):
     channel_id = str(interaction.channel_id)
     
     if not interaction.user.guild_permissions.administrator:
@@ -1315,6 +3946,11 @@ async def event_command(interaction: discord.Interaction, action: str, name: str
 
     if action == "start":
         global event_name
+        try:
+            start, offsets = _parse_schedule_args(start_time, reminders)
+        except ValueError as e:
+            await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+            return
         event_name = name or "Event"
         try:
             await interaction.response.defer(ephemeral=True)
@@ -1328,7 +3964,14 @@ async def event_command(interaction: discord.Interaction, action: str, name: str
             event_summary_channels[channel_id] = summary_msg.id
             save_summary_channels()
             
-            await interaction.followup.send(f"✅ Event **{event_name}** startat! Denna kanal är nu aktiv.", ephemeral=True)
+            if start:
+                schedule_event_reminders("event", event_name, start, offsets)
+            else:
+                cancel_event_reminders("event")
+            await interaction.followup.send(
+                f"✅ Event **{event_name}** startat! Denna kanal är nu aktiv.{_schedule_summary(start, offsets)}",
+                ephemeral=True,
+            )
             await update_all_event_summaries(interaction.client)
         except Exception as e:
             logger.error(f"Fel vid start av event: {e}")
@@ -1374,13 +4017,15 @@ async def event_command(interaction: discord.Interaction, action: str, name: str
             await interaction.response.send_message("❌ Denna kanal är inte en del av något event.", ephemeral=True)
 
     elif action == "reset":
-        # Spara snapshot först
+        await interaction.response.send_message("🔄 Event-data nollställt (snapshot sparad i historiken).", ephemeral=True)
+
+        # Spara snapshot först (historiken är enda kvarvarande kopian av namnen)
+        await member_names.hydrate(rsvp_data.keys())
         archive_current_event(closed_by=interaction.user.id)
 
         rsvp_data.clear()
-        save_rsvp_data()
-        await interaction.response.send_message("🔄 Event-data nollställt (snapshot sparad i historiken).", ephemeral=True)
-        await update_all_event_summaries(interaction.client)
+        cancel_event_reminders("event")
+        run_after_ack("/event reset", save_rsvp_data, lambda: update_all_event_summaries(interaction.client))
 
     elif action == "export":
         # Samma export-logik som innan
@@ -1391,7 +4036,7 @@ async def event_command(interaction: discord.Interaction, action: str, name: str
             attending_count = sum(1 for d in rsvp_data.values() if d["attending"])
             not_attending_count = len(rsvp_data) - attending_count
             for uid, d in rsvp_data.items():
-                name_disp = d.get("display_name", "Unknown")
+                name_disp = member_names.get(uid) or "Unknown"
                 writer.writerow([
                     uid, name_disp,
                     "Yes" if d["attending"] else "No",
@@ -1412,6 +4057,7 @@ async def event_command(interaction: discord.Interaction, action: str, name: str
     name="event_clear_all",
     description="Tar bort både event och WvW-event från alla kanaler och nollställer all data (med snapshot)."
 )
+@traced_interaction
 async def event_clear_all(interaction: discord.Interaction):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message(
@@ -1425,7 +4071,8 @@ async def event_clear_all(interaction: discord.Interaction):
 
     global event_summary_channels, wvw_summary_channels
 
-    # 🔐 Spara snapshots först
+    # 🔐 Spara snapshots först (med färska namn – historiken är enda kvarvarande kopian)
+    await member_names.hydrate({*rsvp_data, *(uid for roster in wvw_rsvp_data.values() for uid in roster)})
     archive_current_event(closed_by=interaction.user.id)
     
     # Arkivera alla WvW events
@@ -1455,12 +4102,15 @@ async def event_clear_all(interaction: discord.Interaction):
         except Exception as e:
             logger.warning(f"Misslyckades ta bort WvW-sammanfattning i kanal {channel_key}: {e}")
             continue
+    await delete_squad_boards(interaction.client)
     
     # Rensa all data i minnet
     event_summary_channels.clear()
     wvw_summary_channels.clear()
     rsvp_data.clear()
-    wvw_rsvp_data.clear()
+    cancel_event_reminders("event")
+    for event_id in list(wvw_rsvp_data.keys()):
+        remove_wvw_event(event_id)
     wvw_event_names.clear()
     
     # Spara till disk
@@ -1481,7 +4131,9 @@ async def event_clear_all(interaction: discord.Interaction):
 )
 @app_commands.describe(
     action="start/remove_channel/reset/list",
-    wvw_name="Namn på WvW-eventet (vid start)"
+    wvw_name="Namn på WvW-eventet (vid start)",
+    start_time="Starttid YYYY-MM-DD HH:MM (vid start, valfri)",
+    reminders=f"Påminnelser före start, t.ex. 24h,1h,10m (default {REMINDER_OFFSETS})",
 )
 @app_commands.choices(action=[
     app_commands.Choice(name="start", value="start"),
@@ -1489,10 +4141,13 @@ async def event_clear_all(interaction: discord.Interaction):
     app_commands.Choice(name="reset", value="reset"),
     app_commands.Choice(name="list", value="list")
 ])
+@traced_interaction
 async def wvw_event(
     interaction: discord.Interaction,
     action: str,
-    wvw_name: str | None = None
+    wvw_name: str | None = None,
+    start_time: str | None = None,
+    reminders: str | None = None,
 ):
     channel_id = str(interaction.channel_id)
 
@@ -1509,11 +4164,15 @@ async def wvw_event(
         if not wvw_name:
             await interaction.followup.send("❌ Du måste ange ett namn för eventet.", ephemeral=True)
             return
+        try:
+            start, offsets = _parse_schedule_args(start_time, reminders)
+        except ValueError as e:
+            await interaction.followup.send(f"❌ {e}", ephemeral=True)
+            return
             
         event_id = str(uuid.uuid4())
         wvw_event_name = wvw_name
-        wvw_event_names[event_id] = wvw_event_name
-        wvw_rsvp_data[event_id] = {}
+        create_wvw_event(event_id, wvw_event_name)
         
         try:
             # RSVP-knappar
@@ -1533,8 +4192,10 @@ async def wvw_event(
             wvw_summary_channels[f"{channel_id}_{event_id[:8]}"] = {"message_id": summary_msg.id, "event_id": event_id}
             save_summary_channels()
 
+            if start:
+                schedule_event_reminders(f"wvw:{event_id}", wvw_event_name, start, offsets)
             await interaction.followup.send(
-                f"✅ WvW Event **{wvw_event_name}** (ID: `{event_id[:8]}`) startat!",
+                f"✅ WvW Event **{wvw_event_name}** (ID: `{event_id[:8]}`) startat!{_schedule_summary(start, offsets)}",
                 ephemeral=True
             )
             await update_wvw_summary(interaction.client, event_id)
@@ -1552,11 +4213,15 @@ async def wvw_event(
             return
             
         event_list = []
-        for eid, data in wvw_rsvp_data.items():
+        for _, eid in wvw_event_index:
             name = wvw_event_names.get(eid, f"WvW Event {eid[:8]}")
-            attending_count = sum(1 for d in data.values() if d.get("attending"))
-            total_count = len(data)
-            event_list.append(f"• `{eid[:8]}` - **{name}** ({attending_count}/{total_count} attending)")
+            attending_count = wvw_attending_counts.get(eid, 0)
+            total_count = len(wvw_rsvp_data.get(eid, {}))
+            line = f"• `{eid[:8]}` - **{name}** ({attending_count}/{total_count} attending)"
+            schedule = event_reminders.get(f"wvw:{eid}")
+            if schedule:
+                line += f" · start <t:{int(parse_iso(schedule['start']).timestamp())}:f>"
+            event_list.append(line)
             
         embed = discord.Embed(
             title="🛡️ Aktiva WvW-events",
@@ -1588,6 +4253,7 @@ async def wvw_event(
         
         for key in keys_to_remove:
             del wvw_summary_channels[key]
+        await delete_squad_boards(interaction.client, channel_id)
         
         save_summary_channels()
         
@@ -1610,10 +4276,10 @@ async def wvw_event(
             if base_channel_id == channel_id:
                 event_id = info["event_id"]
                 # snapshot före wipe
+                await member_names.hydrate(wvw_roster(event_id).keys())
                 archive_current_wvw_event(event_id, closed_by=interaction.user.id)
                 
-                if event_id in wvw_rsvp_data:
-                    wvw_rsvp_data[event_id].clear()
+                reset_wvw_event(event_id)
                 reset_events.append(wvw_event_names.get(event_id, event_id[:8]))
                 keys_to_reset.append(event_id)
         
@@ -1635,6 +4301,7 @@ async def wvw_event(
     name="wvw_event_clear_all",
     description="Tar bort WvW-eventet från alla kanaler och nollställer all data"
 )
+@traced_interaction
 async def wvw_event_clear_all(interaction: discord.Interaction):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message(
@@ -1648,6 +4315,7 @@ async def wvw_event_clear_all(interaction: discord.Interaction):
     global wvw_summary_channels
 
     # snapshot först för alla events
+    await member_names.hydrate({uid for roster in wvw_rsvp_data.values() for uid in roster})
     for event_id in list(wvw_rsvp_data.keys()):
         archive_current_wvw_event(event_id, closed_by=interaction.user.id)
 
@@ -1662,9 +4330,11 @@ async def wvw_event_clear_all(interaction: discord.Interaction):
             await msg.delete()
         except Exception as e:
             logger.warning(f"Misslyckades ta bort WvW-sammanfattning i kanal {channel_key}: {e}")
+    await delete_squad_boards(interaction.client)
 
     wvw_summary_channels.clear()
-    wvw_rsvp_data.clear()
+    for event_id in list(wvw_rsvp_data.keys()):
+        remove_wvw_event(event_id)
     wvw_event_names.clear()
 
     save_summary_channels()
@@ -1697,8 +4367,9 @@ class CustomRoleModal(discord.ui.Modal, title="Lägg till ny roll"):
         bucket = str(self.bucket).strip() or "Utility"
         if bucket not in WVW_ROLES_DISPLAY: bucket="Utility"
         custom_roles[name]=bucket
-        save_custom_roles()
+        mark_meta_changed()
         await interaction.response.send_message(f"🆕 Lagt till roll **{name}** (bucket: {bucket})",ephemeral=True)
+        run_after_ack("custom_role_modal", save_custom_roles)
 
 class AddRoleButton(discord.ui.Button):
     def __init__(self):
@@ -1717,8 +4388,9 @@ class RolesMultiSelect(discord.ui.Select):
     async def callback(self,interaction):
         vals=self.values
         meta_overrides.setdefault(self.klass,{}).setdefault(self.spec,{})['roles']=vals
-        save_meta_overrides()
+        mark_meta_changed()
         await interaction.response.send_message(f"✅ {self.klass} · {self.spec}: Roller satt till {', '.join(vals)}",ephemeral=True)
+        run_after_ack("meta_roles_select", save_meta_overrides)
 
 class TierSelect(discord.ui.Select):
     def __init__(self,klass,spec):
@@ -1728,8 +4400,9 @@ class TierSelect(discord.ui.Select):
     async def callback(self,interaction):
         val=self.values[0]
         meta_overrides.setdefault(self.klass,{}).setdefault(self.spec,{})['tier']=val
-        save_meta_overrides()
+        mark_meta_changed()
         await interaction.response.send_message(f"✅ {self.klass} · {self.spec}: Tier satt till {val}",ephemeral=True)
+        run_after_ack("meta_tier_select", save_meta_overrides)
 
 class MetaEditView(discord.ui.View):
     def __init__(self,klass,spec):
@@ -1779,32 +4452,37 @@ async def setupbuilds(interaction:discord.Interaction):
 # ----------------------------
 def _export_meta_csv_string() -> str:
     """
-    Bygger CSV över alla (klass,spec) med gällande Tier & Roles.
-    Header: Class,Spec,Tier,Roles  (Roles separerade med |)
+    Bygger CSV över alla (klass,spec) med gällande Tier, Roles & Capabilities.
+    Header: Class,Spec,Tier,Roles,Capabilities  (Roles separerade med |,
+    Capabilities som kapacitet:nivå separerade med |, t.ex. stability:3|cleanse:1)
     """
     output = io.StringIO()
     writer = csv.writer(output)
-    writer.writerow(["Class","Spec","Tier","Roles"])
+    writer.writerow(["Class","Spec","Tier","Roles","Capabilities"])
     for klass, specs in ELITE_SPECS_BASE.items():
         for spec in specs.keys():
             meta = get_spec_meta(klass, spec)
             roles_str = "|".join(meta["roles"])
-            writer.writerow([klass, spec, meta["tier"], roles_str])
+            caps = get_spec_capabilities(klass, spec)
+            caps_str = "|".join(f"{c}:{caps[c]}" for c in CAPABILITIES if caps.get(c))
+            writer.writerow([klass, spec, meta["tier"], roles_str, caps_str])
     return output.getvalue()
 
-def _apply_meta_csv_string(csv_text: str) -> tuple[int,int,list[str]]:
+def _parse_meta_csv(csv_text: str, valid_roles: list[str]) -> tuple[list[tuple[str, str, str, list[str] | None, dict | None]], int, list[str]]:
     """
-    Läser CSV och uppdaterar meta_overrides.
-    Returnerar (updated_count, skipped_count, errors)
+    Ren parsning/validering av meta-CSV (körs i CPU-poolen).
+    Returnerar (rows, skipped_count, errors) där rows = [(klass, spec, tier, roles|None, caps|None)]
     - Validerar Tier ∈ ALLOWED_TIERS
-    - Roller måste finnas i all_roles_for_select()
-    - Tomma roller ignoreras (skip)
+    - Roller måste finnas i valid_roles
+    - Capabilities (valfri kolumn): kapacitet:nivå med kapacitet ∈ CAPABILITIES, nivå 0–3.
+      Kolumnen saknas => caps=None (orört); tom cell => {} (spec saknar kapaciteter)
     """
     reader = csv.DictReader(io.StringIO(csv_text))
-    updated = 0
+    has_caps = "Capabilities" in (reader.fieldnames or [])
+    rows: list[tuple[str, str, str, list[str] | None, dict | None]] = []
     skipped = 0
     errors: list[str] = []
-    valid_roles = set(all_roles_for_select())
+    valid = set(valid_roles)
     for i, row in enumerate(reader, start=2):
         klass = (row.get("Class") or "").strip()
         spec  = (row.get("Spec") or "").strip()
@@ -1826,13 +4504,41 @@ def _apply_meta_csv_string(csv_text: str) -> tuple[int,int,list[str]]:
 
         roles = [r.strip() for r in roles_raw.split("|") if r.strip()] if roles_raw else None
         if roles is not None:
-            bad = [r for r in roles if r not in valid_roles]
+            bad = [r for r in roles if r not in valid]
             if bad:
                 skipped += 1
                 errors.append(f"Rad {i}: Ogiltiga roller {bad}.")
                 continue
 
-        # Skriv till overrides
+        caps = None
+        if has_caps:
+            caps, bad_caps = {}, []
+            for part in (row.get("Capabilities") or "").split("|"):
+                if not part.strip():
+                    continue
+                name, _, level = part.partition(":")
+                name = name.strip().lower()
+                try:
+                    value = int(level.strip() or "1")
+                except ValueError:
+                    value = -1
+                if name not in CAPABILITIES or not 0 <= value <= CAPABILITY_MAX_LEVEL:
+                    bad_caps.append(part.strip())
+                elif value:
+                    caps[name] = value
+            if bad_caps:
+                skipped += 1
+                errors.append(f"Rad {i}: Ogiltiga capabilities {bad_caps}.")
+                continue
+
+        rows.append((klass, spec, tier, roles, caps))
+    return rows, skipped, errors
+
+def _apply_meta_rows(rows: list[tuple[str, str, str, list[str] | None, dict | None]]) -> tuple[int, int]:
+    """Skriv validerade rader till meta_overrides. Returnerar (updated_count, unchanged_count)."""
+    updated = 0
+    unchanged = 0
+    for klass, spec, tier, roles, caps in rows:
         entry = meta_overrides.setdefault(klass, {}).setdefault(spec, {})
         changed = False
         if tier:
@@ -1843,14 +4549,35 @@ def _apply_meta_csv_string(csv_text: str) -> tuple[int,int,list[str]]:
             if entry.get("roles") != roles:
                 entry["roles"] = roles
                 changed = True
+        if caps is not None and caps != get_spec_capabilities(klass, spec):
+            entry["caps"] = caps
+            changed = True
 
         if changed:
             updated += 1
         else:
-            skipped += 1
+            unchanged += 1
 
+    if updated:
+        mark_meta_changed()
     save_meta_overrides()
-    return updated, skipped, errors
+    return updated, unchanged
+
+def _apply_meta_csv_string(csv_text: str) -> tuple[int,int,list[str]]:
+    """
+    Läser CSV och uppdaterar meta_overrides.
+    Returnerar (updated_count, skipped_count, errors)
+    - Tomma roller ignoreras (skip)
+    """
+    rows, skipped, errors = _parse_meta_csv(csv_text, all_roles_for_select())
+    updated, unchanged = _apply_meta_rows(rows)
+    return updated, skipped + unchanged, errors
+
+async def apply_meta_csv_offloaded(csv_text: str) -> tuple[int,int,list[str]]:
+    """Som _apply_meta_csv_string, men parsningen körs i CPU-poolen."""
+    rows, skipped, errors = await run_cpu(_parse_meta_csv, csv_text, all_roles_for_select())
+    updated, unchanged = _apply_meta_rows(rows)
+    return updated, skipped + unchanged, errors
 
 @bot.tree.command(name="meta_bulk_dm", description="DM: Få en CSV med alla builds (Tier & Roller) för snabb översikt och redigering")
 async def meta_bulk_dm(interaction: discord.Interaction):
@@ -1868,6 +4595,8 @@ async def meta_bulk_dm(interaction: discord.Interaction):
                 "**Bulk-redigering av builds**\n"
                 "1) Ladda ner CSV-filen\n"
                 "2) Redigera `Tier` (S+/S/A/B/C) och `Roles` (separera med `|`) – roller måste finnas i listan.\n"
+                f"   `Capabilities` är `kapacitet:nivå` (0–3) separerade med `|`, t.ex. `stability:3|cleanse:1`. "
+                f"Giltiga: {', '.join(CAPABILITIES)}.\n"
                 "3) Använd `/meta_bulk_import` och bifoga CSV:n för att uppdatera.\n\n"
                 "Tips: Du kan även lägga till customs med `/setupbuilds` om du behöver nya roller först."
             ),
@@ -1886,14 +4615,15 @@ async def meta_bulk_import(interaction: discord.Interaction, file: discord.Attac
     if not file.filename.lower().endswith(".csv"):
         await interaction.response.send_message("❌ Filen måste vara en .csv.", ephemeral=True)
         return
+    await interaction.response.defer(ephemeral=True)
     try:
         data = await file.read()
         text = data.decode("utf-8")
     except Exception as e:
-        await interaction.response.send_message("❌ Kunde inte läsa filen.", ephemeral=True)
+        await interaction.followup.send("❌ Kunde inte läsa filen.", ephemeral=True)
         return
 
-    updated, skipped, errors = _apply_meta_csv_string(text)
+    updated, skipped, errors = await apply_meta_csv_offloaded(text)
     msg = f"✅ Import klar. Uppdaterade: **{updated}** · Skippade: **{skipped}**"
     if errors:
         preview = "\n".join(f"- {e}" for e in errors[:8])
@@ -1901,66 +4631,118 @@ async def meta_bulk_import(interaction: discord.Interaction, file: discord.Attac
             preview += f"\n... och {len(errors)-8} fler."
         msg += f"\n\n⚠️ Fel/varningar:\n{preview}"
 
-    await interaction.response.send_message(msg, ephemeral=True)
+    await interaction.followup.send(msg, ephemeral=True)
 
 # ----------------------------
 # WvW-KOMMANDON (Analys & Stats)
 # ----------------------------
-@bot.tree.command(name="squad_analyze", description="Analys: visar balanserade squads (max 10) och vad som saknas")
-@app_commands.describe(event_id="ID för det specifika WvW-eventet (första 8 tecken)")
-async def squad_analyze(interaction: discord.Interaction, event_id: str | None = None):
-    # Hitta rätt event_id
-    target_event_id = None
-    
-    if event_id:
-        # Sök efter exakt matchning eller början med event_id
-        for eid in wvw_rsvp_data.keys():
-            if eid.startswith(event_id) or eid[:8] == event_id:
-                target_event_id = eid
-                break
-        if not target_event_id:
-            await interaction.response.send_message("❌ Ogiltigt event-ID. Använd `/wvw_event list` för att se tillgängliga events.", ephemeral=True)
-            return
-    else:
-        # Om inget event_id anges, använd första tillgängliga
-        if not wvw_rsvp_data:
-            await interaction.response.send_message("❌ Inga WvW-event aktiva.", ephemeral=True)
-            return
-        target_event_id = next(iter(wvw_rsvp_data.keys()))
-    
-    commander, squads, overflow, reason = build_squads_balanced(target_event_id)
-    event_name_local = wvw_event_names.get(target_event_id, f"WvW Event {target_event_id[:8]}")
-
-    embed = discord.Embed(title=f"🛡️ WvW Squad-analys – {event_name_local}", color=0xe74c3c)
-
-    # Commander
-    if commander:
-        uid, data = commander
-        name = data.get("display_name", f"<@{uid}>")
-        spec_info = f"{data.get('class','')} - {data.get('elite_spec','')}".strip(" -")
+EMBED_FIELD_LIMIT = 1024
+COMPACT_SQUADS_OVER = 12  # fler squads än så => en rad per squad (embeds har max 25 fält och 6000 tecken)
+
+def _fit_lines(lines: list[str], limit: int = EMBED_FIELD_LIMIT) -> str:
+    """Slå ihop rader till ett fältvärde, avkortat med "… och N till" om det inte får plats."""
+    text = "\n".join(lines)
+    if len(text) <= limit:
+        return text
+    out, used = [], 0
+    for i, line in enumerate(lines):
+        tail = f"… och {len(lines) - i} till"
+        if used + len(line) + 1 + len(tail) > limit:
+            out.append(tail)
+            break
+        out.append(line)
+        used += len(line) + 1
+    return "\n".join(out)
+
+def _chunk_lines(lines: list[str], limit: int = EMBED_FIELD_LIMIT) -> list[str]:
+    chunks, current = [], []
+    for line in lines:
+        if current and sum(len(l) + 1 for l in current) + len(line) > limit:
+            chunks.append("\n".join(current))
+            current = []
+        current.append(line[:limit])
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _render_squad_embed(event_id: str, commander, squads, overflow, reason, template_name: str | None = None) -> discord.Embed:
+    event_name_local = wvw_event_names.get(event_id, f"WvW Event {event_id[:8]}")
+    compiled = get_compiled_template(template_name)
+    squad_size = compiled["size"] if compiled else 5
+
+    title = f"🛡️ WvW Squad-analys – {event_name_local}"
+    if template_name and template_name != DEFAULT_SQUAD_TEMPLATE:
+        title += f" ({compiled['name'] if compiled and compiled['name'] else template_name})"
+    embed = discord.Embed(title=title, color=0xe74c3c)
+
+    # Wing per squad: en squad med Commander-label startar en ny wing (0 = utan wing)
+    wing_of, wing = [], 0
+    for squad in squads:
+        if any(label == "Commander" for label, _, _ in squad):
+            wing += 1
+        wing_of.append(wing)
+    multi_wing = wing > 1
+
+    # Commander(s)
+    leaders = [(uid, data) for squad in squads for label, uid, data in squad if label == "Commander"]
+    if commander and all(uid != commander[0] for uid, _ in leaders):
+        leaders.insert(0, commander)
+    if leaders:
+        lines = []
+        for w, (uid, data) in enumerate(leaders, 1):
+            name = member_name(uid)
+            spec_info = f"{data.get('class','')} - {data.get('elite_spec','')}".strip(" -")
+            prefix = f"Wing {w}: " if multi_wing else ""
+            lines.append(f"• {prefix}**{name}** — {spec_info}")
         embed.add_field(
-            name="🧭 Commander",
-            value=f"• **{name}** — {spec_info}",
+            name="🧭 Commander" if len(leaders) == 1 else f"🧭 Commanders ({len(leaders)})",
+            value=_fit_lines(lines),
             inline=False
         )
 
-    # Squads
-    if squads:
-        for i, squad in enumerate(squads, 1):
+    # Squads (med kapacitetstäckning per squad)
+    scores, gaps = squad_coverage(squads)
+    if squads and len(squads) > COMPACT_SQUADS_OVER:
+        # Kompakt: en rad per squad, ett fält per wing
+        by_wing: dict[int, list[str]] = {}
+        for i, (squad, w) in enumerate(zip(squads, wing_of), 1):
+            names = ", ".join(member_name(uid) for _, uid, data in squad)
+            by_wing.setdefault(w, []).append(f"**Squad {i}** ({len(squad)}/{squad_size}, {scores[i - 1]:.0f}%): {names}")
+        for w, lines in by_wing.items():
+            for chunk in _chunk_lines(lines):
+                embed.add_field(name=f"🛡️ Wing {w}" if w else "🛡️ Squads", value=chunk, inline=False)
+    elif squads:
+        for i, (squad, w) in enumerate(zip(squads, wing_of), 1):
             lines = []
             for label, uid, data in squad:
-                name = data.get("display_name", f"<@{uid}>")
+                name = member_name(uid)
                 spec_info = f"{data.get('class','')} - {data.get('elite_spec','')}".strip(" -")
                 lines.append(f"• {label} — **{name}** ({spec_info})")
-            embed.add_field(name=f"🛡️ Squad {i} (5/5)", value="\n".join(lines), inline=False)
+            if gaps[i - 1]:
+                lines.append(f"⚠️ Saknar: {', '.join(gaps[i - 1])}")
+            prefix = f"Wing {w} · " if multi_wing and w else ""
+            embed.add_field(
+                name=f"🛡️ {prefix}Squad {i} ({len(squad)}/{squad_size}) · Täckning {scores[i - 1]:.0f}%",
+                value=_fit_lines(lines),
+                inline=False
+            )
     else:
         embed.add_field(name="🛡️ Squads", value="_Inga kompletta squads ännu_", inline=False)
 
+    # Rangordning: svagast täckta squads först
+    if squads:
+        ranked = sorted(range(len(squads)), key=lambda k: (scores[k], k))
+        lines = [
+            f"Squad {k + 1}: **{scores[k]:.0f}%**" + (f" – saknar {', '.join(gaps[k])}" if gaps[k] else "")
+            for k in ranked[:5]
+        ]
+        embed.add_field(name="📊 Täckning (svagast först)", value=_fit_lines(lines), inline=False)
+
     # Overflow
     if overflow:
         lines = []
         for uid, data in overflow:
-            name = data.get("display_name", f"<@{uid}>")
+            name = member_name(uid)
             role = data.get("wvw_role","?")
             spec_info = f"{data.get('class','')} - {data.get('elite_spec','')}".strip(" -")
             lines.append(f"• **{name}** — {role} ({spec_info})")
@@ -1987,56 +4769,245 @@ async def squad_analyze(interaction: discord.Interaction, event_id: str | None =
                    f"Tertiary={counts.get('Tertiary Support',0)}, "
                    f"DPS={counts.get('DPS',0)}, Strip={counts.get('Strip DPS',0)}")
 
-        overflow_value = "\n".join([reason_line, summary, ""] + lines) if reason_line else "\n".join([summary, ""] + lines)
+        overflow_value = _fit_lines([reason_line, summary, ""] + lines if reason_line else [summary, ""] + lines)
         embed.add_field(name=header, value=overflow_value, inline=False)
     else:
         embed.add_field(name="📋 Overflow", value="_Ingen overflow_", inline=False)
 
-    total_attending = sum(1 for d in wvw_rsvp_data.get(target_event_id, {}).values() if d.get("attending"))
-    embed.set_footer(text=f"Totalt attending: {total_attending} | 1 global Commander | Max {MAX_SQUADS} squads")
+    total_attending = sum(1 for d in wvw_rsvp_data.get(event_id, {}).values() if d.get("attending"))
+    wings = event_wings(event_id)
+    commander_rule = "1 global Commander" if wings == 1 else f"upp till {wings} wings"
+    footer = f"Totalt attending: {total_attending} | {commander_rule} | Max {event_max_squads(event_id)} squads"
+    assignment = wvw_squad_assignments.get(event_id)
+    if assignment is not None and not (template_name and template_name != DEFAULT_SQUAD_TEMPLATE):
+        footer += f" | Flyttade vid senaste ändring: {assignment.get('moved', 0)}"
+    if "balance" in reason:
+        footer += f" | Tier-balans: spridning {reason['balance']['after']} (var {reason['balance']['before']})"
+    embed.set_footer(text=footer)
+    return embed
+
+async def squad_analysis_embed(event_id: str, rebuild: bool = False, template_name: str | None = None,
+                               balance: bool | None = None) -> discord.Embed:
+    """
+    Renderad squad-analys, cachad per (event-version, meta-version). Default-templaten
+    visar den stabila indelningen; andra templates byggs från grunden.
+    """
+    template_name = template_name or DEFAULT_SQUAD_TEMPLATE
+    if template_name == DEFAULT_SQUAD_TEMPLATE:
+        kind = "squad_embed"  # balansen är en del av den sparade indelningen
+    else:
+        balance = event_balance(event_id) if balance is None else balance
+        kind = f"squad_embed:{template_name}" + (":balance" if balance else "")
+    cached = None if rebuild else _cache_get(kind, event_id, _render_key(event_id))
+    if cached is not None:
+        return discord.Embed.from_dict(cached)
+    await member_names.hydrate(wvw_roster(event_id).keys())
+    squads = await display_squads(event_id, rebuild=rebuild, template_name=template_name, balance=balance)
+    key = _render_key(event_id)
+    embed = _render_squad_embed(event_id, *squads, template_name=template_name)
+    _cache_put(kind, event_id, key, embed.to_dict())
+    return embed
+
+def _add_no_show_field(embed: discord.Embed, sim: dict):
+    lines = [
+        f"Planerat: **{sim['planned']}** fulla squads · Förväntat: **{sim['expected']:.1f}** · "
+        f"Alla håller: **{sim['p_hold'] * 100:.0f}%** · 90% säkert: ≥**{sim['p10']}**",
+    ]
+    breakers = {role: share for role, share in sim["breakers"].items() if share > 0}
+    if breakers:
+        role, share = max(breakers.items(), key=lambda t: t[1])
+        lines.append(f"Bryter oftast på: **{role}** ({share * 100:.0f}% av scenarierna)")
+    lines.append(
+        f"Närvaro från historik för {sim['with_history']} av {sim['players']} spelare, "
+        f"övriga {(1 - NO_SHOW_DEFAULT_RATE) * 100:.0f}%"
+    )
+    embed.add_field(name=f"🎲 No-show-simulering ({sim['scenarios']} scenarier)", value="\n".join(lines), inline=False)
 
-    await interaction.response.send_message(embed=embed, ephemeral=False)
+def find_wvw_event_id(event_id: str) -> str | None:
+    """Aktivt event vars ID börjar med event_id (fullt eller förkortat)."""
+    for eid in wvw_rsvp_data.keys():
+        if eid.startswith(event_id) or eid[:8] == event_id:
+            return eid
+    return None
 
-@bot.tree.command(name="show_stats", description="Visar statistik per klass och WvW-roll")
-@app_commands.describe(event_id="ID för det specifika WvW-eventet (första 8 tecken)")
-async def show_stats(interaction: discord.Interaction, event_id: str | None = None):
-    # Hitta rätt event_id
-    target_event_id = None
-    
+async def resolve_wvw_event_id(interaction: discord.Interaction, event_id: str | None) -> str | None:
+    """Slå upp ett (förkortat) event-ID. Svarar själv med ett fel och returnerar None om det inte går."""
     if event_id:
-        # Sök efter exakt matchning eller början med event_id
-        for eid in wvw_rsvp_data.keys():
-            if eid.startswith(event_id) or eid[:8] == event_id:
-                target_event_id = eid
-                break
-        if not target_event_id:
-            await interaction.response.send_message("❌ Ogiltigt event-ID. Använd `/wvw_event list` för att se tillgängliga events.", ephemeral=True)
+        eid = find_wvw_event_id(event_id)
+        if eid:
+            return eid
+        await interaction.response.send_message("❌ Ogiltigt event-ID. Använd `/wvw_event list` för att se tillgängliga events.", ephemeral=True)
+        return None
+    if not wvw_rsvp_data:
+        await interaction.response.send_message("❌ Inga WvW-event aktiva.", ephemeral=True)
+        return None
+    if len(wvw_rsvp_data) > 1:
+        await interaction.response.send_message("❌ Flera WvW-event är aktiva – välj ett i `event_id`.", ephemeral=True)
+        return None
+    return next(iter(wvw_rsvp_data.keys()))
+
+async def wvw_event_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    current = current.lower().strip()
+    choices = []
+    for name_lower, eid in wvw_event_index:
+        if current and current not in name_lower and not eid.startswith(current):
+            continue
+        name = wvw_event_names.get(eid, f"WvW Event {eid[:8]}")
+        label = f"{name} · {eid[:8]} · {wvw_attending_counts.get(eid, 0)} anmälda"
+        choices.append(app_commands.Choice(name=label[:100], value=eid[:8]))
+        if len(choices) == 25:
+            break
+    return choices
+
+async def squad_template_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    current = current.lower()
+    return [
+        app_commands.Choice(name=f"{key} – {tpl.get('name', key)}"[:100], value=key)
+        for key, tpl in squad_templates.items()
+        if current in key.lower() or current in tpl.get("name", "").lower()
+    ][:25]
+
+@bot.tree.command(name="squad_analyze", description="Analys: visar balanserade squads och vad som saknas")
+@app_commands.describe(
+    event_id="ID för det specifika WvW-eventet (första 8 tecken)",
+    rebuild="(Admin) Bygg om indelningen från grunden istället för att behålla platserna",
+    template="Squad-template att bygga efter (default: den stabila indelningen)",
+    balance="Jämna ut tier-styrkan mellan squads när indelningen byggs (default: eventets inställning)",
+    simulate="Simulera no-shows: hur många squads håller om inte alla dyker upp",
+)
+@app_commands.autocomplete(template=squad_template_autocomplete, event_id=wvw_event_autocomplete)
+@traced_interaction
+async def squad_analyze(interaction: discord.Interaction, event_id: str | None = None, rebuild: bool = False,
+                        template: str | None = None, balance: bool | None = None, simulate: bool = False):
+    if rebuild and not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("🚫 Endast admins kan bygga om indelningen.", ephemeral=True)
+        return
+    if template and get_compiled_template(template) is None:
+        names = ", ".join(f"`{k}`" for k in squad_templates)
+        await interaction.response.send_message(f"❌ Okänd eller ogiltig template. Tillgängliga: {names}", ephemeral=True)
+        return
+
+    target_event_id = await resolve_wvw_event_id(interaction, event_id)
+    if not target_event_id:
+        return
+
+    # Bygget kan ta tid (körs i CPU-poolen) – kvittera först
+    await interaction.response.defer()
+    embed = await squad_analysis_embed(target_event_id, rebuild=rebuild, template_name=template, balance=balance)
+    if simulate:
+        _add_no_show_field(embed, await simulate_no_shows(target_event_id))
+    if rebuild:
+        save_wvw_rsvp_data()
+        schedule_squad_board_refresh(interaction.client, target_event_id)
+    await interaction.followup.send(embed=embed)
+
+@bot.tree.command(name="squad_board", description="(Admin) Live squad-tavla i denna kanal som uppdateras vid nya anmälningar")
+@app_commands.describe(action="add/remove", event_id="ID för det specifika WvW-eventet (första 8 tecken)")
+@app_commands.choices(action=[
+    app_commands.Choice(name="add", value="add"),
+    app_commands.Choice(name="remove", value="remove"),
+])
+@app_commands.autocomplete(event_id=wvw_event_autocomplete)
+@traced_interaction
+async def squad_board(interaction: discord.Interaction, action: str, event_id: str | None = None):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("🚫 Du har inte behörighet att använda detta kommando.", ephemeral=True)
+        return
+
+    target_event_id = await resolve_wvw_event_id(interaction, event_id)
+    if not target_event_id:
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    board_key = f"{interaction.channel_id}_{target_event_id[:8]}"
+    event_name_local = wvw_event_names.get(target_event_id, f"WvW Event {target_event_id[:8]}")
+
+    if action == "add":
+        if board_key in wvw_squad_boards:
+            await interaction.followup.send("ℹ️ Det finns redan en squad-tavla för eventet i denna kanal.", ephemeral=True)
             return
-    else:
-        # Om inget event_id anges, använd första tillgängliga
-        if not wvw_rsvp_data:
-            await interaction.response.send_message("❌ Inga WvW-event aktiva.", ephemeral=True)
+        try:
+            board_msg = await interaction.channel.send(embed=await squad_analysis_embed(target_event_id))
+        except Exception as e:
+            logger.error(f"Fel vid skapande av squad-tavla: {e}")
+            await interaction.followup.send("❌ Kunde inte skapa squad-tavlan.", ephemeral=True)
             return
-        target_event_id = next(iter(wvw_rsvp_data.keys()))
-        
-    event_data = wvw_rsvp_data[target_event_id]
+        wvw_squad_boards[board_key] = {"message_id": board_msg.id, "event_id": target_event_id}
+        _board_layouts[board_key] = _squad_layout_hash(*await display_squads(target_event_id))
+        save_summary_channels()
+        await interaction.followup.send(f"✅ Live squad-tavla för **{event_name_local}** skapad.", ephemeral=True)
+
+    elif action == "remove":
+        info = wvw_squad_boards.pop(board_key, None)
+        _board_layouts.pop(board_key, None)
+        if not info:
+            await interaction.followup.send("❌ Ingen squad-tavla för eventet i denna kanal.", ephemeral=True)
+            return
+        save_summary_channels()
+        try:
+            await interaction.channel.get_partial_message(info["message_id"]).delete()
+        except Exception as e:
+            logger.warning(f"Kunde inte ta bort squad-tavla: {e}")
+        await interaction.followup.send(f"✅ Squad-tavlan för **{event_name_local}** är borttagen.", ephemeral=True)
+
+def _event_settings_summary(event_id: str) -> str:
+    return (f"Max {event_max_squads(event_id)} squads · {event_wings(event_id)} wing(s) · "
+            f"Tier-balans {'på' if event_balance(event_id) else 'av'}")
+
+@bot.tree.command(name="wvw_event_settings", description="(Admin) Max squads och antal Commander-wings för ett WvW-event")
+@app_commands.describe(
+    event_id="ID för det specifika WvW-eventet (första 8 tecken)",
+    max_squads=f"Max antal squads (1–{MAX_SQUADS_LIMIT}, default {MAX_SQUADS})",
+    wings=f"Antal Commanders som leder egna wings (1–{MAX_WINGS}, default 1)",
+    balance="Tier-balansera squadsen (jämnstarka squads istället för bästa först)",
+)
+@app_commands.autocomplete(event_id=wvw_event_autocomplete)
+@traced_interaction
+async def wvw_event_settings_command(
+    interaction: discord.Interaction,
+    event_id: str | None = None,
+    max_squads: app_commands.Range[int, 1, MAX_SQUADS_LIMIT] | None = None,
+    wings: app_commands.Range[int, 1, MAX_WINGS] | None = None,
+    balance: bool | None = None,
+):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("🚫 Du har inte behörighet att använda detta kommando.", ephemeral=True)
+        return
+
+    target_event_id = await resolve_wvw_event_id(interaction, event_id)
+    if not target_event_id:
+        return
+
     event_name_local = wvw_event_names.get(target_event_id, f"WvW Event {target_event_id[:8]}")
-    
+    if max_squads is None and wings is None and balance is None:
+        await interaction.response.send_message(f"⚙️ **{event_name_local}**: {_event_settings_summary(target_event_id)}", ephemeral=True)
+        return
+
+    set_wvw_event_settings(target_event_id, max_squads=max_squads, wings=wings, balance=balance)
+    await interaction.response.send_message(f"✅ **{event_name_local}**: {_event_settings_summary(target_event_id)}", ephemeral=True)
+    run_after_ack("wvw_event_settings", save_wvw_rsvp_data, lambda: update_wvw_summary(interaction.client, target_event_id))
+
+def event_stats_counts(event_id: str) -> tuple[int, int, Counter, Counter]:
+    """(attending, totalt registrerade, per klass, per roll) för ett event."""
+    event_data = wvw_rsvp_data[event_id]
     attending = {uid: d for uid, d in event_data.items() if d.get("attending")}
-    total = len(event_data)
-    attending_count = len(attending)
 
     # per klass
     per_class = Counter()
     for d in attending.values():
         per_class[d.get("class") or "Okänd"] += 1
-    class_lines = [f"{k}: {v}" for k, v in per_class.most_common()] or ["-"]
 
     # per roll
     per_role = Counter()
     for d in attending.values():
         role = d.get("wvw_role") or "Okänd"
         per_role[role] += 1
+    return len(attending), len(event_data), per_class, per_role
+
+def _render_stats_embed(event_id: str) -> discord.Embed:
+    event_name_local = wvw_event_names.get(event_id, f"WvW Event {event_id[:8]}")
+    attending_count, total, per_class, per_role = event_stats_counts(event_id)
+    class_lines = [f"{k}: {v}" for k, v in per_class.most_common()] or ["-"]
     role_lines = [f"{k}: {v}" for k, v in per_role.items()] or ["-"]
 
     embed = discord.Embed(title=f"📈 Commander Livia – {event_name_local} Statistics", color=0x9b59b6)
@@ -2044,8 +5015,88 @@ async def show_stats(interaction: discord.Interaction, event_id: str | None = No
     embed.add_field(name="🗂️ Totalt registrerade", value=str(total), inline=True)
     embed.add_field(name="⚔️ Roller", value="\n".join(role_lines), inline=False)
     embed.add_field(name="🏷️ Per klass", value="\n".join(class_lines), inline=False)
+    return embed
 
-    await interaction.response.send_message(embed=embed, ephemeral=False)
+def stats_embed(event_id: str) -> discord.Embed:
+    """Renderad statistik, cachad per (event-version, meta-version)."""
+    cached = _cache_get("stats", event_id)
+    if cached is not None:
+        return discord.Embed.from_dict(cached)
+    embed = _render_stats_embed(event_id)
+    _cache_put("stats", event_id, _analysis_key(event_id), embed.to_dict())
+    return embed
+
+@bot.tree.command(name="show_stats", description="Visar statistik per klass och WvW-roll")
+@app_commands.describe(event_id="ID för det specifika WvW-eventet (första 8 tecken)")
+@app_commands.autocomplete(event_id=wvw_event_autocomplete)
+@traced_interaction
+async def show_stats(interaction: discord.Interaction, event_id: str | None = None):
+    target_event_id = await resolve_wvw_event_id(interaction, event_id)
+    if not target_event_id:
+        return
+
+    await interaction.response.send_message(embed=stats_embed(target_event_id), ephemeral=False)
+
+def _player_stats_embed(user: discord.abc.User) -> discord.Embed:
+    stats = player_stats.get(user.id)
+    embed = discord.Embed(title=f"📈 Spelarstatistik – {user.display_name}", color=0x9b59b6)
+    if not stats:
+        embed.description = "_Ingen historik ännu – statistiken uppdateras när ett event arkiveras._"
+        return embed
+
+    rate = stats["attended"] / stats["signups"] * 100 if stats["signups"] else 0
+    embed.add_field(name="🗓️ Svarat", value=str(stats["signups"]), inline=True)
+    embed.add_field(name="✅ Deltagit", value=f"{stats['attended']} ({rate:.0f}%)", inline=True)
+    embed.add_field(name="⚔️ WvW", value=f"{stats['wvw_attended']}/{stats['wvw_signups']}", inline=True)
+    embed.add_field(name="🔥 Streak", value=f"{stats['streak']} (bästa {stats['best_streak']})", inline=True)
+    embed.add_field(name="🎯 Pålitlighet", value=f"{player_reliability(user.id) * 100:.0f}%", inline=True)
+
+    build = " - ".join(x for x in (stats["last_class"], stats["last_spec"]) if x) or "-"
+    if stats["last_role"]:
+        build += f" ({stats['last_role']})"
+    embed.add_field(name="🛠️ Senaste build", value=build, inline=False)
+    if stats["last_event"]:
+        when = stats["last_event_at"][:10] if stats["last_event_at"] else ""
+        embed.add_field(name="📅 Senaste event", value=f"{stats['last_event']} {when}".strip(), inline=False)
+    return embed
+
+@bot.tree.command(name="my_stats", description="Visar din egen deltagarstatistik")
+@traced_interaction
+async def my_stats(interaction: discord.Interaction):
+    await interaction.response.send_message(embed=_player_stats_embed(interaction.user), ephemeral=True)
+
+@bot.tree.command(name="leaderboard", description="Topplistor: närvaro, populäraste specs och Commander-pass")
+@app_commands.describe(board="Vilken topplista", window="Tidsfönster")
+@app_commands.choices(
+    board=[app_commands.Choice(name=label, value=key) for key, label in LEADERBOARD_BOARDS.items()],
+    window=[
+        app_commands.Choice(name="All-time", value="all"),
+        app_commands.Choice(name="30 dagar", value="30"),
+        app_commands.Choice(name="7 dagar", value="7"),
+    ],
+)
+@traced_interaction
+async def leaderboard(interaction: discord.Interaction, board: str = "attendance", window: str = "all"):
+    days = None if window == "all" else int(window)
+    top = leaderboard_top(board, days)
+    title = f"🏆 {LEADERBOARD_BOARDS.get(board, board)} – {'all-time' if days is None else f'senaste {days} dagarna'}"
+    embed = discord.Embed(title=title, color=0xf1c40f)
+    if not top:
+        embed.description = "_Inga arkiverade events i perioden ännu._"
+    else:
+        medals = ["🥇", "🥈", "🥉"]
+        lines = []
+        for i, (key, n) in enumerate(top):
+            who = key if board == "specs" else f"<@{key}>"
+            lines.append(f"{medals[i] if i < len(medals) else f'{i + 1}.'} {who} — **{n}**")
+        embed.description = "\n".join(lines)
+    await interaction.response.send_message(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+
+@bot.tree.command(name="player_stats", description="Visar deltagarstatistik för en spelare")
+@app_commands.describe(user="Spelaren att visa statistik för")
+@traced_interaction
+async def player_stats_command(interaction: discord.Interaction, user: discord.Member):
+    await interaction.response.send_message(embed=_player_stats_embed(user), ephemeral=True)
 
 # ----------------------------
 # ADMIN: RSVP Edit (DM med dropdowns)
@@ -2205,7 +5256,9 @@ class AdminLegacyRoleView(discord.ui.View):
             min_values=1, max_values=1, custom_id="admin_legacy_role"
         )
 
+        @traced_interaction
         async def on_role(interaction: discord.Interaction):
+            annotate_trace(target_id=self.target.id)
             if interaction.user.id != self.editor.id:
                 await interaction.response.send_message("🚫 Endast editor kan använda denna meny.", ephemeral=True)
                 return
@@ -2213,15 +5266,13 @@ class AdminLegacyRoleView(discord.ui.View):
 
             # Spara legacy
             uid = self.target.id
+            member_names.note(self.target)
             rsvp_data[uid] = {
                 "attending": self.attending,
                 "class": self.klass if self.attending else None,
                 "role": role if self.attending else None,
-                "display_name": self.target.display_name,
                 "updated_at": now_utc_iso()
             }
-            save_rsvp_data()
-            await update_all_event_summaries(interaction.client)
 
             await interaction.response.edit_message(
                 content=(f"✅ **Legacy uppdaterad för {self.target.mention}**\n"
@@ -2229,6 +5280,7 @@ class AdminLegacyRoleView(discord.ui.View):
                          f"{('Klass: **'+self.klass+'** · Roll: **'+role+'**') if self.attending else 'Ingen klass/roll sparad'}"),
                 view=None
             )
+            run_after_ack("admin_legacy_role", save_rsvp_data, lambda: update_all_event_summaries(interaction.client))
 
         self.role_select.callback = on_role
         self.add_item(self.role_select)
@@ -2318,7 +5370,9 @@ class AdminWvWRoleView(discord.ui.View):
         else:
             self.add_item(AdminWvWSaveButton(self.editor, self.target, self.attending, self.klass, self.spec, None, self.event_id))
 
+    @traced_interaction
     async def on_role(self, interaction: discord.Interaction):
+        annotate_trace(target_id=self.target.id)
         if interaction.user.id != self.editor.id:
             await interaction.response.send_message("🚫 Endast editor kan använda denna meny.", ephemeral=True)
             return
@@ -2329,19 +5383,14 @@ class AdminWvWRoleView(discord.ui.View):
 
     async def _save(self, interaction: discord.Interaction, role: str | None):
         uid = self.target.id
-        event_data = wvw_rsvp_data.setdefault(self.event_id, {})
-        event_data[uid] = {
+        member_names.note(self.target)
+        set_wvw_rsvp(self.event_id, uid, {
             "attending": self.attending,
             "class": self.klass if self.attending else None,
             "elite_spec": self.spec if self.attending else None,
             "wvw_role": role if (self.attending and role) else None,
-            "display_name": self.target.display_name,
             "updated_at": now_utc_iso()
-        }
-        save_wvw_rsvp_data()
-
-        # Gör tunga uppdateringar efter defer
-        await update_wvw_summary(interaction.client, self.event_id)
+        })
 
         det = (f"Klass: **{self.klass}** · Spec: **{self.spec}** · Roll: **{role}**"
                if self.attending else "Markerad som 'kommer inte'")
@@ -2353,6 +5402,9 @@ class AdminWvWRoleView(discord.ui.View):
             view=None
         )
 
+        # Gör tunga uppdateringar efter svaret
+        run_after_ack("admin_wvw_role", save_wvw_rsvp_data, lambda: update_wvw_summary(interaction.client, self.event_id))
+
 class AdminWvWSaveButton(discord.ui.Button):
     def __init__(self, editor: discord.User, target: discord.User, attending: bool, klass: str, spec: str, role: str | None, event_id: str):
         super().__init__(label="Spara", style=discord.ButtonStyle.success)
@@ -2364,7 +5416,9 @@ class AdminWvWSaveButton(discord.ui.Button):
         self.role = role
         self.event_id = event_id
 
+    @traced_interaction
     async def callback(self, interaction: discord.Interaction):
+        annotate_trace(target_id=self.target.id)
         if interaction.user.id != self.editor.id:
             await interaction.response.send_message("🚫 Endast editor kan använda denna knapp.", ephemeral=True)
             return
@@ -2420,13 +5474,20 @@ async def rsvp_status(interaction: discord.Interaction):
 
 @bot.tree.command(name="rsvp_list", description="Visar deltagare. Stöd för både legacy (klass/roll) och WvW (klass · elite spec + roll)")
 @app_commands.describe(only_attending="Visa bara de som tackat ja", event_id="ID för specifikt WvW-event (första 8 tecken)")
+@app_commands.autocomplete(event_id=wvw_event_autocomplete)
 async def rsvp_list(interaction: discord.Interaction, only_attending: bool = False, event_id: str | None = None):
+    target_event_id = None
+    if event_id:
+        target_event_id = await resolve_wvw_event_id(interaction, event_id)
+        if not target_event_id:
+            return
+
     embed = discord.Embed(title="📋 RSVP-listor", color=0x3498db)
     
     # Legacy
     legacy_attending, legacy_not_attending = [], []
     for uid, d in rsvp_data.items():
-        display = d.get("display_name", f"<@{uid}>")
+        display = member_name(uid)
         if d["attending"]:
             klass = d.get("class", "Okänd klass")
             roll = d.get("role", "Okänd roll")
@@ -2447,20 +5508,13 @@ async def rsvp_list(interaction: discord.Interaction, only_attending: bool = Fal
         )
     
     # WvW - antingen specifikt event eller alla
-    if event_id:
-        # Hitta rätt event_id
-        target_event_id = None
-        for eid in wvw_rsvp_data.keys():
-            if eid.startswith(event_id) or eid[:8] == event_id:
-                target_event_id = eid
-                break
-                
-        if target_event_id and target_event_id in wvw_rsvp_data:
+    if target_event_id:
+        if target_event_id in wvw_rsvp_data:
             event_data = wvw_rsvp_data[target_event_id]
             event_name_local = wvw_event_names.get(target_event_id, f"WvW Event {target_event_id[:8]}")
             wvw_attending, wvw_not_attending = [], []
             for uid, d in event_data.items():
-                display = d.get("display_name", f"<@{uid}>")
+                display = member_name(uid)
                 if d["attending"]:
                     klass = d.get("class", "Okänd klass")
                     elite_spec = d.get("elite_spec", "")
@@ -2489,7 +5543,7 @@ async def rsvp_list(interaction: discord.Interaction, only_attending: bool = Fal
             event_name_local = wvw_event_names.get(eid, f"WvW Event {eid[:8]}")
             wvw_attending, wvw_not_attending = [], []
             for uid, d in event_data.items():
-                display = d.get("display_name", f"<@{uid}>")
+                display = member_name(uid)
                 if d["attending"]:
                     klass = d.get("class", "Okänd klass")
                     elite_spec = d.get("elite_spec", "")
@@ -2516,6 +5570,369 @@ async def rsvp_list(interaction: discord.Interaction, only_attending: bool = Fal
     embed.set_footer(text=f"Totalt: {total_legacy + total_wvw} svar registrerade")
     await interaction.response.send_message(embed=embed, ephemeral=False)
 
+# ----------------------------
+# BULK: Export/Import av WvW-roster via CSV
+# ----------------------------
+WVW_CSV_HEADER = ["User ID", "Display Name", "Attending", "Class", "Spec", "Role", "Updated At (UTC)"]
+WVW_CSV_YES = {"yes", "ja", "true", "1", "x"}
+WVW_CSV_NO = {"no", "nej", "false", "0", ""}
+WVW_CSV_REMOVE = {"remove", "ta bort"}
+
+def _export_wvw_csv_string(event_id: str) -> str:
+    """
+    Bygger CSV över ett WvW-events roster i samma format som /wvw_import läser.
+    Attending är Yes/No; "Remove" i Attending tar bort spelaren vid import.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(WVW_CSV_HEADER)
+    for uid, d in wvw_roster(event_id).items():
+        writer.writerow([
+            uid, member_names.get(uid) or "",
+            "Yes" if d.get("attending") else "No",
+            d.get("class") or "", d.get("elite_spec") or "", d.get("wvw_role") or "",
+            d.get("updated_at") or "",
+        ])
+    return output.getvalue()
+
+def _parse_wvw_csv(csv_text: str, allowed_roles: dict[tuple[str, str], list[str]]) -> tuple[list[tuple[int, str, dict | None]], int, list[str]]:
+    """
+    Ren parsning/validering av roster-CSV (körs i CPU-poolen).
+    Returnerar (rows, skipped_count, errors) där rows = [(uid, display_name, post|None)]
+    och post=None betyder "ta bort". allowed_roles = {(klass, spec): get_spec_meta-roller}.
+    - Attending Yes kräver Class/Spec/Role där rollen är tillåten för specen
+    - Attending No sparar spelaren som "kommer inte"
+    - Samma User ID två gånger: den senare raden skippas
+    """
+    reader = csv.DictReader(io.StringIO(csv_text))
+    rows: list[tuple[int, str, dict | None]] = []
+    skipped = 0
+    errors: list[str] = []
+    seen: set[int] = set()
+    for i, row in enumerate(reader, start=2):
+        try:
+            uid = int((row.get("User ID") or "").strip())
+        except ValueError:
+            skipped += 1
+            errors.append(f"Rad {i}: Ogiltigt User ID.")
+            continue
+        if uid in seen:
+            skipped += 1
+            errors.append(f"Rad {i}: User ID {uid} förekommer flera gånger.")
+            continue
+        seen.add(uid)
+
+        name = (row.get("Display Name") or "").strip()
+        attending_raw = (row.get("Attending") or "").strip().lower()
+        if attending_raw in WVW_CSV_REMOVE:
+            rows.append((uid, name, None))
+            continue
+        if attending_raw not in WVW_CSV_YES and attending_raw not in WVW_CSV_NO:
+            skipped += 1
+            errors.append(f"Rad {i}: Ogiltigt Attending-värde '{row.get('Attending')}'.")
+            continue
+        if attending_raw in WVW_CSV_NO:
+            rows.append((uid, name, {"attending": False, "class": None, "elite_spec": None, "wvw_role": None}))
+            continue
+
+        klass = (row.get("Class") or "").strip()
+        spec = (row.get("Spec") or "").strip()
+        role = (row.get("Role") or "").strip()
+        if (klass, spec) not in allowed_roles:
+            skipped += 1
+            errors.append(f"Rad {i}: Okänd Class/Spec ({klass} - {spec}).")
+            continue
+        if role not in allowed_roles[(klass, spec)]:
+            skipped += 1
+            errors.append(f"Rad {i}: Rollen '{role}' är inte tillåten för {klass} - {spec}.")
+            continue
+        rows.append((uid, name, {"attending": True, "class": klass, "elite_spec": spec, "wvw_role": role}))
+    return rows, skipped, errors
+
+def _apply_wvw_rows(event_id: str, rows: list[tuple[int, str, dict | None]]) -> tuple[int, int]:
+    """
+    Skriv validerade rader till eventet som en batch via mutationsfunktionerna.
+    Oförändrade spelare rörs inte; Display Name ignoreras (namn kommer från namncachen).
+    Returnerar (updated_count, unchanged_count).
+    """
+    updated = 0
+    unchanged = 0
+    now = now_utc_iso()
+    for uid, _, fields in rows:
+        current = wvw_roster(event_id).get(uid)
+        if fields is None:
+            if delete_wvw_rsvp(event_id, uid) is not None:
+                updated += 1
+            else:
+                unchanged += 1
+            continue
+        if current is not None and all(current.get(k) == v for k, v in fields.items()):
+            unchanged += 1
+            continue
+        set_wvw_rsvp(event_id, uid, {**fields, "updated_at": now})
+        updated += 1
+    return updated, unchanged
+
+async def apply_wvw_csv_offloaded(event_id: str, csv_text: str) -> tuple[int, int, list[str]] | None:
+    """
+    Parsa i CPU-poolen och applicera på loopen. Returnerar (updated_count, skipped_count, errors),
+    eller None om eventet togs bort (reset/auto-clean) medan filen parsades.
+    """
+    allowed_roles = {
+        (klass, spec): get_spec_meta(klass, spec)["roles"]
+        for klass, specs in ELITE_SPECS_BASE.items() for spec in specs
+    }
+    rows, skipped, errors = await run_cpu(_parse_wvw_csv, csv_text, allowed_roles)
+    if event_id not in wvw_rsvp_data:
+        return None  # set_wvw_rsvp skulle annars återskapa det som ett namnlöst event
+    updated, unchanged = _apply_wvw_rows(event_id, rows)
+    return updated, skipped + unchanged, errors
+
+@bot.tree.command(name="wvw_export", description="(Admin) Exportera ett WvW-events roster som CSV")
+@app_commands.describe(event_id="ID för det specifika WvW-eventet (första 8 tecken)")
+@app_commands.autocomplete(event_id=wvw_event_autocomplete)
+@traced_interaction
+async def wvw_export(interaction: discord.Interaction, event_id: str | None = None):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("🚫 Kräver administratörsbehörighet.", ephemeral=True)
+        return
+    target_event_id = await resolve_wvw_event_id(interaction, event_id)
+    if not target_event_id:
+        return
+
+    roster = wvw_roster(target_event_id)
+    attending_count = sum(1 for d in roster.values() if d.get("attending"))
+    csv_text = _export_wvw_csv_string(target_event_id)
+    event_name_local = wvw_event_names.get(target_event_id, f"WvW Event {target_event_id[:8]}")
+    await interaction.response.send_message(
+        f"📄 **{event_name_local}**: {attending_count} attending, {len(roster) - attending_count} not attending.\n"
+        "Redigera och läs in med `/wvw_import` (Attending: Yes/No/Remove).",
+        file=discord.File(io.BytesIO(csv_text.encode("utf-8")), filename=f"wvw_roster_{target_event_id[:8]}.csv"),
+        ephemeral=True,
+    )
+
+@bot.tree.command(name="wvw_import", description="(Admin) Importera en roster-CSV (från /wvw_export) till ett WvW-event")
+@app_commands.describe(file="CSV-attachment från /wvw_export", event_id="ID för det specifika WvW-eventet (första 8 tecken)")
+@app_commands.autocomplete(event_id=wvw_event_autocomplete)
+@traced_interaction
+async def wvw_import(interaction: discord.Interaction, file: discord.Attachment, event_id: str | None = None):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("🚫 Kräver administratörsbehörighet.", ephemeral=True)
+        return
+    if not file.filename.lower().endswith(".csv"):
+        await interaction.response.send_message("❌ Filen måste vara en .csv.", ephemeral=True)
+        return
+    target_event_id = await resolve_wvw_event_id(interaction, event_id)
+    if not target_event_id:
+        return
+    await interaction.response.defer(ephemeral=True)
+    try:
+        data = await file.read()
+        text = data.decode("utf-8-sig")
+    except Exception:
+        await interaction.followup.send("❌ Kunde inte läsa filen.", ephemeral=True)
+        return
+
+    result = await apply_wvw_csv_offloaded(target_event_id, text)
+    if result is None:
+        await interaction.followup.send("❌ Eventet togs bort under importen – inget sparades.", ephemeral=True)
+        return
+    updated, skipped, errors = result
+    msg = f"✅ Import klar. Uppdaterade: **{updated}** · Skippade/oförändrade: **{skipped}**"
+    if errors:
+        preview = "\n".join(f"- {e}" for e in errors[:8])
+        if len(errors) > 8:
+            preview += f"\n... och {len(errors)-8} fler."
+        msg += f"\n\n⚠️ Fel/varningar:\n{preview}"
+    await interaction.followup.send(msg, ephemeral=True)
+    if updated:
+        # En flush och en omritning för hela batchen
+        run_after_ack(
+            "wvw_import",
+            lambda: save_wvw_rsvp_data(force=True),
+            lambda: update_wvw_summary(interaction.client, target_event_id),
+        )
+
+# ----------------------------
+# Historikexport (gzip, strömmad i en tråd)
+# ----------------------------
+EXPORT_HEADER = ["Source", "Event ID", "Event", "Closed At (UTC)", "User ID", "Display Name",
+                 "Attending", "Class", "Spec", "Role", "Updated At (UTC)"]
+EXPORT_MARGIN = 512 * 1024  # zlib håller en del osparat – byt fil i god tid före gränsen
+EXPORT_SIZE_CHECK_ROWS = 500
+
+def _history_snapshots(source: str) -> list[tuple[str, str, dict]]:
+    """Referenser till arkiverade snapshots [(källa, event_id, snapshot)] – snapshots ändras aldrig efter arkivering."""
+    out = []
+    if source in ("all", "event"):
+        out += [("event", "", snap) for snap in event_history]
+    if source in ("all", "wvw"):
+        out += [("wvw", eid, snap) for eid, history in list(wvw_event_history.items()) for snap in history]
+    out.sort(key=lambda t: t[2].get("closed_at") or "")
+    return out
+
+def _iter_export_rows(snapshots, event: str | None, date_from: str | None, date_to: str | None, attending_only: bool):
+    """Filtrerade CSV-rader, en i taget."""
+    needle = (event or "").lower()
+    for source, eid, snap in snapshots:
+        day = (snap.get("closed_at") or "")[:10]
+        if date_from and day < date_from or date_to and day > date_to:
+            continue
+        if needle and needle not in (snap.get("name") or "").lower() and not eid.startswith(needle):
+            continue
+        for entry in snap.get("entries", []):
+            if attending_only and not entry.get("attending"):
+                continue
+            yield [
+                source, eid[:8], snap.get("name") or "", snap.get("closed_at") or "",
+                entry.get("user_id"), entry.get("display_name") or "",
+                "Yes" if entry.get("attending") else "No",
+                entry.get("class") or "", entry.get("elite_spec") or "",
+                entry.get("wvw_role") or entry.get("role") or "", entry.get("updated_at") or "",
+            ]
+
+def _write_export_parts(rows, prefix: str, limit: int = EXPORT_FILE_LIMIT) -> list[tuple[str, object, int]]:
+    """
+    Skriv rader som gzippad CSV till temporärfiler på disk (körs i en tråd) och byt
+    fil när den komprimerade storleken närmar sig limit. Minnet hålls platt oavsett
+    exportens storlek. Returnerar [(filnamn, öppen fil, antal rader)].
+    """
+    parts: list[tuple[str, object, int]] = []
+    raw = gz = text = writer = None
+    count = 0
+
+    def close_part():
+        text.flush()
+        text.detach()
+        gz.close()
+        raw.seek(0)
+        parts.append((f"{prefix}_part{len(parts) + 1}.csv.gz", raw, count))
+
+    try:
+        for row in rows:
+            if writer is None:
+                raw = tempfile.TemporaryFile()
+                gz = gzip.GzipFile(fileobj=raw, mode="wb", mtime=0)
+                text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+                writer = csv.writer(text)
+                writer.writerow(EXPORT_HEADER)
+                count = 0
+            writer.writerow(row)
+            count += 1
+            if count % EXPORT_SIZE_CHECK_ROWS == 0 and raw.tell() >= limit - EXPORT_MARGIN:
+                close_part()
+                writer = None
+        if writer is not None:
+            close_part()
+    except BaseException:
+        for _, f, _ in parts:
+            f.close()
+        if raw is not None:
+            raw.close()
+        raise
+    if len(parts) == 1:
+        parts[0] = (f"{prefix}.csv.gz", parts[0][1], parts[0][2])
+    return parts
+
+def _valid_day(value: str | None) -> bool:
+    if not value:
+        return True
+    try:
+        datetime.date.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+@bot.tree.command(name="history_export", description="(Admin) Exportera arkiverad eventhistorik som gzippad CSV")
+@app_commands.describe(
+    source="Vilken historik: alla, vanliga events eller WvW",
+    event="Filtrera på eventnamn (del av namnet) eller WvW-event-ID",
+    date_from="Från och med datum (YYYY-MM-DD)",
+    date_to="Till och med datum (YYYY-MM-DD)",
+    attending_only="Bara de som tackat ja",
+)
+@app_commands.choices(source=[
+    app_commands.Choice(name="alla", value="all"),
+    app_commands.Choice(name="vanliga events", value="event"),
+    app_commands.Choice(name="WvW", value="wvw"),
+])
+@traced_interaction
+async def history_export(interaction: discord.Interaction, source: str = "all", event: str | None = None,
+                         date_from: str | None = None, date_to: str | None = None, attending_only: bool = False):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("🚫 Kräver administratörsbehörighet.", ephemeral=True)
+        return
+    if not _valid_day(date_from) or not _valid_day(date_to):
+        await interaction.response.send_message("❌ Datum anges som YYYY-MM-DD.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+
+    snapshots = _history_snapshots(source)
+    rows = _iter_export_rows(snapshots, event, date_from, date_to, attending_only)
+    prefix = f"livia_history_{now_utc().strftime('%Y%m%d')}"
+    with trace_span("history_export", snapshots=len(snapshots)):
+        parts = await asyncio.to_thread(_write_export_parts, rows, prefix)
+    try:
+        if not parts:
+            await interaction.followup.send("❌ Inga rader matchade filtren.", ephemeral=True)
+            return
+        total = sum(n for _, _, n in parts)
+        await interaction.followup.send(
+            f"📄 Export klar: **{total}** rader i **{len(parts)}** fil(er) (gzippad CSV).", ephemeral=True
+        )
+        for filename, f, n in parts:
+            await interaction.followup.send(f"`{filename}` – {n} rader", file=discord.File(f, filename=filename), ephemeral=True)
+    except Exception as e:
+        logger.error(f"Fel vid historikexport: {e}")
+        await interaction.followup.send("❌ Kunde inte skicka exporten.", ephemeral=True)
+    finally:
+        for _, f, _ in parts:
+            f.close()
+
+@bot.tree.command(name="wvw_dm", description="(Admin) Skicka ett DM till alla anmälda i ett WvW-event, med deras squad")
+@app_commands.describe(
+    message="Meddelandet som skickas",
+    event_id="ID för det specifika WvW-eventet (första 8 tecken)",
+    include_squad="Ta med spelarens planerade squad (default: ja)",
+)
+@app_commands.autocomplete(event_id=wvw_event_autocomplete)
+@traced_interaction
+async def wvw_dm(interaction: discord.Interaction, message: str, event_id: str | None = None, include_squad: bool = True):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("🚫 Kräver administratörsbehörighet.", ephemeral=True)
+        return
+    target_event_id = await resolve_wvw_event_id(interaction, event_id)
+    if not target_event_id:
+        return
+    if target_event_id in _dm_fanouts:
+        await interaction.response.send_message(
+            f"⏳ Ett utskick pågår redan för eventet: {_dm_fanouts[target_event_id].summary()}", ephemeral=True
+        )
+        return
+    await interaction.response.defer(ephemeral=True)
+
+    messages = await wvw_dm_messages(target_event_id, message, include_squad)
+    if not messages:
+        await interaction.followup.send("❌ Inga anmälda att skicka till.", ephemeral=True)
+        return
+
+    async def progress(fanout: DMFanout, final: bool):
+        await interaction.edit_original_response(content=("✅ Utskick klart: " if final else "📨 Skickar… ") + fanout.summary())
+
+    fanout = DMFanout(interaction.client, messages, on_progress=progress)
+    _dm_fanouts[target_event_id] = fanout
+    await interaction.followup.send(f"📨 Skickar DM till {len(messages)} anmälda…", ephemeral=True)
+
+    async def send_all():
+        try:
+            await fanout.run()
+            logger.info(f"DM-utskick för {target_event_id}: {fanout.summary()} ({fanout.retries} omförsök)")
+        finally:
+            _dm_fanouts.pop(target_event_id, None)
+
+    # Utskicket kan ta minuter – kör det vid sidan av och rapportera i det ephemerala svaret
+    run_after_ack(f"wvw_dm:{target_event_id}", send_all)
+
 # ----------------------------
 # Meta & Export kommandon
 # ----------------------------
@@ -2546,6 +5963,7 @@ async def meta_reset(interaction: discord.Interaction):
 
     global meta_overrides
     meta_overrides = {}
+    mark_meta_changed()
     try:
         if os.path.exists(META_FILE):
             os.remove(META_FILE)
@@ -2554,11 +5972,330 @@ async def meta_reset(interaction: discord.Interaction):
         logger.error(f"Fel vid meta reset: {e}")
         await interaction.response.send_message("❌ Kunde inte nollställa meta overrides.", ephemeral=True)
 
+# ----------------------------
+# Prestanda (admin)
+# ----------------------------
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+@bot.tree.command(name="perf_stats", description="(Admin) Visar event-loop-lag, kvittenstider och värsta blockerare")
+async def perf_stats(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("🚫 Du har inte behörighet att använda detta kommando.", ephemeral=True)
+        return
+
+    embed = discord.Embed(title="⏱️ Commander Livia – Prestanda", color=0x95a5a6)
+    embed.add_field(
+        name="🔁 Event-loop",
+        value=(f"Nu: {loop_monitor.last_lag*1000:.0f} ms · "
+               f"Snitt: {loop_monitor.avg_lag*1000:.0f} ms · "
+               f"Max: {loop_monitor.max_lag*1000:.0f} ms"),
+        inline=False,
+    )
+
+    acks = list(ack_latencies)
+    embed.add_field(
+        name="📨 Tid till kvittens",
+        value=(f"p50: {_percentile(acks, 50)*1000:.0f} ms · "
+               f"p95: {_percentile(acks, 95)*1000:.0f} ms · "
+               f"Max: {max(acks, default=0.0)*1000:.0f} ms ({len(acks)} st)"),
+        inline=False,
+    )
+
+    cache_lines = []
+    for kind in ("squads", "squad_embed", "stats"):
+        hits, misses = cache_stats[f"{kind}_hit"], cache_stats[f"{kind}_miss"]
+        if hits or misses:
+            cache_lines.append(f"`{kind}`: {hits} träffar / {misses} missar ({hits / (hits + misses):.0%})")
+    embed.add_field(
+        name="🗃️ Analys-cache",
+        value="\n".join(cache_lines) if cache_lines else "_Inga uppslag ännu_",
+        inline=False,
+    )
+
+    offenders = loop_monitor.top_offenders()
+    lines = [
+        f"• `{label}` — {count}×, totalt {total*1000:.0f} ms, max {mx*1000:.0f} ms"
+        for label, count, total, mx in offenders
+    ]
+    embed.add_field(
+        name=f"🐢 Värsta blockerare (>{loop_monitor.threshold*1000:.0f} ms)",
+        value="\n".join(lines)[:1024] if lines else "_Inga blockeringar registrerade_",
+        inline=False,
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# ----------------------------
+# HTTP-API (valfritt)
+# ----------------------------
+# Läs-API för dashboarden. Varje svar serialiseras en gång per (event-version,
+# meta-version) och cachas som (body, etag) i analys-cachen, så en pollning med
+# If-None-Match kostar bara en jämförelse.
+_api_runner: web.AppRunner | None = None
+_api_events_cache: tuple[int, tuple[bytes, str]] | None = None  # (wvw_data_version, (body, etag))
+
+def _api_player(uid: int, d: dict) -> dict:
+    return {
+        "user_id": str(uid),  # som sträng – Discord-ID:n är för stora för JS-nummer
+        "display_name": member_names.get(uid),
+        "attending": bool(d.get("attending")),
+        "class": d.get("class"),
+        "elite_spec": d.get("elite_spec"),
+        "wvw_role": d.get("wvw_role"),
+        "updated_at": d.get("updated_at"),
+    }
+
+def _api_event_summary(event_id: str) -> dict:
+    return {
+        "id": event_id,
+        "short_id": event_id[:8],
+        "name": wvw_event_names.get(event_id, f"WvW Event {event_id[:8]}"),
+        "attending": wvw_attending_counts.get(event_id, 0),
+        "total": len(wvw_rsvp_data.get(event_id, {})),
+        "version": wvw_event_version(event_id),
+    }
+
+def _api_encode(payload) -> tuple[bytes, str]:
+    body = json.dumps(payload, ensure_ascii=False, default=list).encode("utf-8")
+    return body, f'"{hashlib.sha1(body).hexdigest()}"'
+
+def _api_respond(request: web.Request, cached: tuple[bytes, str]) -> web.Response:
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match.strip() == "*" or etag in (t.strip().removeprefix("W/") for t in if_none_match.split(",")):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type="application/json", headers=headers)
+
+def _api_event_id(request: web.Request) -> str:
+    event_id = find_wvw_event_id(request.match_info["event_id"])
+    if not event_id:
+        raise web.HTTPNotFound(text=json.dumps({"error": "okänt event"}), content_type="application/json")
+    return event_id
+
+async def _api_cached(request: web.Request, kind: str, build) -> web.Response:
+    """Svar för ett event ur cachen, eller byggt (en gång per version) med build(event_id)."""
+    event_id = _api_event_id(request)
+    cached = _cache_get(kind, event_id, _render_key(event_id))
+    if cached is None:
+        key = _render_key(event_id)
+        payload = build(event_id)
+        if inspect.isawaitable(payload):
+            payload = await payload
+        cached = _api_encode(payload)
+        _cache_put(kind, event_id, key, cached)
+    return _api_respond(request, cached)
+
+def _api_roster(event_id: str) -> dict:
+    event_data = wvw_rsvp_data.get(event_id, {})
+    return {**_api_event_summary(event_id), "roster": [_api_player(uid, d) for uid, d in event_data.items()]}
+
+def _api_stats(event_id: str) -> dict:
+    attending, total, per_class, per_role = event_stats_counts(event_id)
+    return {
+        **_api_event_summary(event_id),
+        "attending": attending,
+        "total": total,
+        "per_class": dict(per_class.most_common()),
+        "per_role": dict(per_role),
+    }
+
+async def _api_squads(event_id: str) -> dict:
+    commander, squads, overflow, reason = await peek_squads(event_id)
+    return {
+        **_api_event_summary(event_id),
+        "commander": _api_player(*commander) if commander else None,
+        "squads": [
+            [{**_api_player(uid, d), "slot": label} for label, uid, d in squad]
+            for squad in squads
+        ],
+        "overflow": [_api_player(uid, d) for uid, d in overflow],
+        "reason": reason,
+    }
+
+async def api_events(request: web.Request) -> web.Response:
+    global _api_events_cache
+    if _api_events_cache is None or _api_events_cache[0] != wvw_data_version:
+        payload = {"events": [_api_event_summary(eid) for _, eid in wvw_event_index]}
+        _api_events_cache = (wvw_data_version, _api_encode(payload))
+    return _api_respond(request, _api_events_cache[1])
+
+async def api_event(request: web.Request) -> web.Response:
+    return await _api_cached(request, "api_roster", _api_roster)
+
+async def api_event_stats(request: web.Request) -> web.Response:
+    return await _api_cached(request, "api_stats", _api_stats)
+
+async def api_event_squads(request: web.Request) -> web.Response:
+    return await _api_cached(request, "api_squads", _api_squads)
+
+class WvWChangeStream:
+    """
+    Ändringsnotiser per event till SSE-klienter. publish() anropas synkront från
+    mutationerna på event-loopen och slår bara ihop ändringen i varje prenumerants
+    väntande ändringar (senaste per spelare, allt före en reset stryks), så kön
+    aldrig blir större än rostern. Varje klient har en egen skrivare som väntar
+    SSE_COALESCE_SECONDS och skickar det som samlats som en batch.
+    """
+    def __init__(self):
+        self._subscribers: dict[str, set["_ChangeSubscriber"]] = {}
+        self.dropped = 0
+
+    def publish(self, event_id: str, kind: str, uid: int | None = None, record: dict | None = None):
+        subscribers = self._subscribers.get(event_id)
+        if not subscribers:
+            return
+        change = {"type": kind, "version": wvw_event_version(event_id)}
+        if uid is not None:
+            change["user_id"] = str(uid)
+        if record is not None:
+            change["player"] = _api_player(uid, record)
+        for sub in list(subscribers):
+            if len(sub.pending) >= SSE_MAX_PENDING:
+                self._drop(event_id, sub, "för många väntande ändringar")
+                continue
+            merge_change(sub.pending, change)
+            sub.wakeup.set()
+
+    def subscribe(self, event_id: str) -> "_ChangeSubscriber":
+        sub = _ChangeSubscriber()
+        self._subscribers.setdefault(event_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, event_id: str, sub: "_ChangeSubscriber"):
+        subscribers = self._subscribers.get(event_id)
+        if subscribers is not None:
+            subscribers.discard(sub)
+            if not subscribers:
+                del self._subscribers[event_id]
+
+    def close_event(self, event_id: str):
+        """Eventet är borta: avsluta strömmarna när de skickat sin sista batch."""
+        for sub in self._subscribers.get(event_id, ()):
+            sub.closed = True
+            sub.wakeup.set()
+
+    def _drop(self, event_id: str, sub: "_ChangeSubscriber", why: str):
+        logger.info(f"SSE-klient för event {event_id[:8]} bortkopplad: {why}")
+        self.dropped += 1
+        sub.closed = True
+        sub.pending.clear()
+        sub.wakeup.set()
+        self.unsubscribe(event_id, sub)
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+class _ChangeSubscriber:
+    __slots__ = ("pending", "wakeup", "closed")
+
+    def __init__(self):
+        self.pending: dict[str | None, dict] = {}  # user_id (None = hela eventet) -> ändring
+        self.wakeup = asyncio.Event()
+        self.closed = False
+
+change_stream = WvWChangeStream()
+
+def merge_change(pending: dict, change: dict):
+    """Lägg en ändring i en väntande batch: senaste per spelare sist, reset/clean av hela eventet stryker allt före."""
+    key = change.get("user_id")
+    if key is None:
+        pending.clear()
+    previous = pending.pop(key, None)  # flytta sist så ordningen följer senaste ändringen
+    if previous and previous["type"] == "signup" and change["type"] == "role_change":
+        change = {**change, "type": "signup"}  # klienten har inte sett anmälan än
+    pending[key] = change
+
+def _sse(event: str, data: str | bytes, event_version: int | None = None) -> bytes:
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    head = f"event: {event}\n" + (f"id: {event_version}\n" if event_version is not None else "")
+    return (head + "".join(f"data: {line}\n" for line in data.split("\n")) + "\n").encode("utf-8")
+
+async def api_event_stream(request: web.Request) -> web.StreamResponse:
+    """
+    SSE: först en snapshot (samma som /api/events/{id}), sedan batchar av ändringar
+    (signup, cancel, role_change, reset, clean, removed) med eventets version som id.
+    """
+    event_id = _api_event_id(request)
+    sub = change_stream.subscribe(event_id)
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    try:
+        await response.prepare(request)
+        cached = _cache_get("api_roster", event_id, _render_key(event_id))
+        if cached is None:
+            cached = _api_encode(_api_roster(event_id))
+            _cache_put("api_roster", event_id, _render_key(event_id), cached)
+        await asyncio.wait_for(response.write(_sse("snapshot", cached[0], wvw_event_version(event_id))), SSE_WRITE_TIMEOUT)
+
+        while not (sub.closed and not sub.pending):
+            try:
+                await asyncio.wait_for(sub.wakeup.wait(), SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                await asyncio.wait_for(response.write(b": ping\n\n"), SSE_WRITE_TIMEOUT)
+                continue
+            if not sub.closed:
+                await asyncio.sleep(SSE_COALESCE_SECONDS)
+            batch, sub.pending = list(sub.pending.values()), {}
+            sub.wakeup.clear()
+            if batch:
+                payload = json.dumps(batch, ensure_ascii=False)
+                await asyncio.wait_for(response.write(_sse("changes", payload, batch[-1]["version"])), SSE_WRITE_TIMEOUT)
+    except asyncio.TimeoutError:
+        change_stream._drop(event_id, sub, "för långsam mottagare")
+    except ConnectionResetError:
+        pass
+    finally:
+        change_stream.unsubscribe(event_id, sub)
+    return response
+
+def make_api_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/api/events", api_events)
+    app.router.add_get("/api/events/{event_id}", api_event)
+    app.router.add_get("/api/events/{event_id}/stats", api_event_stats)
+    app.router.add_get("/api/events/{event_id}/squads", api_event_squads)
+    app.router.add_get("/api/events/{event_id}/stream", api_event_stream)
+    return app
+
+async def start_api_server(port: int):
+    global _api_runner
+    _api_runner = web.AppRunner(make_api_app(), access_log=None)
+    await _api_runner.setup()
+    await web.TCPSite(_api_runner, API_HOST, port).start()
+    logger.info(f"🌐 HTTP-API lyssnar på http://{API_HOST}:{port}/api/events")
+
+async def stop_api_server():
+    global _api_runner
+    if _api_runner is not None:
+        await _api_runner.cleanup()
+        _api_runner = None
+
+async def run_api_only():
+    """Bara API:t mot de lokala datafilerna – ingen Discord-anslutning."""
+    load_all_data()
+    loop_monitor.start()
+    start_cpu_pool()
+    await start_api_server(API_PORT or 8080)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stop_api_server()
+        loop_monitor.stop()
+        stop_cpu_pool()
+
 # ----------------------------
 # Kör bot
 # ----------------------------
 if __name__ == "__main__":
     try:
-        bot.run(TOKEN)
+        if API_ONLY:
+            asyncio.run(run_api_only())
+        else:
+            bot.run(TOKEN)
     except Exception as e:
         logger.error(f"Kunde inte starta bot: {e}")